@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# Per-string cost of tags.convert_format_string, compared against the three-pass re.sub
+# implementation, over the tag corpus with the style codes and placeholders of raw tag files.
+#
+# usage: python benchmarks/bench_convert_format_string.py [repeat]
+import os
+import sys
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.chdir(ROOT)
+
+import re
+from grim_dawn_data import TAGS_FILE
+from grim_dawn_data.json_utils import load_json
+from tags import convert_format_string
+
+def legacy_convert_format_string(s: str) -> str:
+    s = re.sub(r'\{\^[EH]\}', '', s)
+    s = re.sub(r'\{[^{}]+\}', '{}', s)
+    s = re.sub(r'\{(?=[^}])', '', s)
+    return s
+
+def raw_corpus():
+    # tags.json holds converted strings, so put back the kind of markup the raw files have
+    corpus = []
+    for i, s in enumerate(load_json(TAGS_FILE).values()):
+        s = s.replace('{}', '{%+.0f0}')
+        if i % 7 == 0:
+            s = '{^E}' + s
+        corpus.append(s)
+    return corpus
+
+if __name__ == '__main__':
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    corpus = raw_corpus()
+    assert [convert_format_string(s) for s in corpus] == [legacy_convert_format_string(s) for s in corpus]
+
+    for name, f in [("three-pass", legacy_convert_format_string), ("single-pass", convert_format_string)]:
+        t = min(timeit.repeat(lambda: [f(s) for s in corpus], number=1, repeat=repeat))
+        print(f"{name:<12} {t / len(corpus) * 1e6:.3f} us/string  ({len(corpus)} strings)")
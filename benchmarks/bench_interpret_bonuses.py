@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# Per-skill cost of bonuses.interpret_bonuses, compared against the implementation
+# that rebuilt and regex-split candidate keys for every skill.
+#
+# usage: python benchmarks/bench_interpret_bonuses.py [repeat]
+import os
+import sys
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.chdir(ROOT)
+
+import re
+from typing import *
+from grim_dawn_data import cache, DAMAGE_TYPES, STAT_IDS, CONSTELLATION_FILE, load_tags
+from grim_dawn_data.bonuses import *
+from grim_dawn_data.json_utils import load_json, dumps_json
+import bonuses as current
+
+def split_bonus_name(name: str):
+    m = re.fullmatch('([a-z]+)([A-Z][a-z]+)+', name)
+    assert m is not None
+    first = m.group(1)
+    split = (first, ) + tuple(re.findall("[A-Z][a-z]+", name))
+
+    return split
+
+@cache
+def manual_bonuses() -> Dict:
+    with open("manual_bonuses.txt", 'r') as fp:
+        manual = {
+            split_bonus_name(l[0]): l[1]
+            for l in (l.strip().split('=') for l in fp)
+        }
+    return manual
+
+
+def get_tag_name(bonus: Tuple[str]) -> str:
+    manual = manual_bonuses()
+    tags = load_tags()
+
+    if bonus in manual:
+        tag = manual[bonus]
+        assert tag in tags
+        return tag
+
+    if bonus[0] == 'character':
+        if bonus[1] in STAT_IDS and (len(bonus) < 3 or bonus[2] != "Regen"):
+            tag = f"tagCharAttribute0{STAT_IDS[bonus[1]]}" + "".join(bonus[2:])
+        else:
+            tag = 'tagChar' + "".join(bonus[1:])
+
+    elif bonus[0] == "defensive":
+        if bonus[1] == "Slow" and bonus[3] == "Leach":
+            tag = "Defense" + "".join(bonus[2:])
+        else:
+
+            tag = "Defense" + "".join(bonus[1:])
+
+    else:
+        tag = "".join((bonus[0].capitalize(),) + bonus[1:] )
+
+    if tag in tags:
+        return tag
+
+    tag = tag + "s"
+    if tag in tags:
+        return tag
+
+    return None
+
+
+def get_flat_damage(bonuses: dict) -> List[Bonus]:
+    blist = []
+    for ty in DAMAGE_TYPES:
+        k_amount = split_bonus_name("offensive" + ty + "Modifier")
+        k_chance = split_bonus_name("offensive" + ty + "ModifierChance")
+
+        if k_amount in bonuses:
+            amount = bonuses.pop(k_amount)
+            b = DamageModifier(amount, ty)
+            if k_chance in bonuses:
+                p = bonuses.pop(k_chance)
+                b = ChanceOf(p, b)
+            blist.append(b)
+
+        k_max = split_bonus_name("offensive" + ty + "Max")
+        k_min = split_bonus_name("offensive" + ty + "Min")
+
+        if k_max in bonuses:
+            v_max = bonuses.pop(k_max)
+            v_min = bonuses.pop(k_min)
+        elif k_min in bonuses:
+            v_max = None
+            v_min = bonuses.pop(k_min)
+        else:
+            v_min = None
+            v_max = None
+
+        if v_min is not None:
+            blist.append(Damage(v_min, ty, max_val=v_max))
+
+    return blist
+
+def get_retaliation_damage(bonuses: dict) -> List[Bonus]:
+    blist = []
+    for ty in DAMAGE_TYPES:
+        k_max = split_bonus_name("retaliation" + ty + "Max")
+        k_min = split_bonus_name("retaliation" + ty + "Min")
+
+        if k_max in bonuses:
+            v_max = bonuses.pop(k_max)
+            v_min = bonuses.pop(k_min)
+        elif k_min in bonuses:
+            v_max = None
+            v_min = bonuses.pop(k_min)
+        else:
+            v_min = None
+            v_max = None
+
+        if v_min is not None:
+            blist.append(Retaliation(v_min, ty, max_val=v_max))
+
+    return blist
+
+def get_resistance_reduction(bonuses: dict) -> List[Bonus]:
+    blist = []
+    for ty in DAMAGE_TYPES:
+        k_duration = split_bonus_name("offensive" + ty + "ResistanceReductionPercentDurationMin")
+        k_amt = split_bonus_name("offensive" + ty + "ResistanceReductionPercentMin")
+
+        if k_amt in bonuses or k_duration in bonuses:
+            a = bonuses.pop(k_amt)
+            d = bonuses.pop(k_duration)
+
+            blist.append(ResistanceReduction(a, d, ty))
+
+    return blist
+
+
+def get_damage_over_time(bonuses: dict) -> List[Bonus]:
+    blist = []
+    for ty in DAMAGE_TYPES:
+        k_amount = split_bonus_name("offensiveSlow" + ty + "Min")
+        k_duration = split_bonus_name("offensiveSlow" + ty + "DurationMin")
+        k_chance = split_bonus_name("offensiveSlow" + ty + "Chance")
+
+        if k_amount in bonuses:
+            amount = bonuses.pop(k_amount)
+            duration = bonuses.pop(k_duration)
+            b = DamageOverTime(amount, duration, ty)
+            if k_chance in bonuses:
+                p = bonuses.pop(k_chance)
+                b = ChanceOf(p, b)
+            blist.append(b)
+
+        k_amt_mod = split_bonus_name("offensiveSlow" +  ty + "Modifier")
+        k_dur_mod = split_bonus_name("offensiveSlow" +  ty + "DurationModifier")
+
+        if k_amt_mod in bonuses or k_dur_mod in bonuses:
+            try:
+                amt = bonuses.pop(k_amt_mod)
+            except KeyError:
+                amt = 0.
+
+            try:
+                dur = bonuses.pop(k_dur_mod)
+            except KeyError:
+                dur = 0.
+
+            blist.append(DamageOverTimeModifier(amt, dur, ty))
+
+
+    return blist
+
+def interpret_bonuses(bonuses) -> Tuple[List[Bonus], Dict]:
+    bonuses = {split_bonus_name(b): v for b, v in bonuses.items()}
+
+    blist = []
+
+    blist.extend(get_damage_over_time(bonuses))
+    blist.extend(get_flat_damage(bonuses))
+    blist.extend(get_retaliation_damage(bonuses))
+    blist.extend(get_resistance_reduction(bonuses))
+
+    for b in list(bonuses):
+        tag = get_tag_name(b)
+        if tag is not None:
+            val = bonuses.pop(b)
+            blist.append(MiscBonus(val, "".join(b), tag))
+
+    return blist, bonuses
+
+
+
+
+def skill_bonus_dicts() -> List[dict]:
+    skills = []
+    for c in load_json(CONSTELLATION_FILE):
+        for s in c['skills'].values():
+            skills.extend(s[k] for k in ('bonuses', 'pet_bonuses') if k in s)
+    return skills
+
+def check_equivalent(skills: List[dict]):
+    for s in skills:
+        old_blist, old_rem = interpret_bonuses(dict(s))
+        new_blist, new_rem = current.interpret_bonuses(dict(s))
+        assert dumps_json(old_blist) == dumps_json(new_blist), s
+        assert old_rem == new_rem, s
+
+def main(repeat: int = 20):
+    skills = skill_bonus_dicts()
+    check_equivalent(skills)
+
+    for label, f in [("before", interpret_bonuses), ("after", current.interpret_bonuses)]:
+        t = min(timeit.repeat(lambda: [f(dict(s)) for s in skills], number=1, repeat=repeat))
+        print(f"{label:<8} {t / len(skills) * 1e6:8.2f} us/skill  ({len(skills)} skills)")
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# Times every pipeline stage and loader on synthetic inputs and writes the results as JSON, so
+# runs on different commits can be compared. Inputs are generated from a fixed seed; --scale 1
+# is roughly the size of the real game data.
+#
+# usage: python benchmarks/run.py [--scale S] [--repeat R] [--only NAME,...] [--output PATH]
+#                                 [--compare OLD.json]
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.chdir(ROOT)
+
+from grim_dawn_data import CONSTELLATION_FILE, DAMAGE_TYPES, DATA_DIRECTORY
+from grim_dawn_data.bonuses import ChanceOf, Damage, DamageModifier, MiscBonus, Pets, Retaliation, aggregate_bonuses
+from grim_dawn_data.json_utils import JSON_BACKENDS, dump_json, get_json_backend, load_json, orjson, set_json_backend
+from grim_dawn_data.records import DirectoryRecordSource, RecordCache
+import bonuses
+import constellations
+from tags import convert_format_string
+
+SEED = 1
+# items per benchmark at --scale 1
+SIZES = {
+    "tags": 20000,
+    "constellations": 110,
+    "skills": 600,
+    "bonuses": 1200,
+}
+# tag used as the display name of every synthetic star
+DISPLAY_TAG = "tagBonusLifeAbs"
+WORDS = ["Damage", "to", "Chaos", "Resistance", "of", "the", "Celestial", "Power", "Health", "Regeneration"]
+
+
+def bonus_templates() -> List[Dict[str, float]]:
+    # the attribute sets of the real stars, so that related attributes (a flat damage minimum
+    # and maximum, say) stay together; only the values are synthetic
+    return [s['bonuses'] for c in load_json(CONSTELLATION_FILE) for s in c['skills'].values() if s.get('bonuses')]
+
+
+def synthetic_tag_strings(rng: random.Random, n: int) -> List[str]:
+    strings = []
+    for _ in range(n):
+        words = rng.choices(WORDS, k=rng.randint(2, 12))
+        for _ in range(rng.randint(0, 3)):
+            words.insert(rng.randrange(len(words) + 1), rng.choice(["{%+.0f0}", "{%t0}", "{^E}", "{", "{%s1}"]))
+        strings.append(" ".join(words))
+    return strings
+
+
+def synthetic_bonus_dicts(rng: random.Random, templates: List[Dict[str, float]], n: int) -> List[Dict[str, float]]:
+    out = []
+    for _ in range(n):
+        f = rng.uniform(0.5, 2)
+        out.append({k: round(v * f, 3) for k, v in rng.choice(templates).items()})
+    return out
+
+
+def write_synthetic_records(rng: random.Random, root: Path, templates: List[Dict[str, float]], n: int) -> List[str]:
+    # n constellations of 3-8 passive stars linked as a chain with a side branch; every record
+    # is padded with attributes the parsers skip, like the real database records
+    padding = "".join(f"unrelatedAttribute{i},{i}.000000,\n" for i in range(60))
+    constellation_dir = root / "ui/skills/devotion/constellations"
+    skill_dir = root / "skills/devotion"
+    constellation_dir.mkdir(parents=True)
+    skill_dir.mkdir(parents=True)
+    files = []
+    for i in range(n):
+        stars = rng.randint(3, 8)
+        lines = [f"affinityGivenName1,{rng.choice(['Order', 'Chaos', 'Eldritch'])},", "affinityGiven1,3.000000,",
+                 f"affinityRequiredName1,{rng.choice(['Ascendant', 'Primordial'])},", "affinityRequired1,1.000000,"]
+        for s in range(stars):
+            skill = f"synthetic{i:04d}_{s}"
+            lines.append(f"devotionButton{s + 1},records/skills/devotion/{skill}.dbr,")
+            if s:
+                lines.append(f"devotionLinks{s + 1},{s if s % 3 else s - 1},")
+            attributes = synthetic_bonus_dicts(rng, templates, 1)[0]
+            (skill_dir / f"{skill}.dbr").write_text(
+                f"Class,Skill_Passive,\nskillDisplayName,{DISPLAY_TAG},\n"
+                + "".join(f"{k},{v:.6f},\n" for k, v in attributes.items()) + padding)
+        rel = f"ui/skills/devotion/constellations/synthetic{i:04d}.dbr"
+        (root / rel).write_text("\n".join(lines) + "\n" + padding)
+        files.append(rel)
+    return files
+
+
+def synthetic_bonuses(rng: random.Random, names: List[str], n: int) -> List[Any]:
+    makers = [
+        lambda: MiscBonus(float(rng.randint(1, 100)), rng.choice(names), DISPLAY_TAG),
+        lambda: DamageModifier(float(rng.randint(1, 100)), rng.choice(DAMAGE_TYPES)),
+        lambda: Damage(float(rng.randint(1, 50)), rng.choice(DAMAGE_TYPES)),
+        lambda: Damage(float(rng.randint(1, 50)), rng.choice(DAMAGE_TYPES), float(rng.randint(50, 100))),
+        lambda: Retaliation(float(rng.randint(1, 50)), rng.choice(DAMAGE_TYPES)),
+    ]
+    out = []
+    for _ in range(n):
+        b = rng.choice(makers)()
+        r = rng.random()
+        if r < 0.1:
+            b = Pets(b)
+        elif r < 0.15:
+            b = ChanceOf(float(rng.randint(5, 30)), b)
+        out.append(b)
+    return out
+
+
+def synthetic_document(rng: random.Random, names: List[str], n: int) -> List[Dict[str, Any]]:
+    doc = []
+    for i in range(n):
+        stars = rng.randint(3, 8)
+        doc.append({
+            "pred": {str(s): s - 1 for s in range(1, stars)},
+            "skills": {str(s): {"bonuses": synthetic_bonuses(rng, names, rng.randint(1, 5))} for s in range(stars)},
+            "affinity_bonus": {"order": 3},
+            "affinity_required": {"chaos": 1},
+            "name": f"Synthetic {i}",
+        })
+    return doc
+
+
+class Benchmark:
+    def __init__(self, name: str, items: int, run: Callable[[], Any], setup: Callable[[], Any] = None):
+        self.name = name
+        self.items = items
+        self.run = run
+        self.setup = setup
+
+
+def build_benchmarks(scale: float, workdir: Path) -> List[Benchmark]:
+    rng = random.Random(SEED)
+    size = {k: max(1, round(v * scale)) for k, v in SIZES.items()}
+    templates = bonus_templates()
+    names = sorted({k for t in templates for k in t})
+
+    tag_strings = synthetic_tag_strings(rng, size["tags"])
+    records = workdir / "records"
+    record_files = write_synthetic_records(rng, records, templates, size["constellations"])
+    source = DirectoryRecordSource(records)
+    skill_files = source.list_dir("skills/devotion")
+    bonus_dicts = synthetic_bonus_dicts(rng, templates, size["skills"])
+    bonus_list = synthetic_bonuses(rng, names, size["bonuses"])
+    document = synthetic_document(rng, names, size["constellations"])
+    json_path = workdir / "document.json"
+
+    def fresh_skill_cache():
+        constellations.skill_cache = RecordCache()
+
+    benchmarks = [
+        Benchmark("convert_format_string", len(tag_strings), lambda: [convert_format_string(s) for s in tag_strings]),
+        Benchmark("load_dbr_file", len(skill_files),
+                  lambda: [constellations.load_dbr_file(source, rel, constellations.PASSIVE_BONUS_PREFIXES, constellations.SKILL_KEYS)
+                           for rel in skill_files]),
+        Benchmark("process_constellation", len(record_files),
+                  lambda: [constellations.process_constellation(source, rel) for rel in record_files], fresh_skill_cache),
+        Benchmark("interpret_bonuses", len(bonus_dicts), lambda: [bonuses.interpret_bonuses(d) for d in bonus_dicts]),
+        Benchmark("aggregate_bonuses", len(bonus_list), lambda: aggregate_bonuses(bonus_list)),
+    ]
+    backends = [b for b in JSON_BACKENDS if b != "orjson" or orjson is not None]
+    for backend in backends:
+        def use(backend=backend):
+            set_json_backend(backend)
+        benchmarks.append(Benchmark(f"dump_json[{backend}]", len(document), lambda: dump_json(document, json_path), use))
+        benchmarks.append(Benchmark(f"load_json[{backend}]", len(document), lambda: load_json(json_path), use))
+    return benchmarks
+
+
+def cold_import(repeat: int) -> Dict[str, Any]:
+    # a fresh interpreter importing the package, less one that imports nothing
+    def run(code):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", code], check=True, cwd=ROOT)
+            times.append(time.perf_counter() - start)
+        return times
+    base = min(run("pass"))
+    times = [t - base for t in run("import grim_dawn_data, grim_dawn_data.bonuses")]
+    return _summary(times, 1)
+
+
+def _summary(times: List[float], items: int) -> Dict[str, Any]:
+    return {
+        "items": items,
+        "min": min(times),
+        "median": statistics.median(times),
+        "per_item_us": min(times) / items * 1e6,
+    }
+
+
+def run_benchmarks(scale: float = 1., repeat: int = 5, only: List[str] = None) -> Dict[str, Any]:
+    results = {}
+    backend = get_json_backend()
+    with tempfile.TemporaryDirectory() as tmp:
+        for b in build_benchmarks(scale, Path(tmp)):
+            if only and not any(b.name.startswith(o) for o in only):
+                continue
+            times = []
+            # the pipeline stages log every record they read
+            with contextlib.redirect_stdout(io.StringIO()):
+                for _ in range(repeat):
+                    if b.setup is not None:
+                        b.setup()
+                    times.append(timeit.timeit(b.run, number=1))
+            results[b.name] = _summary(times, b.items)
+    set_json_backend(backend)
+    if not only or any("cold_import".startswith(o) for o in only):
+        results["cold_import"] = cold_import(repeat)
+    return results
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=ROOT).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: Dict[str, Any], old: Dict[str, Any]):
+    # per item, so runs at different scales are still roughly comparable
+    for name, r in results.items():
+        o = old.get(name)
+        if o is not None:
+            print(f"{name:<26} {o['per_item_us']:10.2f} -> {r['per_item_us']:10.2f} us/item  "
+                  f"x{o['per_item_us'] / r['per_item_us']:.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=float, default=1., help="input size relative to the real data")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", help="comma-separated benchmark name prefixes")
+    parser.add_argument("--output", type=Path, help="defaults to data/benchmarks/<commit>.json")
+    parser.add_argument("--compare", type=Path, help="results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    commit = _commit()
+    results = run_benchmarks(args.scale, args.repeat, args.only.split(",") if args.only else None)
+    for name, r in results.items():
+        print(f"{name:<26} {r['min'] * 1e3:10.3f} ms  {r['per_item_us']:10.2f} us/item  ({r['items']} items)")
+
+    output = args.output or DATA_DIRECTORY / "benchmarks" / f"{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w') as fp:
+        json.dump({
+            "commit": commit,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "json_backend": get_json_backend(),
+            "scale": args.scale,
+            "repeat": args.repeat,
+            "results": results,
+        }, fp, indent='  ')
+    print("wrote", output)
+
+    if args.compare:
+        with open(args.compare) as fp:
+            old = json.load(fp)
+        print(f"compared with {old['commit']} (scale {old['scale']}, {old['json_backend']})")
+        compare(results, old["results"])
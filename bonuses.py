@@ -1,10 +1,16 @@
 #!/usr/bin/env python3
-from grim_dawn_data import cache, DAMAGE_TYPES, BONUSES_FILE, CONSTELLATION_FILE, STAT_IDS, load_tags, _write_data_path
+from grim_dawn_data import cache, DAMAGE_TYPES, BONUSES_FILE, CONSTELLATION_FILE, TAGS_FILE, STAT_IDS, load_tags, _write_data_path
 from grim_dawn_data.bonuses import *
-from grim_dawn_data.json_utils import dump_json, load_json
+from grim_dawn_data.json_utils import dump_json, dump_ndjson, iter_json_records
+from grim_dawn_data.manifest import BuildManifest
+from pathlib import Path
 from typing import *
+import argparse
 import re
 
+OUTPUT_FORMATS = ["json", "ndjson"]
+
+@cache
 def split_bonus_name(name: str):
     m = re.fullmatch('([a-z]+)([A-Z][a-z]+)+', name)
     assert m is not None
@@ -23,6 +29,7 @@ def manual_bonuses() -> Dict:
     return manual
 
 
+@cache
 def get_tag_name(bonus: Tuple[str]) -> str:
     manual = manual_bonuses()
     tags = load_tags()
@@ -57,30 +64,73 @@ def get_tag_name(bonus: Tuple[str]) -> str:
 
     return None
 
-
-def get_flat_damage(bonuses: dict) -> List[Bonus]:
+@cache
+def get_attribute_tag_name(name: str) -> Optional[str]:
+    return get_tag_name(split_bonus_name(name))
+
+
+BONUS_FAMILIES = {
+    "damage_over_time": [
+        ("amount", "offensiveSlow{}Min"),
+        ("duration", "offensiveSlow{}DurationMin"),
+        ("chance", "offensiveSlow{}Chance"),
+        ("amount_mod", "offensiveSlow{}Modifier"),
+        ("duration_mod", "offensiveSlow{}DurationModifier"),
+    ],
+    "flat_damage": [
+        ("amount", "offensive{}Modifier"),
+        ("chance", "offensive{}ModifierChance"),
+        ("max", "offensive{}Max"),
+        ("min", "offensive{}Min"),
+    ],
+    "retaliation_damage": [
+        ("max", "retaliation{}Max"),
+        ("min", "retaliation{}Min"),
+    ],
+    "resistance_reduction": [
+        ("duration", "offensive{}ResistanceReductionPercentDurationMin"),
+        ("amount", "offensive{}ResistanceReductionPercentMin"),
+    ],
+}
+
+def _build_bonus_key_index() -> Dict[str, Tuple[str, str, str]]:
+    index = {}
+    for family, keys in BONUS_FAMILIES.items():
+        for ty in DAMAGE_TYPES:
+            for role, pattern in keys:
+                name = pattern.format(ty)
+                split_bonus_name(name)
+                assert name not in index
+                index[name] = (family, ty, role)
+    return index
+
+# raw attribute name -> (bonus family, damage type, role)
+BONUS_KEY_INDEX = _build_bonus_key_index()
+
+# The get_* functions below take the attributes of one bonus family grouped as
+# {damage type: {role: value}} and pop every role they consume.
+
+def get_flat_damage(groups: dict) -> List[Bonus]:
     blist = []
     for ty in DAMAGE_TYPES:
-        k_amount = split_bonus_name("offensive" + ty + "Modifier")
-        k_chance = split_bonus_name("offensive" + ty + "ModifierChance")
+        g = groups.get(ty)
+        if g is None:
+            continue
 
-        if k_amount in bonuses:
-            amount = bonuses.pop(k_amount)
+        if "amount" in g:
+            amount = g.pop("amount")
             b = DamageModifier(amount, ty)
-            if k_chance in bonuses:
-                p = bonuses.pop(k_chance)
+            if "chance" in g:
+                p = g.pop("chance")
                 b = ChanceOf(p, b)
             blist.append(b)
 
-        k_max = split_bonus_name("offensive" + ty + "Max")
-        k_min = split_bonus_name("offensive" + ty + "Min")
-
-        if k_max in bonuses:
-            v_max = bonuses.pop(k_max)
-            v_min = bonuses.pop(k_min)
-        elif k_min in bonuses:
+        if "max" in g:
+            v_max = g.pop("max")
+            v_min = g.pop("min")
+        elif "min" in g:
             v_max = None
-            v_min = bonuses.pop(k_min)
+            v_min = g.pop("min")
         else:
             v_min = None
             v_max = None
@@ -90,119 +140,144 @@ def get_flat_damage(bonuses: dict) -> List[Bonus]:
 
     return blist
 
-def get_retaliation_damage(bonuses: dict) -> List[Bonus]:
+def get_retaliation_damage(groups: dict) -> List[Bonus]:
     blist = []
     for ty in DAMAGE_TYPES:
-        k_max = split_bonus_name("retaliation" + ty + "Max")
-        k_min = split_bonus_name("retaliation" + ty + "Min")
-
-        if k_max in bonuses:
-            v_max = bonuses.pop(k_max)
-            v_min = bonuses.pop(k_min)
-        elif k_min in bonuses:
+        g = groups.get(ty)
+        if g is None:
+            continue
+
+        if "max" in g:
+            v_max = g.pop("max")
+            v_min = g.pop("min")
+        elif "min" in g:
             v_max = None
-            v_min = bonuses.pop(k_min)
+            v_min = g.pop("min")
         else:
-            v_min = None
-            v_max = None
+            continue
 
-        if v_min is not None:
-            blist.append(Retaliation(v_min, ty, max_val=v_max))
+        blist.append(Retaliation(v_min, ty, max_val=v_max))
 
     return blist
 
-def get_resistance_reduction(bonuses: dict) -> List[Bonus]:
+def get_resistance_reduction(groups: dict) -> List[Bonus]:
     blist = []
     for ty in DAMAGE_TYPES:
-        k_duration = split_bonus_name("offensive" + ty + "ResistanceReductionPercentDurationMin")
-        k_amt = split_bonus_name("offensive" + ty + "ResistanceReductionPercentMin")
+        g = groups.get(ty)
+        if g is None:
+            continue
 
-        if k_amt in bonuses or k_duration in bonuses:
-            a = bonuses.pop(k_amt)
-            d = bonuses.pop(k_duration)
+        if "amount" in g or "duration" in g:
+            a = g.pop("amount")
+            d = g.pop("duration")
 
             blist.append(ResistanceReduction(a, d, ty))
 
     return blist
 
 
-def get_damage_over_time(bonuses: dict) -> List[Bonus]:
+def get_damage_over_time(groups: dict) -> List[Bonus]:
     blist = []
     for ty in DAMAGE_TYPES:
-        k_amount = split_bonus_name("offensiveSlow" + ty + "Min")
-        k_duration = split_bonus_name("offensiveSlow" + ty + "DurationMin")
-        k_chance = split_bonus_name("offensiveSlow" + ty + "Chance")
+        g = groups.get(ty)
+        if g is None:
+            continue
 
-        if k_amount in bonuses:
-            amount = bonuses.pop(k_amount)
-            duration = bonuses.pop(k_duration)
+        if "amount" in g:
+            amount = g.pop("amount")
+            duration = g.pop("duration")
             b = DamageOverTime(amount, duration, ty)
-            if k_chance in bonuses:
-                p = bonuses.pop(k_chance)
+            if "chance" in g:
+                p = g.pop("chance")
                 b = ChanceOf(p, b)
             blist.append(b)
 
-        k_amt_mod = split_bonus_name("offensiveSlow" +  ty + "Modifier")
-        k_dur_mod = split_bonus_name("offensiveSlow" +  ty + "DurationModifier")
-
-        if k_amt_mod in bonuses or k_dur_mod in bonuses:
-            try:
-                amt = bonuses.pop(k_amt_mod)
-            except KeyError:
-                amt = 0.
-
-            try:
-                dur = bonuses.pop(k_dur_mod)
-            except KeyError:
-                dur = 0.
-
+        if "amount_mod" in g or "duration_mod" in g:
+            amt = g.pop("amount_mod", 0.)
+            dur = g.pop("duration_mod", 0.)
             blist.append(DamageOverTimeModifier(amt, dur, ty))
 
 
     return blist
 
 def interpret_bonuses(bonuses) -> Tuple[List[Bonus], Dict]:
-    bonuses = {split_bonus_name(b): v for b, v in bonuses.items()}
+    families = {f: {} for f in BONUS_FAMILIES}
+    for name, v in bonuses.items():
+        key = BONUS_KEY_INDEX.get(name)
+        if key is not None:
+            family, ty, role = key
+            families[family].setdefault(ty, {})[role] = v
 
     blist = []
 
-    blist.extend(get_damage_over_time(bonuses))
-    blist.extend(get_flat_damage(bonuses))
-    blist.extend(get_retaliation_damage(bonuses))
-    blist.extend(get_resistance_reduction(bonuses))
+    blist.extend(get_damage_over_time(families["damage_over_time"]))
+    blist.extend(get_flat_damage(families["flat_damage"]))
+    blist.extend(get_retaliation_damage(families["retaliation_damage"]))
+    blist.extend(get_resistance_reduction(families["resistance_reduction"]))
+
+    remaining = {}
+    for name, v in bonuses.items():
+        key = BONUS_KEY_INDEX.get(name)
+        if key is not None:
+            family, ty, role = key
+            if role not in families[family][ty]:
+                continue
 
-    for b in list(bonuses):
-        tag = get_tag_name(b)
+        tag = get_attribute_tag_name(name)
         if tag is not None:
-            val = bonuses.pop(b)
-            blist.append(MiscBonus(val, "".join(b), tag))
+            blist.append(MiscBonus(v, name, tag))
+        else:
+            remaining[split_bonus_name(name)] = v
+
+    return blist, remaining
 
-    return blist, bonuses
+
+def process_constellation_bonuses(c: Dict, not_handled: Set) -> Dict:
+    # replaces each star's raw bonus attributes with Bonus objects, in place
+    for i, s in enumerate(c['skills'].values()):
+        if 'bonuses' in s:
+            blist, rem = interpret_bonuses(s['bonuses'])
+            not_handled.update(rem)
+        else:
+            blist = []
+
+        if 'pet_bonuses' in s:
+            pet_blist, rem = interpret_bonuses(s.pop('pet_bonuses'))
+            blist.extend(map(Pets, pet_blist))
+            not_handled.update(rem)
+
+        if blist:
+            print(f"{c['name']} ({i})")
+            for b in blist:
+                print(f"    {b.display():<60}  [{b.kind_id()}]")
+            s['bonuses'] = blist
+    return c
 
 
 if __name__ == '__main__':
-    data = load_json(CONSTELLATION_FILE)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--force", action="store_true", help="rebuild even if the inputs are unchanged")
+    parser.add_argument("--input", type=Path, default=CONSTELLATION_FILE,
+                        help="constellations as a JSON array, or one per line in an .ndjson file")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="json",
+                        help="a JSON array, or one constellation per line written as soon as it is processed")
+    args = parser.parse_args()
+
+    dst = _write_data_path("constellation-bonuses.ndjson" if args.format == "ndjson" else "constellation-bonuses.json")
+    manifest = BuildManifest()
+    inputs = manifest.hash_files([args.input, TAGS_FILE, Path("manual_bonuses.txt"), Path(__file__)])
+    inputs["options"] = f"format={args.format}"
+    if not args.force and manifest.is_up_to_date("bonuses", inputs):
+        print("constellation bonuses are up to date, skipping")
+        raise SystemExit
+
     tags = load_tags()
-    bonuses = set()
     not_handled = set()
-    for c in data:
-        for i, s in enumerate(c['skills'].values()):
-            if 'bonuses' in s:
-                blist, rem = interpret_bonuses(s['bonuses'])
-                not_handled.update(rem)
-            else:
-                blist = []
-
-            if 'pet_bonuses' in s:
-                pet_blist, rem = interpret_bonuses(s.pop('pet_bonuses'))
-                blist.extend(map(Pets, pet_blist))
-                not_handled.update(rem)
-
-            if blist:
-                print(f"{c['name']} ({i})")
-                for b in blist:
-                    print(f"    {b.display():<60}  [{b.kind_id()}]")
-                s['bonuses'] = blist
+    constellations = (process_constellation_bonuses(c, not_handled) for c in iter_json_records(args.input))
+    if args.format == "ndjson":
+        dump_ndjson(constellations, dst)
+    else:
+        dump_json(list(constellations), dst)
 
     if not_handled:
         print("error, the following bonus attributes were not handled")
@@ -211,4 +286,5 @@ if __name__ == '__main__':
             fp.write(contents)
         print(contents)
 
-    dump_json(data, _write_data_path("constellation-bonuses.json"))
+    manifest.record("bonuses", inputs, [dst])
+    manifest.save()
@@ -1,71 +1,75 @@
 #!/usr/bin/env python3
+import contextlib
+import copy
 import math
 from typing import *
-from grim_dawn_data import WEAPON_TYPES, load_tags, CONSTELLATION_FILE, _write_data_path
-from grim_dawn_data.json_utils import dump_json
-from pathlib import Path
+from grim_dawn_data import DATA_DIRECTORY, WEAPON_TYPES, load_tags, CONSTELLATION_FILE, TAGS_FILE, _write_data_path
+from grim_dawn_data.dbr import DbrRecord
+from grim_dawn_data.records import RecordCache, RecordSource, as_record_source, read_archive_sources
+from grim_dawn_data.json_utils import NdjsonWriter, dump_json, iter_json_records
+from grim_dawn_data.manifest import BuildManifest, hash_file
+from pathlib import Path, PurePosixPath
+from concurrent.futures import ProcessPoolExecutor
+import argparse
 import subprocess
 
 CONSTELLATIONS_PATH = Path("ui/skills/devotion/constellations")
-
-def load_dbr_file(p: Path) -> dict:
-    key_vals = {}
-    with open(p, 'r') as fp:
-        for line in fp:
-            line = line.strip().split(',')
-            assert len(line) == 3
-            assert line[-1] == ""
-            assert line[0] not in key_vals
-            key_vals[line[0]] = line[1]
-    print("read", p)
-    return key_vals
-
-
-def parse_int_with_float(s: str) -> int:
+SKILL_CACHE_FILE = DATA_DIRECTORY / "skill-cache.json"
+OUTPUT_FORMATS = ["json", "ndjson"]
+
+PASSIVE_BONUS_PREFIXES = (
+    "retaliation",
+    "offensive",
+    "defensive",
+    "character",
+    "skill",
+)
+PASSIVE_BONUS_IGNORE = {
+    "characterBaseAttackSpeedTag",
+    "skillDisplayName",
+    "skillDownBitmapName",
+    "skillUpBitmapName",
+    'skillBaseDescription',
+    'skillMaxLevel',
+}
+SKILL_KEYS = {"Class", "skillDisplayName", *WEAPON_TYPES}
+CONSTELLATION_PREFIXES = ("affinityRequired", "affinityGiven", "devotionButton", "devotionLinks")
+
+def load_dbr_file(source: RecordSource, rel: str, prefixes: Iterable[str] = None, keys: Collection[str] = None) -> DbrRecord:
+    data = source.read_dbr(rel, prefixes, keys)
+    print("read", source.path(rel))
+    return data
+
+
+def parse_int_with_float(s) -> int:
     v = float(s)
     n = round(v)
     assert math.isclose(v, n, abs_tol=.000001)
     return n
 
-def _get_weapon_reqs(data: dict) -> list:
-    return [t for t in WEAPON_TYPES if bool(int(data.get(t, 0)))]
-
-def _get_passive_bonuses(data: dict) -> dict:
-    prefixes = [
-        "retaliation",
-        "offensive",
-        "defensive",
-        "character",
-        "skill",
-    ]
-    ignore = {
-        "characterBaseAttackSpeedTag",
-        "skillDisplayName",
-        "skillDownBitmapName",
-        "skillUpBitmapName",
-        'skillBaseDescription',
-        'skillMaxLevel',
-    }
+def _get_weapon_reqs(data: DbrRecord) -> list:
+    return [t for t in WEAPON_TYPES if bool(data.get_int(t, 0))]
 
+def _get_passive_bonuses(data: DbrRecord) -> dict:
+    # data only holds keys starting with one of PASSIVE_BONUS_PREFIXES, plus SKILL_KEYS
     bonuses = {}
 
     for key, val in data.items():
-        if key in ignore:
+        if key in PASSIVE_BONUS_IGNORE or not key.startswith(PASSIVE_BONUS_PREFIXES):
             continue
 
-        if any(key.startswith(p) for p in prefixes):
-            v = float(val)
-            if v > 0:
-                assert key not in val
-                bonuses[key] = v
+        v = data.get_float(key)
+        if v > 0:
+            assert key not in val
+            bonuses[key] = v
 
     return bonuses
 
 class BadActiveSkillFile(Exception):
     pass
 
-def parse_active_skill_file(p: Path) -> dict:
-    data = load_dbr_file(p)
+def parse_active_skill_file(source: RecordSource, rel: str) -> dict:
+    data = load_dbr_file(source, rel, keys=SKILL_KEYS)
     tags = load_tags()
     if "skillDisplayName" in data:
         output = { "celestial_power": tags[data['skillDisplayName']]}
@@ -79,12 +83,12 @@ def parse_active_skill_file(p: Path) -> dict:
     return output
 
 
-def parse_petbonus_skill_file(p: Path) -> dict:
-    data = load_dbr_file(p)
+def parse_petbonus_skill_file(source: RecordSource, rel: str) -> dict:
+    data = load_dbr_file(source, rel, PASSIVE_BONUS_PREFIXES)
     return _get_passive_bonuses(data)
 
-def parse_passive_skill_file(p: Path) -> dict:
-    data = load_dbr_file(p)
+def parse_passive_skill_file(source: RecordSource, rel: str) -> dict:
+    data = load_dbr_file(source, rel, PASSIVE_BONUS_PREFIXES, SKILL_KEYS)
     assert data['Class'] == "Skill_Passive"
     tags = load_tags()
     output = {
@@ -96,18 +100,18 @@ def parse_passive_skill_file(p: Path) -> dict:
         output['weapon_requirement'] = weapon_req
     return output
 
-def parse_constellation_file(p: Path) -> dict:
+def parse_constellation_file(source: RecordSource, rel: str) -> dict:
     affinity_bonus = {}
     affinity_req = {}
 
-    data = load_dbr_file(p)
+    data = load_dbr_file(source, rel, CONSTELLATION_PREFIXES)
     for (key_base, dst) in [("affinityRequired", affinity_req), ("affinityGiven", affinity_bonus)]:
         for i in range(1, 9999999):
             valkey = f"{key_base}{i}"
             namekey = f"{key_base}Name{i}"
             if namekey in data:
                 a = data[namekey].lower()
-                v = parse_int_with_float(data[valkey])
+                v = parse_int_with_float(data.get_float(valkey))
                 assert a not in dst
                 dst[a] = v
             else:
@@ -136,13 +140,13 @@ def parse_constellation_file(p: Path) -> dict:
 
     return output
 
-def process_constellation(base_path: Path, p: Path) -> Optional[Dict[str, Any]]:
-    c = parse_constellation_file(p)
+def process_constellation(source: RecordSource, rel: str) -> Optional[Dict[str, Any]]:
+    c = parse_constellation_file(source, rel)
     c_name = None
     if len(c['skills']) == 0:
         return None
     for s, filename in c['skills'].items():
-        skill = process_skill(base_path, filename)
+        skill = process_skill(source, filename)
         try:
             n = skill.pop("constellation")
             if c_name is None:
@@ -164,55 +168,219 @@ def process_constellation(base_path: Path, p: Path) -> Optional[Dict[str, Any]]:
     print("processed", c_name)
     return c
 
-def process_skill(base_path: Path, skill_id: str) -> Dict[str, Any]:
-    get_path = lambda s : base_path / "skills/devotion" / (s + ".dbr")
-    p = get_path(skill_id)
-    if p.exists():
-        data = parse_passive_skill_file(p)
-        p = get_path(skill_id + '_petbonus')
-        if p.exists():
-            data['pet_bonuses'] = parse_petbonus_skill_file(p)
+SKILL_FILE_SUFFIXES = ("", "_petbonus", "_skill", "_skill_buff")
+
+def _skill_record(name: str) -> str:
+    return f"skills/devotion/{name}.dbr"
+
+def constellation_input_files(source: RecordSource, rel: str) -> List[Path]:
+    files = [source.path(rel)]
+    for skill_id in parse_constellation_file(source, rel)['skills'].values():
+        files.extend(source.path(_skill_record(skill_id + s)) for s in SKILL_FILE_SUFFIXES)
+    return files
+
+# parsed skill records by content, shared by every source; main() swaps in the persistent one
+skill_cache = RecordCache()
+
+def skill_cache_namespace() -> str:
+    # parsed skills hold tag strings, so they are only valid for the tags and parser they were made with
+    return "-".join(hash_file(p) for p in [TAGS_FILE, __file__])
+
+def _parse_cached(kind: str, parse: Callable[[RecordSource, str], Any], source: RecordSource, rel: str) -> Any:
+    digest = source.digest(rel)
+    hit, value = skill_cache.get(kind, digest)
+    if not hit:
+        try:
+            value = parse(source, rel)
+        except BadActiveSkillFile:
+            value = None
+        skill_cache.put(kind, digest, value)
+    if value is None:
+        raise BadActiveSkillFile
+    # callers modify the result
+    return copy.deepcopy(value)
+
+def process_skill(source: RecordSource, skill_id: str) -> Dict[str, Any]:
+    rel = _skill_record(skill_id)
+    if source.exists(rel):
+        data = _parse_cached("passive", parse_passive_skill_file, source, rel)
+        rel = _skill_record(skill_id + '_petbonus')
+        if source.exists(rel):
+            data['pet_bonuses'] = _parse_cached("petbonus", parse_petbonus_skill_file, source, rel)
         return data
 
     try:
-        return parse_active_skill_file(get_path(skill_id + "_skill"))
+        return _parse_cached("active", parse_active_skill_file, source, _skill_record(skill_id + "_skill"))
     except BadActiveSkillFile:
         pass
 
-    return parse_active_skill_file(get_path(skill_id + "_skill_buff"))
-
-def parse_constellations_from_db(base_path: Path) -> List[Dict[str, Any]]:
-    constellation_files = [
-        p for p in (base_path / "ui/skills/devotion/constellations/").glob('*.dbr')
-        if "background" not in p.stem
-    ]
+    return _parse_cached("active", parse_active_skill_file, source, _skill_record(skill_id + "_skill_buff"))
 
-    constellations = [
-        process_constellation(base_path, p) for p in constellation_files
+def find_constellation_files(source: RecordSource) -> List[str]:
+    return [
+        rel for rel in source.list_dir(str(CONSTELLATIONS_PATH))
+        if rel.endswith(".dbr") and "background" not in PurePosixPath(rel).stem
     ]
 
-    constellations = [c for c in constellations if c is not None]
+# record sources of the current worker process, set once by the pool initializer so that
+# archive-backed sources are not pickled with every job
+_worker_sources: List[RecordSource] = []
+
+def _init_worker(sources: List[RecordSource], skill_entries: Dict[str, Any]):
+    _worker_sources[:] = sources
+    skill_cache.merge(skill_entries)
+
+def _process_constellation_job(job: Tuple[int, str]) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+    # also hands back the skills parsed for this job, to be merged into the parent's cache
+    i, rel = job
+    return process_constellation(_worker_sources[i], rel), skill_cache.take_new()
+
+def iter_process_constellations(files: List[Tuple[RecordSource, str]], workers: int = 1) -> Iterator[Optional[Dict[str, Any]]]:
+    # yields each result in the order of `files` as soon as it is parsed
+    if workers > 1 and len(files) > 1:
+        sources = list({id(s): s for s, _ in files}.values())
+        index = {id(s): i for i, s in enumerate(sources)}
+        jobs = [(index[id(s)], rel) for s, rel in files]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(sources, skill_cache.entries)) as pool:
+            for c, skill_entries in pool.map(_process_constellation_job, jobs, chunksize=4):
+                skill_cache.merge(skill_entries)
+                yield c
+    else:
+        for s, rel in files:
+            yield process_constellation(s, rel)
+
+def process_constellations(files: List[Tuple[RecordSource, str]], workers: int = 1) -> Dict[Path, Optional[Dict[str, Any]]]:
+    return {s.path(rel): c for (s, rel), c in zip(files, iter_process_constellations(files, workers))}
+
+def parse_constellations_from_dbs(sources: List[Union[RecordSource, Path]], workers: int = 1, cached: Dict[Path, Optional[Dict[str, Any]]] = None) -> List[List[Dict[str, Any]]]:
+    cached = cached or {}
+    sources = [as_record_source(s) for s in sources]
+    jobs = [(i, s, rel) for i, s in enumerate(sources) for rel in find_constellation_files(s)]
+    results = process_constellations([(s, rel) for _, s, rel in jobs if s.path(rel) not in cached], workers)
+    results.update(cached)
+
+    constellations = [[] for _ in sources]
+    for i, s, rel in jobs:
+        c = results[s.path(rel)]
+        if c is not None:
+            constellations[i].append(c)
     return constellations
 
+def parse_constellations_from_db(source: Union[RecordSource, Path], workers: int = 1) -> List[Dict[str, Any]]:
+    return parse_constellations_from_dbs([source], workers)[0]
+
+def devotion_record_files(base_path: Path) -> List[Path]:
+    return (
+        list((base_path / "ui/skills/devotion/constellations").glob("*.dbr")) +
+        list((base_path / "skills/devotion").glob("**/*.dbr"))
+    )
+
+def find_unchanged_constellations(manifest: BuildManifest, files: List[Path], shared_inputs: dict) -> Dict[Path, Optional[Dict[str, Any]]]:
+    state = manifest.state("constellations")
+    if state.get("shared") != shared_inputs or not manifest.outputs_unchanged("constellations"):
+        return {}
+
+    previous = {c['name']: c for c in iter_json_records(state["output"])}
+    cached = {}
+    for p in files:
+        entry = state["constellations"].get(p.as_posix())
+        if entry is None or (entry["name"] is not None and entry["name"] not in previous):
+            continue
+        if all(manifest.hash(f) == h for f, h in entry["inputs"].items()):
+            cached[p] = previous.get(entry["name"])
+    return cached
+
 if __name__ == '__main__':
-    raw_dir = Path("raw")
-    if not raw_dir.exists():
-        print("extracting")
-        subprocess.run(("tar", "-Jxvf", "raw.tar.xz"))
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="number of worker processes used to parse constellation records")
+    parser.add_argument("--force", action="store_true",
+                        help="rebuild every constellation, even if its records are unchanged")
+    parser.add_argument("--archive", nargs="?", const="raw.tar.xz",
+                        help="read the devotion records straight from this tar archive instead of extracting it")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="json",
+                        help="a JSON array, or one constellation per line written as soon as it is parsed")
+    args = parser.parse_args()
+
+    manifest = BuildManifest()
+    shared_inputs = manifest.hash_files([TAGS_FILE, Path(__file__)])
+    if args.archive:
+        # the archive is hashed as a whole, so there is no per-constellation reuse
+        inputs = manifest.hash_files([args.archive])
+        inputs.update(shared_inputs)
+    else:
+        raw_dir = Path("raw")
+        if not raw_dir.exists():
+            print("extracting")
+            subprocess.run(("tar", "-Jxvf", "raw.tar.xz"))
+        sources = [as_record_source(src / "records") for src in sorted(raw_dir.glob("*"))]
+        inputs = manifest.hash_files([f for src in sources for f in devotion_record_files(src.root)])
+        inputs.update(shared_inputs)
+    inputs["options"] = f"format={args.format}"
+
+    # checked before the archive is opened, which is most of the work of a skipped build
+    if not args.force and manifest.is_up_to_date("constellations", inputs):
+        print("constellations are up to date, skipping")
+        raise SystemExit
+    if args.archive:
+        sources = read_archive_sources(args.archive)
+
+    files = [(src, rel) for src in sources for rel in find_constellation_files(src)]
+    dst = _write_data_path("constellations.ndjson" if args.format == "ndjson" else "constellations.json")
+
+    skill_cache = RecordCache(SKILL_CACHE_FILE, skill_cache_namespace())
+    if args.force or args.archive:
+        cached = {}
+    else:
+        cached = find_unchanged_constellations(manifest, [s.path(rel) for s, rel in files], shared_inputs)
+    print(f"Reusing {len(cached)} unchanged constellations")
+    parsed = iter_process_constellations([(s, rel) for s, rel in files if s.path(rel) not in cached], args.workers)
 
+    # with ndjson each constellation is written as soon as it is parsed, and only the names
+    # are kept for the manifest
+    names = {}
     constellations = set()
     full_list = []
-
-    for src in Path("raw").glob("*"):
-        src = src / "records"
-        data = parse_constellations_from_db(src)
-        for c in data:
+    with open(dst, 'w') if args.format == "ndjson" else contextlib.nullcontext() as fp:
+        writer = NdjsonWriter(fp) if fp is not None else None
+        for s, rel in files:
+            p = s.path(rel)
+            c = cached[p] if p in cached else next(parsed)
+            names[p] = None if c is None else c['name']
+            if c is None:
+                continue
             n = c['name']
             assert n not in constellations
             constellations.add(n)
+            if writer is not None:
+                writer.write(c)
+            else:
+                full_list.append(c)
 
-        full_list.extend(data)
-    print(f"Found {len(full_list)} constellations")
-    dst = _write_data_path("constellations.json")
-    dump_json(full_list, dst)
+    print(f"Found {len(constellations)} constellations")
+    skill_cache.save()
+    if writer is None:
+        dump_json(full_list, dst)
     print("wrote", dst)
+
+    old_entries = manifest.state("constellations").get("constellations", {})
+    entries = {}
+    # per-constellation inputs are only tracked for extracted records
+    tracked = [] if args.archive else files
+    for s, rel in tracked:
+        p = s.path(rel)
+        key = p.as_posix()
+        if p in cached:
+            entries[key] = old_entries[key]
+        else:
+            entries[key] = {
+                "inputs": manifest.hash_files(constellation_input_files(s, rel)),
+                "name": names[p],
+            }
+
+    manifest.record("constellations", inputs, [dst], state={
+        "shared": shared_inputs,
+        "output": dst.as_posix(),
+        "constellations": entries,
+    })
+    manifest.save()
@@ -1,5 +1,8 @@
+from contextlib import contextmanager
 from pathlib import Path
+import os
 import subprocess
+import tempfile
 from functools import lru_cache
 from .json_utils import load_json as _load_json
 
@@ -17,8 +20,40 @@ def _write_data_path(filename) -> Path:
     DATA_DIRECTORY.mkdir(exist_ok=True)
     return DATA_DIRECTORY / filename
 
+@contextmanager
+def _replace_file(path: Path, mode: str = 'w'):
+    # writes a temporary file of its own next to `path` and renames it over `path`, so
+    # processes writing the same file at once never share a partial file
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    try:
+        with open(fd, mode) as fp:
+            yield fp
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
 
-TAGS_FILE = _read_data_path("tags.json")
+
+DEFAULT_LOCALE = "en"
+
+
+def tags_filename(locale: str = DEFAULT_LOCALE) -> str:
+    if locale == DEFAULT_LOCALE:
+        return "tags.json"
+    return f"tags_{locale}.json"
+
+def tags_file(locale: str = DEFAULT_LOCALE) -> Path:
+    # resolved on every call, so a data/ file written after import is picked up once the
+    # loaders' caches are cleared
+    return _read_data_path(tags_filename(locale))
+
+def bonuses_file() -> Path:
+    return _read_data_path("constellation-bonuses.json")
+
+
+TAGS_FILE = _read_data_path(tags_filename())
 CONSTELLATION_FILE = _read_data_path("constellations.json")
 BONUSES_FILE = _read_data_path("constellation-bonuses.json")
 
@@ -124,10 +159,65 @@ def auto_extract_archive(path: str):
     return p
 
 
+def _load_compiled(source, read, write, load=_load_json):
+    from . import compiled
+    data = getattr(compiled, read)(source)
+    if data is None:
+        data = load(source)
+        try:
+            getattr(compiled, write)(data, source)
+        except (OSError, TypeError, ValueError):
+            pass
+    return data
+
+def load_tags(locale: str = DEFAULT_LOCALE):
+    return _load_tags(locale)
+
 @cache
-def load_tags():
-    return _load_json(TAGS_FILE)
+def _load_tags(locale: str):
+    return _load_compiled(tags_file(locale), 'read_tags_cache', 'write_tags_cache')
+
+def load_tag_store(locale: str = DEFAULT_LOCALE):
+    store = _TAG_STORES.get(locale)
+    if store is None:
+        loaded = _load_tag_store(locale)
+        store = _TAG_STORES.setdefault(locale, loaded)
+        if store is not loaded:
+            # another thread got there first
+            _close_tag_store(loaded)
+    return store
+
+# locale -> the store returned by load_tag_store, kept until close_tag_stores()
+_TAG_STORES = {}
+
+def close_tag_stores():
+    # the stores map their cache files; anyone still holding one has to reload it
+    stores = list(_TAG_STORES.values())
+    _TAG_STORES.clear()
+    for store in stores:
+        _close_tag_store(store)
+
+def _close_tag_store(store):
+    # a plain dict when the compiled cache could not be written
+    if hasattr(store, 'close'):
+        store.close()
+
+def _load_tag_store(locale: str):
+    # reads tags on demand from the compiled cache, without loading the whole dictionary
+    from . import compiled
+    source = tags_file(locale)
+    store = compiled.TagStore.open(source)
+    if store is not None:
+        return store
+
+    tags = _load_json(source)
+    try:
+        compiled.write_tags_cache(tags, source)
+    except (OSError, TypeError, ValueError):
+        return tags
+    return compiled.TagStore.open(source) or tags
 
 @cache
 def load_constellation_bonuses():
-    return _load_json(BONUSES_FILE)
+    from .schema import load_constellations
+    return _load_compiled(bonuses_file(), 'read_bonuses_cache', 'write_bonuses_cache', load_constellations)
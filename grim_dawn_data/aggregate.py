@@ -0,0 +1,251 @@
+from typing import Any, Dict, Hashable, Iterable, List, Mapping, Sequence, Tuple
+from . import COUNTS_AS
+from .bonuses import Bonus, Pets
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def resolve_counts_as(counts_as: Mapping[str, Iterable[Tuple[str, float]]] = COUNTS_AS) -> Dict[str, List[Tuple[str, float]]]:
+    # umbrella kind -> [(leaf kind, factor)], following chains through other umbrella kinds
+    resolved = {}
+
+    def resolve(kind, path):
+        if kind in resolved:
+            return resolved[kind]
+        if kind in path:
+            raise ValueError(f"COUNTS_AS has a cycle through {kind}")
+        parts = counts_as.get(kind)
+        if parts is None:
+            return [(kind, 1.)]
+
+        leaves = {}
+        for target, factor in parts:
+            for leaf, f in resolve(target, path + (kind, )):
+                leaves[leaf] = leaves.get(leaf, 0.) + factor * f
+        resolved[kind] = list(leaves.items())
+        return resolved[kind]
+
+    for kind in counts_as:
+        resolve(kind, ())
+    return resolved
+
+
+class _Unit:
+    __slots__ = ('passthrough', 'pet_passthrough', 'kinds', 'pet_kinds', 'entries')
+
+    def __init__(self):
+        self.passthrough = []
+        self.pet_passthrough = []
+        # kind id -> _Template of the first bonus of that kind, in first-seen order
+        self.kinds = {}
+        self.pet_kinds = {}
+        # (column, value) for every summed field, in input order
+        self.entries = []
+
+
+class _Template:
+    __slots__ = ('cls', 'static', 'columns')
+
+    def __init__(self, b: Bonus, columns: List[Tuple[str, int]]):
+        self.cls = b.__class__
+        self.static = [(f, getattr(b, f)) for f in b.json_fields if f not in b.aggregate_fields]
+        self.columns = columns
+
+    def build(self, totals) -> Bonus:
+        b = self.cls.__new__(self.cls)
+        for f, v in self.static:
+            setattr(b, f, v)
+        for f, col in self.columns:
+            setattr(b, f, totals[col])
+        return b
+
+
+class AggregationEngine:
+    def __init__(self, units: Mapping[Hashable, Iterable[Bonus]], use_numpy: bool = False,
+                 counts_as: Mapping[str, Iterable[Tuple[str, float]]] = COUNTS_AS):
+        # use_numpy sums with a matrix product, which adds the values in another order than
+        # aggregate_bonuses, so non-integer totals can differ from it in the last bits. The
+        # default sums every build in input order and matches aggregate_bonuses exactly.
+        if use_numpy and np is None:
+            raise ImportError("numpy is not installed")
+
+        self.use_numpy = use_numpy
+        self.keys = list(units)
+        self.unit_index = {k: i for i, k in enumerate(self.keys)}
+        # column -> (kind id, field)
+        self.columns: List[Tuple[str, str]] = []
+        self.column_index: Dict[Tuple[str, str], int] = {}
+        self._units = [self._encode_unit(bonuses) for bonuses in units.values()]
+        self._matrix = None
+
+        self.counts_as = counts_as
+        # effective column -> (kind id, field), once COUNTS_AS has been compiled
+        self.effective_columns: List[Tuple[str, str]] = None
+        # column -> [(effective column, factor)]
+        self._expansion = None
+        self._effective_matrix = None
+
+    @classmethod
+    def from_constellations(cls, constellations: Iterable[Dict[str, Any]], **kwargs) -> 'AggregationEngine':
+        units = {}
+        for c in constellations:
+            for s, skill in c['skills'].items():
+                units[(c['name'], int(s))] = skill.get('bonuses', [])
+        return cls(units, **kwargs)
+
+    def _column(self, kind: str, field: str) -> int:
+        key = (kind, field)
+        col = self.column_index.get(key)
+        if col is None:
+            col = self.column_index[key] = len(self.columns)
+            self.columns.append(key)
+        return col
+
+    def _encode_unit(self, bonuses: Iterable[Bonus]) -> _Unit:
+        unit = _Unit()
+        for b in bonuses:
+            pets = isinstance(b, Pets)
+            inner = b.bonus if pets else b
+            if isinstance(inner, Pets):
+                raise ValueError(f"nested pet bonus {b!r} cannot be aggregated")
+
+            if not inner.is_aggregatable():
+                (unit.pet_passthrough if pets else unit.passthrough).append(inner)
+                continue
+
+            kind = b.kind_id()
+            columns = [(f, self._column(kind, f)) for f in inner.aggregate_fields]
+            kinds = unit.pet_kinds if pets else unit.kinds
+            if kind not in kinds:
+                kinds[kind] = _Template(inner, columns)
+            unit.entries.extend((col, getattr(inner, f)) for f, col in columns)
+        return unit
+
+    def encode(self, build: Iterable[Hashable]) -> List[int]:
+        return [self.unit_index[k] for k in build]
+
+    def matrix(self):
+        if self._matrix is None:
+            m = np.zeros((len(self._units), len(self.columns)))
+            for i, unit in enumerate(self._units):
+                for col, v in unit.entries:
+                    m[i, col] += v
+            self._matrix = m
+        return self._matrix
+
+    def _compile_counts_as(self):
+        if self._expansion is not None:
+            return
+
+        resolved = resolve_counts_as(self.counts_as)
+        columns = []
+        column_index = {}
+        expansion = []
+        for kind, field in self.columns:
+            pets = kind.startswith('Pets.')
+            targets = resolved.get(kind[len('Pets.'):] if pets else kind)
+            if targets is None:
+                targets = [(kind, 1.)]
+            elif pets:
+                targets = [('Pets.' + k, f) for k, f in targets]
+
+            row = []
+            for target, factor in targets:
+                key = (target, field)
+                col = column_index.get(key)
+                if col is None:
+                    col = column_index[key] = len(columns)
+                    columns.append(key)
+                row.append((col, factor))
+            expansion.append(row)
+
+        self.effective_columns = columns
+        self._expansion = expansion
+
+    def effective_matrix(self):
+        if self._effective_matrix is None:
+            self._compile_counts_as()
+            e = np.zeros((len(self.columns), len(self.effective_columns)))
+            for col, row in enumerate(self._expansion):
+                for ecol, f in row:
+                    e[col, ecol] += f
+            self._effective_matrix = self.matrix() @ e
+        return self._effective_matrix
+
+    def _totals(self, builds: Sequence[List[int]], effective: bool = False) -> List[Any]:
+        if self.use_numpy:
+            counts = np.zeros((len(builds), len(self._units)))
+            rows = np.repeat(np.arange(len(builds)), [len(b) for b in builds])
+            cols = np.fromiter((u for b in builds for u in b), dtype=np.intp, count=len(rows))
+            np.add.at(counts, (rows, cols), 1)
+            m = self.effective_matrix() if effective else self.matrix()
+            return (counts @ m).tolist()
+
+        totals = []
+        for build in builds:
+            t = {}
+            for u in build:
+                for col, v in self._units[u].entries:
+                    t[col] = t.get(col, 0.) + v
+            if effective:
+                e = {}
+                for col, v in t.items():
+                    for ecol, f in self._expansion[col]:
+                        e[ecol] = e.get(ecol, 0.) + v * f
+                t = e
+            totals.append(t)
+        return totals
+
+    def totals_many(self, builds: Iterable[Iterable[Hashable]], effective: bool = False) -> List[Dict[Tuple[str, str], float]]:
+        # with effective=True, umbrella kinds from COUNTS_AS are replaced by what they count as
+        if effective:
+            self._compile_counts_as()
+            columns = self.effective_columns
+        else:
+            columns = self.columns
+
+        builds = [self.encode(b) for b in builds]
+        result = []
+        for build, t in zip(builds, self._totals(builds, effective)):
+            seen = {col for u in build for col, _ in self._units[u].entries}
+            if effective:
+                seen = {ecol for col in seen for ecol, _ in self._expansion[col]}
+            result.append({columns[col]: t[col] for col in sorted(seen)})
+        return result
+
+    def effective_totals_many(self, builds: Iterable[Iterable[Hashable]]) -> List[Dict[Tuple[str, str], float]]:
+        return self.totals_many(builds, effective=True)
+
+    def effective_totals(self, build: Iterable[Hashable]) -> Dict[Tuple[str, str], float]:
+        return self.totals_many([build], effective=True)[0]
+
+    def _assemble(self, build: List[int], totals) -> List[Bonus]:
+        blist = []
+        pets = []
+        kinds = {}
+        pet_kinds = {}
+        for u in build:
+            unit = self._units[u]
+            blist.extend(unit.passthrough)
+            pets.extend(unit.pet_passthrough)
+            for k, t in unit.kinds.items():
+                if k not in kinds:
+                    kinds[k] = t
+            for k, t in unit.pet_kinds.items():
+                if k not in pet_kinds:
+                    pet_kinds[k] = t
+
+        pets.extend(t.build(totals) for t in pet_kinds.values())
+        blist.extend(map(Pets, pets))
+        blist.extend(t.build(totals) for t in kinds.values())
+        return blist
+
+    def aggregate_many(self, builds: Iterable[Iterable[Hashable]]) -> List[List[Bonus]]:
+        builds = [self.encode(b) for b in builds]
+        return [self._assemble(b, t) for b, t in zip(builds, self._totals(builds))]
+
+    def aggregate(self, build: Iterable[Hashable]) -> List[Bonus]:
+        return self.aggregate_many([build])[0]
@@ -1,12 +1,15 @@
-from . import load_tags
-from typing import Iterable, List
+from . import DEFAULT_LOCALE, load_tag_store
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional
 from .json_utils import JsonSerializable
+from array import array
+from operator import attrgetter
 import copy
+import math
 
 
 def fmt(fstring, str=True, repr=True):
     def format_self(self):
-        return self.__class__.__name__ + "(" + fstring.format_map(self.__dict__) + ")"
+        return self.__class__.__name__ + "(" + fstring.format_map(self.to_json_dict()) + ")"
 
     def wrapper(cls):
         if str:
@@ -16,31 +19,64 @@ def fmt(fstring, str=True, repr=True):
         return cls
     return wrapper
 
-def _get_tag(t) -> str:
-    return load_tags()[t]
+class MissingTagError(KeyError):
+    pass
+
+def _get_tag(t, locale: str = DEFAULT_LOCALE, tags: Mapping[str, str] = None) -> str:
+    # `tags` instead of the loaded tags of `locale`, e.g. those of a DataSnapshot
+    if tags is None:
+        tags = load_tag_store(locale)
+    try:
+        return tags[t]
+    except KeyError:
+        raise MissingTagError(t) from None
 
 class Bonus(JsonSerializable):
+    __slots__ = ()
+
+    # numeric field -> BonusTable column, for bonuses that can be stored in a BonusTable row
+    table_columns = None
+    # fields summed by aggregate_bonuses
+    aggregate_fields = ()
+    # fields holding another Bonus
+    bonus_fields = ()
+
     def kind_id(self) -> str:
         raise NotImplementedError
 
-    def display_fmt(self) -> str:
+    def display_fmt(self, locale: str = DEFAULT_LOCALE, tags: Mapping[str, str] = None) -> str:
         raise NotImplementedError
 
     def display_args(self) -> tuple:
         raise NotImplementedError
 
-    def display(self) -> str:
-        return self.display_fmt().format(*self.display_args())
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # everything display_fmt depends on, which by default is every field that is not a
+        # number stored in a BonusTable column
+        columns = cls.table_columns or {}
+        fields = [f for f in cls.json_fields or () if f not in columns]
+        cls._template_fields = attrgetter(*fields) if fields else staticmethod(lambda b: ())
+
+    def template_key(self):
+        return self._template_fields(self)
 
-    def display_symbolic(self) -> str:
+    def display(self, locale: str = DEFAULT_LOCALE, tags: Mapping[str, str] = None) -> str:
+        return display_template(self, locale, tags).format(*self.display_args())
+
+    def display_symbolic(self, locale: str = DEFAULT_LOCALE, tags: Mapping[str, str] = None) -> str:
         k = len(self.display_args())
-        return self.display_fmt().format(*('XYZ'[i] for i in range(k)))
+        return self.display_fmt(locale, tags).format(*('XYZ'[i] for i in range(k)))
 
     def is_aggregatable(self) -> bool:
         return False
 
 @fmt("{amount} {kind}")
 class MiscBonus(Bonus):
+    __slots__ = ('amount', 'kind', 'tagname')
+    table_columns = {'amount': 'amounts'}
+    aggregate_fields = ('amount', )
+
     def kind_id(self) -> str:
         return self.kind
 
@@ -49,8 +85,8 @@ class MiscBonus(Bonus):
         self.kind = kind
         self.tagname = tagname
 
-    def display_fmt(self) -> str:
-        return _get_tag(self.tagname)
+    def display_fmt(self, locale: str = DEFAULT_LOCALE, tags: Mapping[str, str] = None) -> str:
+        return _get_tag(self.tagname, locale, tags)
 
     def display_args(self) -> tuple:
         return self.amount,
@@ -61,6 +97,10 @@ class MiscBonus(Bonus):
 
 @fmt("+{amount}% {kind}")
 class DamageModifier(Bonus):
+    __slots__ = ('amount', 'kind')
+    table_columns = {'amount': 'amounts'}
+    aggregate_fields = ('amount', )
+
     def kind_id(self) -> str:
         return f"{self.__class__.__name__}.{self.kind}"
 
@@ -68,8 +108,8 @@ class DamageModifier(Bonus):
         self.amount = amount
         self.kind = kind
 
-    def display_fmt(self) -> str:
-        return _get_tag(f"DamageModifier{self.kind}")
+    def display_fmt(self, locale: str = DEFAULT_LOCALE, tags: Mapping[str, str] = None) -> str:
+        return _get_tag(f"DamageModifier{self.kind}", locale, tags)
 
     def display_args(self):
         return self.amount,
@@ -79,14 +119,20 @@ class DamageModifier(Bonus):
 
 @fmt("{bonus}")
 class Pets(Bonus):
+    __slots__ = ('bonus', )
+    bonus_fields = ('bonus', )
+
     def __init__(self, bonus: Bonus):
         self.bonus = bonus
 
     def kind_id(self) -> str:
         return f"Pets.{self.bonus.kind_id()}"
 
-    def display_fmt(self) -> str:
-        return _get_tag('tagPetBonusNameAllPets') + ": " + self.bonus.display_fmt()
+    def template_key(self) -> tuple:
+        return self.bonus.__class__, self.bonus.template_key()
+
+    def display_fmt(self, locale: str = DEFAULT_LOCALE, tags: Mapping[str, str] = None) -> str:
+        return _get_tag('tagPetBonusNameAllPets', locale, tags) + ": " + self.bonus.display_fmt(locale, tags)
 
     def display_args(self) -> tuple:
         return self.bonus.display_args()
@@ -95,7 +141,11 @@ class Pets(Bonus):
         return self.bonus.is_aggregatable()
 
 class Damage(Bonus):
-    def __init__(self, min_val: float, kind: str, max_val=None):
+    __slots__ = ('min_val', 'max_val', 'kind')
+    table_columns = {'min_val': 'min_vals', 'max_val': 'max_vals'}
+    aggregate_fields = ('min_val', )
+
+    def __init__(self, min_val: float, kind: str, max_val: Optional[float] = None):
         self.min_val = min_val
         self.max_val = max_val
         self.kind = kind
@@ -106,15 +156,18 @@ class Damage(Bonus):
     def is_range(self) -> bool:
         return self.max_val is not None
 
-    def _initial_fmt(self):
-        return _get_tag(f"Damage{self.kind}")
+    def template_key(self) -> tuple:
+        return self.kind, self.is_range()
+
+    def _initial_fmt(self, locale: str = DEFAULT_LOCALE, tags: Mapping[str, str] = None):
+        return _get_tag(f"Damage{self.kind}", locale, tags)
 
-    def display_fmt(self):
-        f = self._initial_fmt()
+    def display_fmt(self, locale: str = DEFAULT_LOCALE, tags: Mapping[str, str] = None):
+        f = self._initial_fmt(locale, tags)
         if self.is_range():
-            return f.format(_get_tag("DamageRangeFormat"))
+            return f.format(_get_tag("DamageRangeFormat", locale, tags))
         else:
-            return f.format(_get_tag("DamageSingleFormat"))
+            return f.format(_get_tag("DamageSingleFormat", locale, tags))
 
     def display_args(self):
         if self.is_range():
@@ -122,9 +175,9 @@ class Damage(Bonus):
         else:
             return self.min_val,
 
-    def display_symbolic(self) -> str:
-        f = _get_tag(f"Damage{self.kind}")
-        return f.format(_get_tag("DamageRangeFormat")).format('X', 'Y')
+    def display_symbolic(self, locale: str = DEFAULT_LOCALE, tags: Mapping[str, str] = None) -> str:
+        f = _get_tag(f"Damage{self.kind}", locale, tags)
+        return f.format(_get_tag("DamageRangeFormat", locale, tags)).format('X', 'Y')
 
     def __repr__(self):
         if self.is_range():
@@ -138,16 +191,21 @@ class Damage(Bonus):
         return self.max_val is None
 
 class Retaliation(Damage):
+    __slots__ = ()
+
     def kind_id(self) -> str:
         return f"{self.__class__.__name__}.{self.kind}"
 
-    def _initial_fmt(self) -> str:
-        return _get_tag(f"Retaliation{self.kind}")
+    def _initial_fmt(self, locale: str = DEFAULT_LOCALE, tags: Mapping[str, str] = None) -> str:
+        return _get_tag(f"Retaliation{self.kind}", locale, tags)
 
 
 
 @fmt("-{amount}% * {duration}s {kind}")
 class ResistanceReduction(Bonus):
+    __slots__ = ('amount', 'duration', 'kind')
+    table_columns = {'amount': 'amounts', 'duration': 'durations'}
+
     def __init__(self, amount: float, duration: float, kind: str):
         self.amount = amount
         self.duration = duration
@@ -156,21 +214,24 @@ class ResistanceReduction(Bonus):
     def kind_id(self) -> str:
         return f"{self.__class__.__name__}.{self.kind}"
 
-    def display_fmt(self):
-        return _get_tag("DamageSingleFormat") +  _get_tag(f"Damage{self.kind}ResistanceReductionPercent") + _get_tag('DamageFixedSingleFormatTime')
+    def display_fmt(self, locale: str = DEFAULT_LOCALE, tags: Mapping[str, str] = None):
+        return _get_tag("DamageSingleFormat", locale, tags) +  _get_tag(f"Damage{self.kind}ResistanceReductionPercent", locale, tags) + _get_tag('DamageFixedSingleFormatTime', locale, tags)
 
     def display_args(self) -> tuple:
         return (self.amount, self.duration)
 
 @fmt("{dps} * {duration}s {kind}")
 class DamageOverTime(Bonus):
+    __slots__ = ('dps', 'duration', 'kind')
+    table_columns = {'dps': 'amounts', 'duration': 'durations'}
+
     def __init__(self, dps:  float, duration: float, kind: str):
         self.dps = dps
         self.duration = duration
         self.kind = kind
 
-    def display_fmt(self):
-        return _get_tag("DamageSingleFormat") + _get_tag(f"DamageDuration{self.kind}") + _get_tag("DamageSingleFormatTime")
+    def display_fmt(self, locale: str = DEFAULT_LOCALE, tags: Mapping[str, str] = None):
+        return _get_tag("DamageSingleFormat", locale, tags) + _get_tag(f"DamageDuration{self.kind}", locale, tags) + _get_tag("DamageSingleFormatTime", locale, tags)
 
 
     def display_args(self):
@@ -181,22 +242,29 @@ class DamageOverTime(Bonus):
 
 
 class DamageOverTimeModifier(Bonus):
+    __slots__ = ('damage_mod', 'duration_mod', 'kind')
+    table_columns = {'damage_mod': 'amounts', 'duration_mod': 'durations'}
+    aggregate_fields = ('damage_mod', 'duration_mod')
+
     def __init__(self, damage_mod: float, duration_mod: float, kind: str):
         self.damage_mod = damage_mod
         self.duration_mod = duration_mod
         self.kind = kind
 
-    def _display_fmt_with_duration(self):
-        return self._display_fmt_without_duration() + _get_tag("ImprovedTimeFormat")
+    def _display_fmt_with_duration(self, locale: str = DEFAULT_LOCALE, tags: Mapping[str, str] = None):
+        return self._display_fmt_without_duration(locale, tags) + _get_tag("ImprovedTimeFormat", locale, tags)
+
+    def _display_fmt_without_duration(self, locale: str = DEFAULT_LOCALE, tags: Mapping[str, str] = None):
+        return _get_tag(f"DamageDurationModifier{self.kind}", locale, tags)
 
-    def _display_fmt_without_duration(self):
-        return _get_tag(f"DamageDurationModifier{self.kind}")
+    def template_key(self) -> tuple:
+        return self.kind, self.duration_mod == 0
 
-    def display_fmt(self):
+    def display_fmt(self, locale: str = DEFAULT_LOCALE, tags: Mapping[str, str] = None):
         if self.duration_mod == 0:
-            return self._display_fmt_without_duration()
+            return self._display_fmt_without_duration(locale, tags)
         else:
-            return self._display_fmt_with_duration()
+            return self._display_fmt_with_duration(locale, tags)
 
     def display_args(self):
         if self.duration_mod == 0:
@@ -204,8 +272,8 @@ class DamageOverTimeModifier(Bonus):
         else:
             return self.damage_mod, self.duration_mod
 
-    def display_symbolic(self) -> str:
-        return self._display_fmt_with_duration().format('X', 'Y')
+    def display_symbolic(self, locale: str = DEFAULT_LOCALE, tags: Mapping[str, str] = None) -> str:
+        return self._display_fmt_with_duration(locale, tags).format('X', 'Y')
 
     def kind_id(self) -> str:
         return f"{self.__class__.__name__}.{self.kind}"
@@ -227,6 +295,9 @@ class DamageOverTimeModifier(Bonus):
 
 @fmt("{prob}% {bonus}")
 class ChanceOf(Bonus):
+    __slots__ = ('bonus', 'prob')
+    bonus_fields = ('bonus', )
+
     def __init__(self, prob: float, bonus: Bonus):
         self.bonus = bonus
         self.prob = prob
@@ -234,13 +305,48 @@ class ChanceOf(Bonus):
     def kind_id(self) -> str:
         return f"{self.__class__.__name__}.{self.bonus.kind_id()}"
 
-    def display_fmt(self):
-        return _get_tag("tagChanceOf") + self.bonus.display_fmt()
+    def template_key(self) -> tuple:
+        return self.bonus.__class__, self.bonus.template_key()
+
+    def display_fmt(self, locale: str = DEFAULT_LOCALE, tags: Mapping[str, str] = None):
+        return _get_tag("tagChanceOf", locale, tags) + self.bonus.display_fmt(locale, tags)
 
     def display_args(self) -> tuple:
         return (self.prob, ) + self.bonus.display_args()
 
 
+# (class, template key, locale) -> the format string display_fmt returns for it, with the
+# loaded tags; templates for other tags are cached by whoever owns those tags
+_TEMPLATES = {}
+
+def _templates(tags: Optional[Mapping[str, str]], templates: Optional[Dict]) -> Dict:
+    if tags is None:
+        return _TEMPLATES
+    return {} if templates is None else templates
+
+def display_template(b: Bonus, locale: str = DEFAULT_LOCALE, tags: Mapping[str, str] = None,
+                     templates: Dict = None) -> str:
+    templates = _templates(tags, templates)
+    key = (b.__class__, b.template_key(), locale)
+    try:
+        return templates[key]
+    except KeyError:
+        f = templates[key] = b.display_fmt(locale, tags)
+        return f
+
+def render_bonuses(bonuses: Iterable[Bonus], locale: str = DEFAULT_LOCALE, tags: Mapping[str, str] = None,
+                   templates: Dict = None) -> List[str]:
+    templates = _templates(tags, templates)
+    out = []
+    for b in bonuses:
+        key = (b.__class__, b.template_key(), locale)
+        f = templates.get(key)
+        if f is None:
+            f = templates[key] = b.display_fmt(locale, tags)
+        out.append(f.format(*b.display_args()))
+    return out
+
+
 def aggregate_bonuses(bonuses: Iterable[Bonus]) -> List[Bonus]:
     aggregated = {}
     pets = []
@@ -273,3 +379,94 @@ def aggregate_bonuses(bonuses: Iterable[Bonus]) -> List[Bonus]:
         blist.extend(map(Pets, aggregate_bonuses(pets)))
     blist.extend(aggregated.values())
     return blist
+
+
+class BonusTable:
+    COLUMNS = ('amounts', 'min_vals', 'max_vals', 'durations')
+
+    def __init__(self, bonuses: Iterable[Bonus] = ()):
+        # distinct (bonus class, non-numeric fields) combinations, indexed by kind_ids
+        self.kinds = []
+        self._kind_index = {}
+        self.kind_ids = array('i')
+        # distinct Bonus.kind_id() strings of the rows, indexed by kind_name_ids
+        self.kind_names = []
+        self._kind_name_index = {}
+        self.kind_name_ids = array('i')
+        self.pets = array('b')
+        self.chances = array('d')
+        for c in self.COLUMNS:
+            setattr(self, c, array('d'))
+        self.extend(bonuses)
+
+    def __len__(self) -> int:
+        return len(self.kind_ids)
+
+    def extend(self, bonuses: Iterable[Bonus]):
+        for b in bonuses:
+            self.append(b)
+
+    def append(self, b: Bonus):
+        kind_name = b.kind_id()
+        name_id = self._kind_name_index.get(kind_name)
+        if name_id is None:
+            name_id = self._kind_name_index[kind_name] = len(self.kind_names)
+            self.kind_names.append(kind_name)
+
+        pets = isinstance(b, Pets)
+        if pets:
+            b = b.bonus
+
+        chance = math.nan
+        if isinstance(b, ChanceOf):
+            chance = b.prob
+            b = b.bonus
+
+        cls = b.__class__
+        if cls.table_columns is None:
+            raise ValueError(f"cannot store {b!r} in a BonusTable")
+
+        values = dict.fromkeys(self.COLUMNS, math.nan)
+        static = []
+        for f in cls.json_fields:
+            if f in cls.table_columns:
+                v = getattr(b, f)
+                values[cls.table_columns[f]] = math.nan if v is None else v
+            else:
+                static.append(getattr(b, f))
+
+        key = (cls, tuple(static))
+        kind = self._kind_index.get(key)
+        if kind is None:
+            kind = self._kind_index[key] = len(self.kinds)
+            self.kinds.append(key)
+
+        self.kind_ids.append(kind)
+        self.kind_name_ids.append(name_id)
+        self.pets.append(pets)
+        self.chances.append(chance)
+        for c, v in values.items():
+            getattr(self, c).append(v)
+
+    def __getitem__(self, i: int) -> Bonus:
+        cls, static = self.kinds[self.kind_ids[i]]
+        static = iter(static)
+        b = cls.__new__(cls)
+        for f in cls.json_fields:
+            if f in cls.table_columns:
+                v = getattr(self, cls.table_columns[f])[i]
+                setattr(b, f, None if math.isnan(v) else v)
+            else:
+                setattr(b, f, next(static))
+
+        if not math.isnan(self.chances[i]):
+            b = ChanceOf(self.chances[i], b)
+        if self.pets[i]:
+            b = Pets(b)
+        return b
+
+    def __iter__(self) -> Iterator[Bonus]:
+        return (self[i] for i in range(len(self)))
+
+    def kind_id(self, i: int) -> str:
+        return self.kind_names[self.kind_name_ids[i]]
@@ -0,0 +1,315 @@
+from array import array
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from . import DATA_DIRECTORY, _replace_file
+from .bonuses import BonusTable
+from .json_utils import json_class, json_tag
+from .manifest import hash_file
+
+CACHE_VERSION = 2
+# where the loaders keep the compiled copies of the data files
+CACHE_DIRECTORY = Path(os.environ.get("GRIM_DAWN_DATA_CACHE") or DATA_DIRECTORY / "cache")
+# decoded strings kept by each TagStore
+TAG_LRU_SIZE = 1024
+TAGS_MAGIC = b"GDTAGS\0\0"
+BONUSES_MAGIC = b"GDBONUS\0"
+
+# magic, version, source size, source mtime_ns, source sha1
+_HEADER = struct.Struct("<8sIQq20s")
+_COUNT = struct.Struct("<I")
+_BONUS_SIZES = struct.Struct("<III")
+
+
+def cache_path(source) -> Path:
+    # keyed by the whole source path, so sources sharing a name or a stem get caches of their own
+    source = Path(source).resolve()
+    return CACHE_DIRECTORY / f"{source.name}.{hashlib.sha1(str(source).encode()).hexdigest()[:16]}.cache"
+
+
+def _little_endian(a: array) -> bytes:
+    if sys.byteorder == "big":
+        a = array(a.typecode, a)
+        a.byteswap()
+    return a.tobytes()
+
+
+def _from_little_endian(typecode: str, buf) -> array:
+    a = array(typecode)
+    a.frombytes(buf)
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a
+
+
+def _header(magic: bytes, source) -> bytes:
+    st = os.stat(source)
+    return _HEADER.pack(magic, CACHE_VERSION, st.st_size, st.st_mtime_ns, bytes.fromhex(hash_file(source)))
+
+
+def _is_valid(buf, magic: bytes, source) -> bool:
+    if len(buf) < _HEADER.size:
+        return False
+    m, version, size, mtime_ns, digest = _HEADER.unpack_from(buf)
+    if m != magic or version != CACHE_VERSION:
+        return False
+    try:
+        st = os.stat(source)
+    except FileNotFoundError:
+        return False
+    if st.st_size != size:
+        return False
+    # the hash is checked even when the mtime matches: a same-size rewrite within the mtime
+    # granularity, or one with its mtime restored, must not load stale data
+    return bytes.fromhex(hash_file(source)) == digest
+
+
+def _write(path: Path, parts: List[bytes]):
+    with _replace_file(path, "wb") as fp:
+        for p in parts:
+            fp.write(p)
+
+
+def _open(path: Path, magic: bytes, source) -> Optional[mmap.mmap]:
+    try:
+        with open(path, "rb") as fp:
+            buf = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):
+        return None
+    if not _is_valid(buf, magic, source):
+        buf.close()
+        return None
+    return buf
+
+
+def _string_table(strings: List[str]):
+    offsets = array("I", [0])
+    blob = bytearray()
+    for s in strings:
+        if "\0" in s:
+            raise ValueError(f"cannot store {s!r} in a string table")
+        blob += s.encode()
+        blob += b"\0"
+        offsets.append(len(blob))
+    return offsets, bytes(blob)
+
+
+def write_tags_cache(tags: Dict[str, str], source, path: Path = None):
+    # layout: header, count, key offsets, value offsets, entry indices sorted by key, key blob,
+    # value blob; strings are NUL terminated and offsets are relative to their blob
+    path = path or cache_path(source)
+    keys = list(tags)
+    key_offsets, key_blob = _string_table(keys)
+    value_offsets, value_blob = _string_table(list(tags.values()))
+    order = array("I", sorted(range(len(keys)), key=keys.__getitem__))
+    _write(path, [
+        _header(TAGS_MAGIC, source),
+        _COUNT.pack(len(keys)),
+        _little_endian(key_offsets),
+        _little_endian(value_offsets),
+        _little_endian(order),
+        key_blob,
+        value_blob,
+    ])
+
+
+class TagsLayout:
+    def __init__(self, buf):
+        n, = _COUNT.unpack_from(buf, _HEADER.size)
+        self.count = n
+        self.key_offsets_start = _HEADER.size + _COUNT.size
+        self.value_offsets_start = self.key_offsets_start + 4 * (n + 1)
+        self.order_start = self.value_offsets_start + 4 * (n + 1)
+        self.keys_start = self.order_start + 4 * n
+        # the last offset of each table is the size of its blob
+        self.values_start = self.keys_start + _COUNT.unpack_from(buf, self.value_offsets_start - 4)[0]
+        self.values_end = self.values_start + _COUNT.unpack_from(buf, self.order_start - 4)[0]
+
+
+def read_tags_cache(source, path: Path = None) -> Optional[Dict[str, str]]:
+    buf = _open(path or cache_path(source), TAGS_MAGIC, source)
+    if buf is None:
+        return None
+    with buf:
+        layout = TagsLayout(buf)
+        if not layout.count:
+            return {}
+        # drop the final terminator so that splitting gives exactly one string per entry
+        keys = buf[layout.keys_start:layout.values_start - 1].decode().split("\0")
+        values = buf[layout.values_start:layout.values_end - 1].decode().split("\0")
+    return dict(zip(keys, values))
+
+
+def _u32_view(view: memoryview, start: int, count: int):
+    if sys.byteorder == "big":
+        return _from_little_endian("I", view[start:start + 4 * count])
+    return view[start:start + 4 * count].cast("I")
+
+
+class TagStore:
+    def __init__(self, buf: mmap.mmap, lru_size: int = TAG_LRU_SIZE):
+        layout = TagsLayout(buf)
+        self.count = layout.count
+        self._buf = buf
+        self._keys_start = layout.keys_start
+        self._values_start = layout.values_start
+        # offsets are read straight from the mapping, so a lookup only touches the pages it
+        # bisects through
+        self._view = memoryview(buf)
+        self._key_offsets = _u32_view(self._view, layout.key_offsets_start, layout.count + 1)
+        self._value_offsets = _u32_view(self._view, layout.value_offsets_start, layout.count + 1)
+        self._order = _u32_view(self._view, layout.order_start, layout.count)
+        self._lookup = lru_cache(maxsize=lru_size)(self._decode)
+
+    @classmethod
+    def open(cls, source, path: Path = None, **kwargs) -> Optional['TagStore']:
+        buf = _open(path or cache_path(source), TAGS_MAGIC, source)
+        if buf is None:
+            return None
+        return cls(buf, **kwargs)
+
+    def close(self):
+        for v in (self._key_offsets, self._value_offsets, self._order, self._view):
+            if isinstance(v, memoryview):
+                v.release()
+        self._buf.close()
+
+    def _key(self, i: int) -> bytes:
+        return self._buf[self._keys_start + self._key_offsets[i]:self._keys_start + self._key_offsets[i + 1] - 1]
+
+    def _find(self, key: str) -> int:
+        # UTF-8 byte order agrees with str order, which the index was sorted by
+        k = key.encode()
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(self._order[mid]) < k:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count and self._key(self._order[lo]) == k:
+            return self._order[lo]
+        return -1
+
+    def _decode(self, key: str) -> str:
+        i = self._find(key)
+        if i < 0:
+            raise KeyError(key)
+        start = self._values_start + self._value_offsets[i]
+        return self._buf[start:self._values_start + self._value_offsets[i + 1] - 1].decode()
+
+    def __getitem__(self, key: str) -> str:
+        return self._lookup(key)
+
+    def get(self, key: str, default=None):
+        try:
+            return self._lookup(key)
+        except KeyError:
+            return default
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return self.count
+
+
+def write_bonuses_cache(constellations: List[Dict[str, Any]], source, path: Path = None):
+    # layout: header, section sizes, the document with every bonus list replaced by its row
+    # range, the bonus kinds as [json tag, static fields] and their kind id strings, then the
+    # BonusTable columns
+    path = path or cache_path(source)
+    table = BonusTable()
+    skeleton = []
+    for c in constellations:
+        c = dict(c, skills=dict(c["skills"]))
+        for s, skill in c["skills"].items():
+            if "bonuses" in skill:
+                start = len(table)
+                table.extend(skill["bonuses"])
+                c["skills"][s] = dict(skill, bonuses=[start, len(table)])
+        skeleton.append(c)
+
+    skeleton = json.dumps(skeleton).encode()
+    kinds = json.dumps({
+        "kinds": [[json_tag(cls), list(static)] for cls, static in table.kinds],
+        "kind_names": table.kind_names,
+    }).encode()
+    _write(path, [
+        _header(BONUSES_MAGIC, source),
+        _BONUS_SIZES.pack(len(skeleton), len(kinds), len(table)),
+        skeleton,
+        kinds,
+        _little_endian(table.kind_ids),
+        _little_endian(table.kind_name_ids),
+        _little_endian(table.pets),
+        _little_endian(table.chances),
+        *(_little_endian(getattr(table, c)) for c in BonusTable.COLUMNS),
+    ])
+
+
+# BonusTable arrays in the order they are stored
+_BONUS_ARRAYS = [("kind_ids", "i"), ("kind_name_ids", "i"), ("pets", "b"), ("chances", "d")] + [(c, "d") for c in BonusTable.COLUMNS]
+
+
+class BonusesLayout:
+    def __init__(self, buf):
+        skeleton_size, kinds_size, rows = _BONUS_SIZES.unpack_from(buf, _HEADER.size)
+        self.rows = rows
+        self.skeleton_start = _HEADER.size + _BONUS_SIZES.size
+        self.kinds_start = self.skeleton_start + skeleton_size
+        start = self.kinds_start + kinds_size
+        self.kinds_end = start
+        # array name -> (typecode, start, size)
+        self.arrays = {}
+        for name, typecode in _BONUS_ARRAYS:
+            size = rows * array(typecode).itemsize
+            self.arrays[name] = (typecode, start, size)
+            start += size
+
+    def skeleton(self, buf) -> List[Dict[str, Any]]:
+        return json.loads(buf[self.skeleton_start:self.kinds_start])
+
+    def table(self, buf, copy: bool = True) -> BonusTable:
+        # without copy, the columns are views of buf on little-endian hosts
+        table = BonusTable()
+        kinds = json.loads(bytes(buf[self.kinds_start:self.kinds_end]))
+        table.kinds = [(json_class(tag), tuple(static)) for tag, static in kinds["kinds"]]
+        table._kind_index = {k: i for i, k in enumerate(table.kinds)}
+        table.kind_names = kinds["kind_names"]
+        table._kind_name_index = {k: i for i, k in enumerate(table.kind_names)}
+        view = memoryview(buf)
+        for name, (typecode, start, size) in self.arrays.items():
+            if copy or sys.byteorder == "big":
+                column = _from_little_endian(typecode, view[start:start + size])
+            else:
+                column = view[start:start + size].cast(typecode)
+            setattr(table, name, column)
+        return table
+
+
+def bind_bonuses(constellations: List[Dict[str, Any]], bonuses) -> List[Dict[str, Any]]:
+    # replaces the [start, end) row ranges of a skeleton with the bonuses, in place
+    for c in constellations:
+        for skill in c["skills"].values():
+            if "bonuses" in skill:
+                start, end = skill["bonuses"]
+                skill["bonuses"] = bonuses[start:end]
+    return constellations
+
+
+def read_bonuses_cache(source, path: Path = None) -> Optional[List[Dict[str, Any]]]:
+    buf = _open(path or cache_path(source), BONUSES_MAGIC, source)
+    if buf is None:
+        return None
+    with buf:
+        layout = BonusesLayout(buf)
+        constellations = layout.skeleton(buf)
+        table = layout.table(buf)
+    return bind_bonuses(constellations, list(table))
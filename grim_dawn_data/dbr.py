@@ -0,0 +1,67 @@
+from pathlib import Path
+from typing import Collection, Iterable
+import sys
+
+_MISSING = object()
+
+
+class DbrRecord(dict):
+    # attribute name -> raw string value; numeric values are parsed once, on first access
+    __slots__ = ('_floats', '_ints')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._floats = {}
+        self._ints = {}
+
+    def get_float(self, key: str, default=_MISSING) -> float:
+        try:
+            return self._floats[key]
+        except KeyError:
+            pass
+        if key not in self:
+            if default is _MISSING:
+                raise KeyError(key)
+            return default
+        v = self._floats[key] = float(self[key])
+        return v
+
+    def get_int(self, key: str, default=_MISSING) -> int:
+        try:
+            return self._ints[key]
+        except KeyError:
+            pass
+        if key not in self:
+            if default is _MISSING:
+                raise KeyError(key)
+            return default
+        v = self._ints[key] = int(self[key])
+        return v
+
+
+def parse_dbr(text: str, name: str = "<dbr>", prefixes: Iterable[str] = None, keys: Collection[str] = None) -> DbrRecord:
+    # with prefixes or keys, only the attributes starting with one of the prefixes or named
+    # in keys are kept
+    prefixes = None if prefixes is None else tuple(prefixes)
+    keys = None if keys is None else frozenset(keys)
+    project = prefixes is not None or keys is not None
+
+    record = DbrRecord()
+    for line in text.splitlines():
+        fields = line.strip().split(',')
+        if len(fields) != 3 or fields[2] != "":
+            raise ValueError(f"{name}: malformed line {line!r}")
+        key = fields[0]
+        if project and not ((keys is not None and key in keys) or (prefixes is not None and key.startswith(prefixes))):
+            continue
+        if key in record:
+            raise ValueError(f"{name}: duplicate attribute {key}")
+        # the same few hundred attribute names repeat across every record
+        record[sys.intern(key)] = fields[1]
+    return record
+
+
+def read_dbr(p: Path, prefixes: Iterable[str] = None, keys: Collection[str] = None) -> DbrRecord:
+    with open(p, 'r') as fp:
+        text = fp.read()
+    return parse_dbr(text, str(p), prefixes, keys)
@@ -0,0 +1,89 @@
+from heapq import heapify, heappop, heappush
+from typing import Any, Dict, List
+from . import cache, load_constellation_bonuses
+from .bonuses import Bonus, aggregate_bonuses
+
+
+def stars_of(mask: int) -> List[int]:
+    stars = []
+    s = 0
+    while mask:
+        if mask & 1:
+            stars.append(s)
+        mask >>= 1
+        s += 1
+    return stars
+
+
+class ConstellationGraph:
+    # star prerequisites of one constellation, with the bonus totals a planner looks up.
+    # Star sets are bitsets, bit s standing for star s. The totals are shared, callers must
+    # not modify them.
+    def __init__(self, c: Dict[str, Any]):
+        self.name = c['name']
+        self.size = len(c['skills'])
+        self.parents = [0] * self.size
+        for dst, src in c['pred'].items():
+            dst = int(dst)
+            if not (0 <= dst < self.size and 0 <= src < self.size):
+                raise ValueError(f"{self.name}: link {src} -> {dst} is outside the {self.size} stars")
+            self.parents[dst] |= 1 << src
+
+        # topological order, lowest star first among the available ones
+        children = [[] for _ in range(self.size)]
+        waiting = [bin(m).count('1') for m in self.parents]
+        for s in range(self.size):
+            for p in stars_of(self.parents[s]):
+                children[p].append(s)
+        ready = [s for s in range(self.size) if waiting[s] == 0]
+        heapify(ready)
+        self.order = []
+        while ready:
+            s = heappop(ready)
+            self.order.append(s)
+            for child in children[s]:
+                waiting[child] -= 1
+                if waiting[child] == 0:
+                    heappush(ready, child)
+        if len(self.order) != self.size:
+            raise ValueError(f"{self.name}: star links form a cycle")
+
+        # every star that has to be taken before s, not including s
+        self.ancestors = [0] * self.size
+        for s in self.order:
+            for p in stars_of(self.parents[s]):
+                self.ancestors[s] |= self.ancestors[p] | (1 << p)
+
+        star_bonuses = [c['skills'][str(s)].get('bonuses', []) for s in range(self.size)]
+        # prefix_totals[k]: the first k stars of `order`
+        self.prefix_totals: List[List[Bonus]] = [[]]
+        taken = []
+        for s in self.order:
+            taken.extend(star_bonuses[s])
+            self.prefix_totals.append(aggregate_bonuses(taken))
+        # closure_totals[s]: star s with all of its ancestors
+        self.closure_totals: List[List[Bonus]] = [
+            aggregate_bonuses(b for t in stars_of(self.closure(s)) for b in star_bonuses[t])
+            for s in range(self.size)
+        ]
+
+    def closure(self, star: int) -> int:
+        return self.ancestors[star] | (1 << star)
+
+    def is_valid(self, stars: int) -> bool:
+        # every selected star has its prerequisites selected
+        return all(self.ancestors[s] & ~stars == 0 for s in stars_of(stars))
+
+    def totals_up_to(self, k: int) -> List[Bonus]:
+        return self.prefix_totals[k]
+
+    def totals_with_prerequisites(self, star: int) -> List[Bonus]:
+        return self.closure_totals[star]
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.name!r}, order={self.order})"
+
+
+@cache
+def load_constellation_graphs() -> Dict[str, ConstellationGraph]:
+    return {c['name']: ConstellationGraph(c) for c in load_constellation_bonuses()}
@@ -0,0 +1,91 @@
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from . import cache, load_constellation_bonuses
+from .bonuses import Bonus, ChanceOf, Pets
+
+
+def bonus_amount(b: Bonus) -> Optional[float]:
+    # the value a bonus is ranked by: its summed field if it has one, otherwise its first
+    # numeric field, looking through Pets and ChanceOf
+    while isinstance(b, (Pets, ChanceOf)):
+        b = b.bonus
+    if b.aggregate_fields:
+        return getattr(b, b.aggregate_fields[0])
+    if b.table_columns:
+        return getattr(b, next(f for f in b.json_fields if f in b.table_columns))
+    return None
+
+
+class BonusEntry:
+    __slots__ = ('constellation', 'star', 'amount', 'bonus')
+
+    def __init__(self, constellation: str, star: int, amount: Optional[float], bonus: Bonus):
+        self.constellation = constellation
+        self.star = star
+        self.amount = amount
+        self.bonus = bonus
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.constellation!r}, {self.star}, {self.amount})"
+
+
+class ConstellationIndex:
+    def __init__(self, constellations: Iterable[Dict[str, Any]]):
+        self._kinds: Dict[str, List[BonusEntry]] = {}
+        self._gives: Dict[str, List[Tuple[str, int]]] = {}
+        self._requires: Dict[str, List[Tuple[str, int]]] = {}
+        self._weapons: Dict[str, List[Tuple[str, int]]] = {}
+
+        for c in constellations:
+            name = c['name']
+            for a, v in c['affinity_bonus'].items():
+                self._gives.setdefault(a, []).append((name, v))
+            for a, v in c['affinity_required'].items():
+                self._requires.setdefault(a, []).append((name, v))
+            for s, skill in c['skills'].items():
+                star = int(s)
+                for b in skill.get('bonuses', ()):
+                    self._kinds.setdefault(b.kind_id(), []).append(BonusEntry(name, star, bonus_amount(b), b))
+                for w in skill.get('weapon_requirement', ()):
+                    self._weapons.setdefault(w, []).append((name, star))
+
+        # largest first, bonuses without an amount last; ties keep document order
+        for entries in self._kinds.values():
+            entries.sort(key=lambda e: (e.amount is None, -(e.amount or 0.)))
+        for entries in (*self._gives.values(), *self._requires.values()):
+            entries.sort(key=lambda e: -e[1])
+        self._sorted_kinds = sorted(self._kinds)
+
+    def kind_ids(self) -> List[str]:
+        return self._sorted_kinds
+
+    def kind_ids_matching(self, prefix: str) -> List[str]:
+        i = bisect_left(self._sorted_kinds, prefix)
+        j = i
+        while j < len(self._sorted_kinds) and self._sorted_kinds[j].startswith(prefix):
+            j += 1
+        return self._sorted_kinds[i:j]
+
+    def by_kind(self, kind_id: str) -> List[BonusEntry]:
+        # every star granting a bonus of this kind, largest amount first
+        return self._kinds.get(kind_id, [])
+
+    def giving_affinity(self, affinity: str) -> List[Tuple[str, int]]:
+        # (constellation, affinity given on completion), largest first
+        return self._gives.get(affinity.lower(), [])
+
+    def requiring_affinity(self, affinity: str) -> List[Tuple[str, int]]:
+        # (constellation, affinity required), largest first
+        return self._requires.get(affinity.lower(), [])
+
+    def by_weapon_requirement(self, weapon: str) -> List[Tuple[str, int]]:
+        # (constellation, star) of every star that needs this weapon type
+        return self._weapons.get(weapon, [])
+
+    def weapon_requirements(self) -> List[str]:
+        return sorted(self._weapons)
+
+
+@cache
+def load_constellation_index() -> ConstellationIndex:
+    return ConstellationIndex(load_constellation_bonuses())
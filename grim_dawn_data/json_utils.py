@@ -1,5 +1,13 @@
-from typing import Dict, Any
+from pathlib import Path
+from typing import Dict, Any, Iterable, Iterator, Optional, Tuple
+import codecs
 import json
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 _JSON_CLASS_TO_TAG = {
     set: "set",
@@ -17,31 +25,63 @@ _CONVERT_FROM_JSON = {
     "frozenset": frozenset,
 }
 
+# class -> (tag, convert), the lookup serialize_json does for every object the encoder can't handle
+_ENCODERS = {cls: (_JSON_CLASS_TO_TAG[cls], convert) for cls, convert in _CONVERT_TO_JSON.items()}
+
 TYPE_FIELD = "__type__"
 DATA_FIELD = "data"
 
+JSON_BACKENDS = ("orjson", "json")
+_backend = "json" if orjson is None else "orjson"
+
+def _slot_fields(cls) -> Optional[Tuple[str, ...]]:
+    fields = []
+    for c in reversed(cls.__mro__[:-1]):
+        slots = c.__dict__.get('__slots__')
+        if slots is None:
+            return None
+        if isinstance(slots, str):
+            slots = (slots, )
+        if '__dict__' in slots:
+            return None
+        fields.extend(f for f in slots if f != '__weakref__')
+    return tuple(fields)
+
 class JsonSerializable:
+    __slots__ = ()
+
     def __init_subclass__(cls, json_tag=None, **kwargs):
         json_tag = json_tag or cls.__name__
         if json_tag in _JSON_TAG_TO_CLASS:
             raise ValueError(f"tag `{json_tag}` is already used for type {_JSON_TAG_TO_CLASS[json_tag]}")
 
+        # None for classes whose instances carry a __dict__
+        cls.json_fields = _slot_fields(cls)
+
         _JSON_TAG_TO_CLASS[json_tag] = cls
         _JSON_CLASS_TO_TAG[cls] = json_tag
         _CONVERT_FROM_JSON[json_tag] = cls.from_json_dict
         _CONVERT_TO_JSON[cls] = lambda c : c.to_json_dict()
+        _ENCODERS[cls] = (json_tag, _CONVERT_TO_JSON[cls])
 
     def to_json_dict(self):
-        return self.__dict__
+        if self.json_fields is None:
+            return self.__dict__
+        return {f: getattr(self, f) for f in self.json_fields}
 
     @classmethod
     def from_json_dict(cls, data: Dict[str, Any]):
         return cls(**data)
 
+def json_tag(cls) -> str:
+    return _JSON_CLASS_TO_TAG[cls]
+
+def json_class(tag: str):
+    return _JSON_TAG_TO_CLASS[tag]
+
 def serialize_json(obj):
     try:
-        convert = _CONVERT_TO_JSON[obj.__class__]
-        tag = _JSON_CLASS_TO_TAG[obj.__class__]
+        tag, convert = _ENCODERS[obj.__class__]
     except KeyError:
         return obj
     else:
@@ -59,16 +99,185 @@ def deserialize_json(obj):
     convert = _CONVERT_FROM_JSON[tag]
     return convert(obj[DATA_FIELD])
 
+def get_json_backend() -> str:
+    return _backend
+
+def set_json_backend(name: str):
+    global _backend
+    if name not in JSON_BACKENDS:
+        raise ValueError(f"unknown JSON backend `{name}`, expected one of {JSON_BACKENDS}")
+    if name == "orjson" and orjson is None:
+        raise ImportError("orjson is not installed")
+    _backend = name
+
+def _decode_tree(obj):
+    # the same bottom-up conversion as deserialize_json, applied to an already parsed document
+    if type(obj) is dict:
+        for k, v in obj.items():
+            if type(v) is dict or type(v) is list:
+                obj[k] = _decode_tree(v)
+        if TYPE_FIELD in obj:
+            return _CONVERT_FROM_JSON[obj[TYPE_FIELD]](obj[DATA_FIELD])
+    elif type(obj) is list:
+        for i, v in enumerate(obj):
+            if type(v) is dict or type(v) is list:
+                obj[i] = _decode_tree(v)
+    return obj
+
+def _loads(s):
+    if _backend == "orjson":
+        try:
+            return _decode_tree(orjson.loads(s))
+        except orjson.JSONDecodeError:
+            # e.g. NaN or integers beyond 64 bits, which the stdlib parser accepts
+            pass
+    return json.loads(s, object_hook=deserialize_json)
+
+def _loads_untyped(s):
+    if _backend == "orjson":
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(s)
+
+# anchored on the 'e' rather than the digit, which keeps the scan over long documents cheap
+_EXPONENT = re.compile(r'e(?<=[0-9]e)[-+]?[0-9]')
+
+def _escape_char(c: str) -> str:
+    n = ord(c)
+    if n < 0x10000:
+        return f'\\u{n:04x}'
+    n -= 0x10000
+    return f'\\u{0xd800 | (n >> 10):04x}\\u{0xdc00 | (n & 0x3ff):04x}'
+
+def _ascii_escape_errors(e: UnicodeEncodeError):
+    return ''.join(map(_escape_char, e.object[e.start:e.end])), e.end
+
+codecs.register_error("grim_dawn_data.json_escape", _ascii_escape_errors)
+
+def _ensure_ascii(s: str) -> str:
+    # escapes what the stdlib encoder escapes with ensure_ascii, outside of control characters
+    if '\x7f' in s:
+        s = s.replace('\x7f', '\\u007f')
+    if s.isascii():
+        return s
+    return s.encode('ascii', "grim_dawn_data.json_escape").decode('ascii')
+
+def _all_finite(obj) -> bool:
+    # the compact stdlib encoder runs in C, so this is still far cheaper than the indenting one
+    try:
+        json.dumps(obj, default=serialize_json, allow_nan=False, check_circular=False)
+    except ValueError:
+        return False
+    return True
+
+def _dumps(obj, indent: bool = True) -> str:
+    if _backend == "orjson":
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        try:
+            s = orjson.dumps(obj, default=serialize_json, option=option).decode()
+        except orjson.JSONEncodeError:
+            pass
+        else:
+            # orjson writes exponents as 1e-5 where the stdlib writes 1e-05, and NaN and
+            # Infinity as null, so anything that looks like either goes through the stdlib
+            # encoder
+            if not _EXPONENT.search(s) and ('null' not in s or _all_finite(obj)):
+                return _ensure_ascii(s)
+    if indent:
+        return json.dumps(obj, default=serialize_json, indent='  ')
+    return json.dumps(obj, default=serialize_json, separators=(',', ':'))
+
 def load_json(path):
-    with open(path, 'r') as fp:
-        return json.load(fp, object_hook=deserialize_json)
+    with open(path, 'rb' if _backend == "orjson" else 'r') as fp:
+        return _loads(fp.read())
 
 def loads_json(s: str):
-    return json.loads(s, object_hook=deserialize_json)
+    return _loads(s)
+
+# tagged objects are left as {"__type__": ..., "data": ...} dicts, for decoders that know
+# where to expect them
+def load_json_untyped(path):
+    with open(path, 'rb' if _backend == "orjson" else 'r') as fp:
+        return _loads_untyped(fp.read())
+
+def loads_json_untyped(s: str):
+    return _loads_untyped(s)
 
 def dump_json(obj, path) -> str:
     with open(path, 'w') as fp:
-        json.dump(obj, fp, default=serialize_json, indent='  ')
+        fp.write(_dumps(obj))
 
 def dumps_json(obj: object) -> str:
-    return json.dumps(obj, default=serialize_json, indent='  ')
+    return _dumps(obj)
+
+def dumps_json_line(obj: object) -> str:
+    # compact, so the document never spans more than one line
+    return _dumps(obj, indent=False)
+
+class NdjsonWriter:
+    # writes one JSON document per line, e.g. one constellation at a time as it is produced.
+    # Each line is flushed as it is written, so readers can start before the writer is done.
+    def __init__(self, fp, flush: bool = True):
+        self.fp = fp
+        self.flush = flush
+        self.count = 0
+
+    def write(self, obj):
+        self.fp.write(dumps_json_line(obj) + '\n')
+        if self.flush:
+            self.fp.flush()
+        self.count += 1
+
+def dump_ndjson(objs: Iterable, path, flush: bool = True) -> int:
+    with open(path, 'w') as fp:
+        writer = NdjsonWriter(fp, flush)
+        for obj in objs:
+            writer.write(obj)
+    return writer.count
+
+def load_ndjson(path) -> Iterator:
+    with open(path, 'rb' if _backend == "orjson" else 'r') as fp:
+        for line in fp:
+            if line.strip():
+                yield _loads(line)
+
+def iter_json_records(path) -> Iterator:
+    # the elements of a top-level JSON array, or the lines of an .ndjson file
+    if Path(path).suffix == ".ndjson":
+        return load_ndjson(path)
+    return iter(load_json(path))
+
+class JsonObjectWriter:
+    # writes a JSON object one member at a time; with indent='  ' the output matches dump_json
+    def __init__(self, fp, indent: Optional[str] = '  '):
+        self.fp = fp
+        self.indent = indent
+        if indent is None:
+            self._separator = ','
+            self._key_separator = ':'
+            self._end = '}'
+        else:
+            self._separator = ',\n' + indent
+            self._key_separator = ': '
+            self._end = '\n}'
+        self._count = 0
+
+    def write(self, key: str, value):
+        self.fp.write(self._separator if self._count else '{' + self._separator[1:])
+        if self.indent is None:
+            v = json.dumps(value, default=serialize_json, separators=(',', ':'))
+        else:
+            v = json.dumps(value, default=serialize_json, indent=self.indent).replace('\n', '\n' + self.indent)
+        self.fp.write(json.dumps(key) + self._key_separator + v)
+        self._count += 1
+
+    def close(self):
+        self.fp.write(self._end if self._count else '{}')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
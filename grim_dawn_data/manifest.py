@@ -0,0 +1,82 @@
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Any
+import hashlib
+import json
+import os
+from . import DATA_DIRECTORY, _replace_file
+
+MANIFEST_FILE = DATA_DIRECTORY / "build-manifest.json"
+MANIFEST_VERSION = 1
+
+
+def hash_file(p) -> str:
+    h = hashlib.sha1()
+    with open(p, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(1 << 16), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class BuildManifest:
+    def __init__(self, path=MANIFEST_FILE):
+        self.path = Path(path)
+        try:
+            with open(self.path, 'r') as fp:
+                data = json.load(fp)
+        except (FileNotFoundError, json.JSONDecodeError):
+            data = {}
+
+        if data.get("version") != MANIFEST_VERSION:
+            data = {}
+
+        # path -> [size, mtime_ns, sha1], so unchanged files are not re-read
+        self._files: Dict[str, list] = data.get("files", {})
+        self.stages: Dict[str, Dict[str, Any]] = data.get("stages", {})
+
+    def hash(self, p) -> Optional[str]:
+        key = Path(p).as_posix()
+        try:
+            st = os.stat(p)
+        except FileNotFoundError:
+            self._files.pop(key, None)
+            return None
+
+        cached = self._files.get(key)
+        if cached is not None and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+
+        digest = hash_file(p)
+        self._files[key] = [st.st_size, st.st_mtime_ns, digest]
+        return digest
+
+    def hash_files(self, paths: Iterable) -> Dict[str, Optional[str]]:
+        return {Path(p).as_posix(): self.hash(p) for p in sorted(paths)}
+
+    def is_up_to_date(self, stage: str, inputs: Dict[str, Optional[str]]) -> bool:
+        entry = self.stages.get(stage)
+        if entry is None or entry["inputs"] != inputs:
+            return False
+        return self.outputs_unchanged(stage)
+
+    def state(self, stage: str) -> Dict[str, Any]:
+        entry = self.stages.get(stage)
+        if entry is None:
+            return {}
+        return entry.get("state", {})
+
+    def outputs_unchanged(self, stage: str) -> bool:
+        entry = self.stages.get(stage)
+        if entry is None:
+            return False
+        return all(self.hash(p) == h for p, h in entry["outputs"].items())
+
+    def record(self, stage: str, inputs: Dict[str, Optional[str]], outputs: Iterable, state: Dict[str, Any] = None):
+        self.stages[stage] = {
+            "inputs": inputs,
+            "outputs": self.hash_files(outputs),
+            "state": state or {},
+        }
+
+    def save(self):
+        with _replace_file(self.path) as fp:
+            json.dump({"version": MANIFEST_VERSION, "files": self._files, "stages": self.stages}, fp, indent='  ')
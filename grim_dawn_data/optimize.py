@@ -0,0 +1,413 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from . import load_constellation_bonuses
+from .bonuses import Bonus, Pets
+import operator
+
+DEVOTION_POINTS = 55
+AFFINITIES = ("ascendant", "chaos", "eldritch", "order", "primordial")
+
+
+MAX_SEARCH_NODES = 100000
+SUPPORT_SEARCH_LIMIT = 20000
+
+
+class SearchLimitReached(Exception):
+    pass
+
+
+def star_value(bonuses: Iterable[Bonus], weights: Dict[str, float]) -> float:
+    value = 0.
+    for b in bonuses:
+        if not b.is_aggregatable():
+            continue
+        w = weights.get(b.kind_id())
+        if w:
+            inner = b.bonus if isinstance(b, Pets) else b
+            value += w * getattr(inner, inner.aggregate_fields[0])
+    return value
+
+
+def _affinity_vector(affinities: Dict[str, int]) -> Tuple[int, ...]:
+    unknown = set(affinities) - set(AFFINITIES)
+    if unknown:
+        raise ValueError(f"unknown affinities: {unknown}")
+    return tuple(affinities.get(a, 0) for a in AFFINITIES)
+
+
+def _add(a: Tuple[int, ...], b: Tuple[int, ...]) -> Tuple[int, ...]:
+    return tuple(map(operator.add, a, b))
+
+
+def _max(a: Tuple[int, ...], b: Tuple[int, ...]) -> Tuple[int, ...]:
+    return tuple(map(max, a, b))
+
+
+def _satisfied(total: Tuple[int, ...], need: Tuple[int, ...]) -> bool:
+    return all(map(operator.ge, total, need))
+
+
+def _missing(total, need) -> int:
+    return sum(max(n - t, 0) for t, n in zip(total, need))
+
+
+def _affinity_cost(total, need, ratio, ratio_sum) -> float:
+    # lower bound on the points needed to make up the missing affinity, given the best
+    # affinity per point available for each affinity and summed over all of them
+    cost = 0.
+    missing = 0
+    for t, n, r in zip(total, need, ratio):
+        if n > t:
+            if r == 0:
+                return float('inf')
+            cost = max(cost, (n - t) / r)
+            missing += n - t
+    if missing:
+        cost = max(cost, missing / ratio_sum)
+    return cost
+
+
+def _fractional_cost(amount: int, items: List[Tuple[int, int]]) -> float:
+    # fewest points that give `amount` from (given, points) items that can be taken in part
+    cost = 0.
+    for given, points in sorted(items, key=lambda i: -i[0] / i[1]):
+        if given <= 0:
+            break
+        if given >= amount:
+            return cost + points * amount / given
+        amount -= given
+        cost += points
+    return cost if amount <= 0 else float('inf')
+
+
+class _Constellation:
+    def __init__(self, c: Dict[str, Any], weights: Dict[str, float]):
+        self.name = c['name']
+        self.size = len(c['skills'])
+        self.required = _affinity_vector(c['affinity_required'])
+        self.bonus = _affinity_vector(c['affinity_bonus'])
+        # affinity needed from the other completed constellations to keep this one complete
+        self.complete_need = _add(self.required, self.bonus)
+
+        values = [star_value(c['skills'][str(s)].get('bonuses', []), weights) for s in range(self.size)]
+        pred_mask = [0] * self.size
+        for dst, src in c['pred'].items():
+            pred_mask[int(dst)] = 1 << src
+
+        # best star subset closed under `pred` for every number of stars
+        best = [None] * (self.size + 1)
+        for subset in range(1 << self.size):
+            stars = [s for s in range(self.size) if subset >> s & 1]
+            if any(pred_mask[s] & ~subset for s in stars):
+                continue
+            v = sum(values[s] for s in stars)
+            k = len(stars)
+            if best[k] is None or v > best[k][0]:
+                best[k] = (v, stars)
+
+        self.best = best
+        self.values = [v for v, _ in best]
+        self.has_value = any(v != 0 for v in values)
+
+        # options as (stars, value, completed), most valuable first; partial selections that
+        # are no better than a smaller one are dropped
+        options = [(self.size, self.values[-1], True)]
+        top = 0.
+        for k in range(1, self.size):
+            if self.values[k] > top:
+                top = self.values[k]
+                options.append((k, self.values[k], False))
+        options.append((0, 0., False))
+        self.options = sorted(options, key=lambda o: -o[1])
+
+    def hull(self) -> List[Tuple[int, float]]:
+        # upper concave hull of (stars, best value) as (width, slope) segments
+        hull = [(0, 0.)]
+        for k in range(1, self.size + 1):
+            p = (k, self.values[k])
+            while len(hull) >= 2:
+                (x0, y0), (x1, y1) = hull[-2], hull[-1]
+                if (y1 - y0) * (p[0] - x0) <= (p[1] - y0) * (x1 - x0):
+                    hull.pop()
+                else:
+                    break
+            hull.append(p)
+        return [(x1 - x0, (y1 - y0) / (x1 - x0)) for (x0, y0), (x1, y1) in zip(hull, hull[1:])]
+
+
+class DevotionPlan:
+    def __init__(self, stars: Dict[str, List[int]], value: float, affinity: Dict[str, int], optimal: bool):
+        self.stars = stars
+        self.value = value
+        self.affinity = affinity
+        self.optimal = optimal
+
+    @property
+    def points(self) -> int:
+        return sum(len(s) for s in self.stars.values())
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(value={self.value}, points={self.points}, stars={self.stars})"
+
+
+class _Search:
+    def __init__(self, constellations: List[_Constellation], points: int, max_nodes: Optional[int]):
+        valued = [c for c in constellations if c.has_value]
+        # constellations that only matter for the affinity they give
+        self.support = sorted((c for c in constellations if not c.has_value), key=lambda c: c.size)
+
+        hulls = {id(c): c.hull() for c in valued}
+        valued.sort(key=lambda c: -max((s for _, s in hulls[id(c)]), default=0.))
+        self.order = valued
+        segments = sorted(
+            ((s, w, i) for i, c in enumerate(valued) for w, s in hulls[id(c)] if s > 0),
+            reverse=True
+        )
+        # hull segments of the undecided constellations, by position in self.order
+        self.segments = [[(s, w) for s, w, j in segments if j >= i] for i in range(len(valued) + 1)]
+
+        zero = (0, ) * len(AFFINITIES)
+        # affinity beyond the largest requirement never matters
+        self.cap = zero
+        for c in constellations:
+            self.cap = _max(self.cap, c.complete_need)
+
+        # for the undecided constellations, by position in self.order: the affinity they could
+        # still provide, and the best affinity per point for each affinity and summed over all
+        ratio = lambda c: tuple(b / c.size for b in c.bonus)
+        self.reachable = [zero] * (len(valued) + 1)
+        self.ratio = [zero] * (len(valued) + 1)
+        self.ratio_sum = [0.] * (len(valued) + 1)
+        for c in self.support:
+            self.reachable[-1] = _add(self.reachable[-1], c.bonus)
+            self.ratio[-1] = _max(self.ratio[-1], ratio(c))
+            self.ratio_sum[-1] = max(self.ratio_sum[-1], sum(ratio(c)))
+        for i in range(len(valued) - 1, -1, -1):
+            c = valued[i]
+            self.reachable[i] = _add(self.reachable[i + 1], c.bonus)
+            self.ratio[i] = _max(self.ratio[i + 1], ratio(c))
+            self.ratio_sum[i] = max(self.ratio_sum[i + 1], sum(ratio(c)))
+
+        # support constellations by index: for each affinity the ones that give it, and for each
+        # one a bit mask of those before it (so no larger) that give at least as much affinity and
+        # require no more
+        self.providers = [[j for j, c in enumerate(self.support) if c.bonus[a] > 0] for a in range(len(AFFINITIES))]
+        self.dominated_by = [
+            sum(1 << i for i, d in enumerate(self.support[:j])
+                if _satisfied(d.bonus, c.bonus) and _satisfied(c.required, d.required))
+            for j, c in enumerate(self.support)
+        ]
+        # (capped total, need) -> (largest budget known to be too small, cheapest support found)
+        self._supports = {}
+        self._support_nodes = 0
+        # set when a support search gave up without finding one, so the plan may not be optimal
+        self.truncated = False
+
+        self.points = points
+        self.max_nodes = max_nodes
+        self.nodes = 0
+        self.best_value = None
+        self.best = None
+
+    def bound(self, i: int, budget: int) -> float:
+        # LP relaxation of choosing at most one star count per constellation
+        total = 0.
+        for slope, width in self.segments[i]:
+            if width >= budget:
+                return total + budget * slope
+            total += width * slope
+            budget -= width
+        return total
+
+    def affinity_cost(self, i: int, total, need) -> float:
+        return _affinity_cost(total, need, self.ratio[i], self.ratio_sum[i])
+
+    def _cap(self, total):
+        return tuple(map(min, total, self.cap))
+
+    def find_support(self, total, need, budget) -> Optional[List[_Constellation]]:
+        # only whether a support fits in the budget matters, so results are kept as the
+        # largest budget known to be too small and the cheapest support found, and reused for
+        # any budget they decide
+        key = (self._cap(total), need)
+        too_small, cheapest = self._supports.get(key, (-1, None))
+        if cheapest is not None and sum(c.size for c in cheapest) <= budget:
+            return cheapest
+        if budget <= too_small:
+            return None
+
+        found = self._greedy_support(*key, budget)
+        if found is None:
+            self._support_nodes = 0
+            try:
+                found = self._branch_support(*key, budget, 0, [])
+            except SearchLimitReached:
+                # not known to be infeasible, so nothing is recorded
+                self.truncated = True
+                return None
+        if found is None:
+            too_small = budget
+        else:
+            cheapest = found
+        self._supports[key] = (too_small, cheapest)
+        return found
+
+    def _greedy_support(self, total, need, budget) -> Optional[List[_Constellation]]:
+        # repeatedly complete the support constellation that removes the most missing affinity
+        # per point, accounting for the affinity it needs itself
+        chosen = []
+        missing = _missing(total, need)
+        while missing:
+            best = None
+            for c in self.support:
+                if c.size > budget or c in chosen:
+                    continue
+                t = self._cap(_add(total, c.bonus))
+                n = _max(need, c.complete_need)
+                gain = (missing - _missing(t, n)) / c.size
+                if gain > 0 and (best is None or gain > best[0]):
+                    best = (gain, c, t, n)
+
+            if best is None:
+                return None
+            _, c, total, need = best
+            chosen.append(c)
+            budget -= c.size
+            missing = _missing(total, need)
+        return chosen
+
+    def _support_cost(self, total, need, used: int) -> float:
+        # lower bound on the points needed from the support constellations still available: a
+        # fractional knapsack over what each gives towards the missing affinity, in total and
+        # for each affinity on its own
+        missing = [max(n - t, 0) for t, n in zip(total, need)]
+        useful = set()
+        cost = 0.
+        for a, m in enumerate(missing):
+            if m:
+                available = [j for j in self.providers[a] if not used >> j & 1]
+                useful.update(available)
+                cost = max(cost, _fractional_cost(m, [(self.support[j].bonus[a], self.support[j].size) for j in available]))
+        items = []
+        for j in useful:
+            c = self.support[j]
+            items.append((sum(map(min, c.bonus, missing)), c.size))
+        return max(cost, _fractional_cost(sum(missing), items))
+
+    def _branch_support(self, total, need, budget: int, used: int, chosen: List[_Constellation]) -> Optional[List[_Constellation]]:
+        # some constellation still to be chosen has to give the missing affinity with the fewest
+        # candidates, so the search branches on which one; the candidates passed over are left
+        # out of the later branches, and so is any candidate one of them dominates
+        missing = [a for a, (t, n) in enumerate(zip(total, need)) if n > t]
+        if not missing:
+            return chosen
+
+        self._support_nodes += 1
+        if self._support_nodes > SUPPORT_SEARCH_LIMIT:
+            raise SearchLimitReached
+        if self._support_cost(total, need, used) > budget:
+            return None
+
+        candidates = min(([j for j in self.providers[a] if not used >> j & 1] for a in missing), key=len)
+        passed = 0
+        for j in candidates:
+            c = self.support[j]
+            if c.size > budget:
+                break
+            if not passed & self.dominated_by[j]:
+                found = self._branch_support(self._cap(_add(total, c.bonus)), _max(need, c.complete_need),
+                                             budget - c.size, used | passed | 1 << j, chosen + [c])
+                if found is not None:
+                    return found
+            passed |= 1 << j
+        return None
+
+    def _accept(self, value: float, chosen: List[Tuple[_Constellation, int]], support: List[_Constellation]):
+        self.best_value = value
+        self.best = chosen + [(c, c.size) for c in support]
+
+    def greedy(self):
+        # a quick feasible plan, so that the bound prunes from the start
+        zero = (0, ) * len(AFFINITIES)
+        budget, value, total, need = self.points, 0., zero, zero
+        taken = {}
+        while True:
+            best = None
+            for c in self.order:
+                k0 = taken.get(c, 0)
+                for k, v, completed in c.options:
+                    gain = v - c.values[k0]
+                    if k <= k0 or k - k0 > budget or gain <= 0:
+                        continue
+                    if best is not None and gain / (k - k0) <= best[0]:
+                        continue
+                    t = _add(total, c.bonus) if completed else total
+                    n = _max(need, c.complete_need if completed else c.required)
+                    if self.find_support(t, n, budget - (k - k0)) is not None:
+                        best = (gain / (k - k0), c, k, t, n)
+
+            if best is None:
+                break
+            _, c, k, total, need = best
+            budget -= k - taken.get(c, 0)
+            value += c.values[k] - c.values[taken.get(c, 0)]
+            taken[c] = k
+
+        self._accept(value, list(taken.items()), self.find_support(total, need, budget))
+
+    def run(self):
+        zero = (0, ) * len(AFFINITIES)
+        self.greedy()
+        self.search(0, self.points, 0., zero, zero, [])
+
+    def search(self, i: int, budget: int, value: float, total, need, chosen):
+        self.nodes += 1
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise SearchLimitReached
+
+        if self.best_value is not None and value + self.bound(i, budget) <= self.best_value:
+            return
+        if not _satisfied(_add(total, self.reachable[i]), need):
+            return
+        if self.affinity_cost(i, total, need) > budget:
+            return
+
+        if i == len(self.order):
+            support = self.find_support(total, need, budget)
+            if support is not None:
+                self._accept(value, chosen, support)
+            return
+
+        c = self.order[i]
+        for k, v, completed in c.options:
+            if k > budget:
+                continue
+            if k == 0:
+                self.search(i + 1, budget, value, total, need, chosen)
+            elif completed:
+                self.search(i + 1, budget - k, value + v, _add(total, c.bonus), _max(need, c.complete_need), chosen + [(c, k)])
+            else:
+                self.search(i + 1, budget - k, value + v, total, _max(need, c.required), chosen + [(c, k)])
+
+
+def optimize_devotions(weights: Dict[str, float], points: int = DEVOTION_POINTS,
+                       constellations: List[Dict[str, Any]] = None, max_nodes: Optional[int] = MAX_SEARCH_NODES) -> Optional[DevotionPlan]:
+    if constellations is None:
+        constellations = load_constellation_bonuses()
+
+    search = _Search([_Constellation(c, weights) for c in constellations], points, max_nodes)
+    optimal = True
+    try:
+        search.run()
+    except SearchLimitReached:
+        optimal = False
+    optimal = optimal and not search.truncated
+
+    if search.best is None:
+        return None
+
+    stars = {c.name: c.best[k][1] for c, k in search.best}
+    affinity = (0, ) * len(AFFINITIES)
+    for c, k in search.best:
+        if k == c.size:
+            affinity = _add(affinity, c.bonus)
+    return DevotionPlan(stars, search.best_value, dict(zip(AFFINITIES, affinity)), optimal)
@@ -0,0 +1,167 @@
+from pathlib import Path, PurePosixPath
+from typing import Any, Collection, Dict, Iterable, List, Optional, Set, Tuple
+import hashlib
+import json
+import os
+import tarfile
+from . import _replace_file
+from .dbr import DbrRecord, parse_dbr
+
+# record directories the constellation pipeline reads, relative to a records/ directory
+DEVOTION_RECORD_PREFIXES = ("ui/skills/devotion/", "skills/devotion/")
+
+
+class RecordSource:
+    # a records/ directory of one database; records are named by their posix path relative to it
+    def path(self, rel: str) -> PurePosixPath:
+        raise NotImplementedError
+
+    def exists(self, rel: str) -> bool:
+        raise NotImplementedError
+
+    def read_bytes(self, rel: str) -> bytes:
+        raise NotImplementedError
+
+    def read_text(self, rel: str) -> str:
+        return self.read_bytes(rel).decode()
+
+    def digest(self, rel: str) -> str:
+        return hashlib.sha1(self.read_bytes(rel)).hexdigest()
+
+    def list_dir(self, rel_dir: str) -> List[str]:
+        raise NotImplementedError
+
+    def read_dbr(self, rel: str, prefixes: Iterable[str] = None, keys: Collection[str] = None) -> DbrRecord:
+        return parse_dbr(self.read_text(rel), str(self.path(rel)), prefixes, keys)
+
+
+class DirectoryRecordSource(RecordSource):
+    def __init__(self, root, indexed: Iterable[str] = DEVOTION_RECORD_PREFIXES):
+        self.root = Path(root)
+        # directories listed once on first use, so existence checks under them need no syscalls
+        self.indexed = tuple(indexed)
+        self._files: Optional[Set[str]] = None
+
+    def _index(self) -> Set[str]:
+        if self._files is None:
+            files = set()
+            for prefix in self.indexed:
+                for dirpath, _, filenames in os.walk(self.root / prefix):
+                    rel_dir = Path(dirpath).relative_to(self.root).as_posix()
+                    files.update(f"{rel_dir}/{f}" for f in filenames)
+            self._files = files
+        return self._files
+
+    def path(self, rel: str) -> Path:
+        return self.root / rel
+
+    def exists(self, rel: str) -> bool:
+        if rel.startswith(self.indexed):
+            return rel in self._index()
+        return (self.root / rel).exists()
+
+    def read_bytes(self, rel: str) -> bytes:
+        with open(self.root / rel, 'rb') as fp:
+            return fp.read()
+
+    def list_dir(self, rel_dir: str) -> List[str]:
+        return sorted(f"{rel_dir}/{p.name}" for p in (self.root / rel_dir).iterdir() if p.is_file())
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({str(self.root)!r})"
+
+
+class ArchiveRecordSource(RecordSource):
+    # records held in memory after a single pass over a tar archive; the member index doubles
+    # as the existence check
+    def __init__(self, root: str, records: Dict[str, bytes]):
+        self.root = PurePosixPath(root)
+        self.records = records
+
+    def path(self, rel: str) -> PurePosixPath:
+        return self.root / rel
+
+    def exists(self, rel: str) -> bool:
+        return rel in self.records
+
+    def read_bytes(self, rel: str) -> bytes:
+        try:
+            return self.records[rel]
+        except KeyError:
+            raise FileNotFoundError(str(self.path(rel))) from None
+
+    def list_dir(self, rel_dir: str) -> List[str]:
+        prefix = rel_dir + "/"
+        return sorted(r for r in self.records if r.startswith(prefix) and "/" not in r[len(prefix):])
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({str(self.root)!r}, {len(self.records)} records)"
+
+
+def as_record_source(source) -> RecordSource:
+    if isinstance(source, RecordSource):
+        return source
+    return DirectoryRecordSource(source)
+
+
+def read_archive_sources(archive, prefixes: Iterable[str] = DEVOTION_RECORD_PREFIXES) -> List[ArchiveRecordSource]:
+    # streams the archive once and keeps only the records under `prefixes`, one source per
+    # .../records/ directory, so nothing is extracted to disk
+    prefixes = tuple(prefixes)
+    sources: Dict[str, Dict[str, bytes]] = {}
+    with tarfile.open(archive, 'r|*') as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            root, sep, rel = member.name.partition("/records/")
+            if not sep or not rel.startswith(prefixes):
+                continue
+            root = root + "/records"
+            sources.setdefault(root, {})[rel] = tar.extractfile(member).read()
+    return [ArchiveRecordSource(root, records) for root, records in sorted(sources.items())]
+
+
+class RecordCache:
+    # parse results keyed by (kind, content digest), persisted as JSON. Entries are only valid
+    # for one namespace, e.g. a hash of the parser and of the tags it resolves names with.
+    def __init__(self, path=None, namespace: str = None):
+        self.path = None if path is None else Path(path)
+        self.namespace = namespace
+        self.entries: Dict[str, Any] = {}
+        self._new: Dict[str, Any] = {}
+        self.hits = 0
+        self.misses = 0
+        if self.path is not None:
+            try:
+                with open(self.path, 'r') as fp:
+                    data = json.load(fp)
+            except (FileNotFoundError, json.JSONDecodeError):
+                data = {}
+            if data.get("namespace") == namespace:
+                self.entries = data.get("entries", {})
+
+    def get(self, kind: str, digest: str) -> Tuple[bool, Any]:
+        key = f"{kind}:{digest}"
+        if key in self.entries:
+            self.hits += 1
+            return True, self.entries[key]
+        self.misses += 1
+        return False, None
+
+    def put(self, kind: str, digest: str, value: Any):
+        key = f"{kind}:{digest}"
+        self.entries[key] = value
+        self._new[key] = value
+
+    def take_new(self) -> Dict[str, Any]:
+        new, self._new = self._new, {}
+        return new
+
+    def merge(self, entries: Dict[str, Any]):
+        self.entries.update(entries)
+
+    def save(self):
+        if self.path is None:
+            return
+        with _replace_file(self.path) as fp:
+            json.dump({"namespace": self.namespace, "entries": self.entries}, fp)
@@ -0,0 +1,102 @@
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, Iterator, List, Optional, Tuple, get_type_hints
+from .bonuses import Bonus
+from .json_utils import DATA_FIELD, TYPE_FIELD, json_class, load_json_untyped, loads_json_untyped
+
+# Decoder for the constellation-bonuses document, which only holds tagged objects in
+# skills[*].bonuses. The document is parsed without a hook and the Bonus objects are built
+# directly from their fields, checked against the registered classes.
+
+# json tag -> (class, fields, field set, fields holding a nested Bonus, field -> accepted types)
+_DECODERS: Dict[str, Tuple[type, Tuple[str, ...], FrozenSet[str], FrozenSet[str], Dict[str, Tuple[type, ...]]]] = {}
+
+# constructor annotation -> the JSON values accepted for the field; fields with any other
+# annotation take any scalar
+_FIELD_TYPES = {
+    float: (float, int),
+    str: (str, ),
+    Optional[float]: (float, int, type(None)),
+}
+_SCALARS = (str, float, int, type(None))
+
+
+def _bonus_decoder(tag: str):
+    try:
+        return _DECODERS[tag]
+    except KeyError:
+        pass
+    try:
+        cls = json_class(tag)
+    except KeyError:
+        raise ValueError(f"unknown bonus type `{tag}`") from None
+    if not issubclass(cls, Bonus) or cls.json_fields is None:
+        raise ValueError(f"`{tag}` is not a bonus type")
+    hints = get_type_hints(cls.__init__)
+    types = {f: _FIELD_TYPES.get(hints.get(f), _SCALARS) for f in cls.json_fields}
+    d = _DECODERS[tag] = (cls, cls.json_fields, frozenset(cls.json_fields), frozenset(cls.bonus_fields), types)
+    return d
+
+
+def decode_bonus(obj: Dict[str, Any]) -> Bonus:
+    try:
+        tag = obj[TYPE_FIELD]
+        data = obj[DATA_FIELD]
+    except (KeyError, TypeError):
+        raise ValueError(f"expected a tagged bonus, got {obj!r}") from None
+    if type(tag) is not str:
+        raise ValueError(f"expected a bonus type, got {tag!r:.80}")
+    cls, fields, field_set, nested, types = _bonus_decoder(tag)
+    if type(data) is not dict or data.keys() != field_set:
+        raise ValueError(f"{tag}: expected the fields {list(fields)}, got {data!r}")
+
+    b = cls.__new__(cls)
+    for f in fields:
+        v = data[f]
+        if f in nested:
+            v = decode_bonus(v)
+        elif type(v) not in types[f]:
+            # bool is not accepted where a number is, the check is on the exact type
+            raise ValueError(f"{tag}.{f}: expected {' or '.join(t.__name__ for t in types[f])}, got {v!r:.80}")
+        setattr(b, f, v)
+    return b
+
+
+def decode_constellation(c: Dict[str, Any]) -> Dict[str, Any]:
+    # in place
+    if type(c) is not dict or type(c.get("skills")) is not dict:
+        raise ValueError(f"expected a constellation, got {c!r:.80}")
+    for skill in c["skills"].values():
+        bonuses = skill.get("bonuses")
+        if bonuses is None:
+            continue
+        if type(bonuses) is not list:
+            raise ValueError(f"{c.get('name')}: expected a list of bonuses, got {bonuses!r:.80}")
+        skill["bonuses"] = [decode_bonus(b) for b in bonuses]
+    return c
+
+
+def decode_constellations(doc: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    if type(doc) is not list:
+        raise ValueError("expected a list of constellations")
+    for c in doc:
+        decode_constellation(c)
+    return doc
+
+
+def load_constellations(path) -> List[Dict[str, Any]]:
+    return decode_constellations(load_json_untyped(path))
+
+
+def loads_constellations(s: str) -> List[Dict[str, Any]]:
+    return decode_constellations(loads_json_untyped(s))
+
+
+def iter_constellations(path) -> Iterator[Dict[str, Any]]:
+    # like json_utils.iter_json_records, for a JSON array or an .ndjson file
+    if Path(path).suffix != ".ndjson":
+        yield from load_constellations(path)
+        return
+    with open(path, 'rb') as fp:
+        for line in fp:
+            if line.strip():
+                yield decode_constellation(loads_json_untyped(line))
@@ -0,0 +1,289 @@
+import argparse
+import asyncio
+import json
+import traceback
+from functools import lru_cache
+from http import HTTPStatus
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+from . import DEFAULT_LOCALE, load_constellation_bonuses, tags_file
+from .bonuses import MissingTagError, aggregate_bonuses, render_bonuses
+from .graph import ConstellationGraph
+from .index import ConstellationIndex
+from .json_utils import dumps_json_line
+from .schema import decode_bonus
+from .store import DataSnapshot, DataStore
+
+# Local HTTP API over one loaded copy of the constellation data:
+#   POST /aggregate  {"stars": {constellation: [star, ...]}, "locale": "en"}
+#   POST /render     {"bonuses": [tagged bonus, ...], "locale": "en"}
+#   GET  /render?constellation=NAME&locale=en
+#   GET  /kinds?prefix=PREFIX
+#   GET  /kind/KIND_ID?locale=en
+#   GET  /health
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+RESPONSE_CACHE_SIZE = 1024
+MAX_BODY_SIZE = 1 << 20
+
+
+class RequestError(Exception):
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def _json_body(body: bytes) -> Dict[str, Any]:
+    try:
+        data = json.loads(body or b"{}")
+    except ValueError as e:
+        raise RequestError(HTTPStatus.BAD_REQUEST, f"invalid JSON: {e}") from None
+    if not isinstance(data, dict):
+        raise RequestError(HTTPStatus.BAD_REQUEST, "expected a JSON object")
+    return data
+
+
+class ConstellationService:
+    def __init__(self, constellations: List[Dict[str, Any]] = None, cache_size: int = RESPONSE_CACHE_SIZE,
+                 snapshot: DataSnapshot = None):
+        # a snapshot brings its own tags, used for its locale instead of the module-level ones
+        self.snapshot = snapshot
+        if snapshot is not None:
+            constellations = snapshot.constellations
+        elif constellations is None:
+            constellations = load_constellation_bonuses()
+        self.constellations = {c['name']: c for c in constellations}
+        if snapshot is not None:
+            self.graphs = snapshot.graphs
+            self.index = snapshot.index
+        else:
+            self.graphs = {name: ConstellationGraph(c) for name, c in self.constellations.items()}
+            self.index = ConstellationIndex(constellations)
+        # responses for the GET endpoints and /aggregate, keyed by the normalized request
+        self._aggregate = lru_cache(maxsize=cache_size)(self._aggregate_uncached)
+        self._render_constellation = lru_cache(maxsize=cache_size)(self._render_constellation_uncached)
+        self._kind = lru_cache(maxsize=cache_size)(self._kind_uncached)
+        self._locales = set() if snapshot is None else {snapshot.locale}
+
+    def normalize_selection(self, stars: Any) -> Tuple[Tuple[str, Tuple[int, ...]], ...]:
+        if not isinstance(stars, dict):
+            raise RequestError(HTTPStatus.BAD_REQUEST, "`stars` must map constellation names to star lists")
+        selection = []
+        for name, selected in stars.items():
+            c = self.constellations.get(name)
+            if c is None:
+                raise RequestError(HTTPStatus.BAD_REQUEST, f"unknown constellation `{name}`")
+            if not isinstance(selected, list) or not all(type(s) is int for s in selected):
+                raise RequestError(HTTPStatus.BAD_REQUEST, f"{name}: expected a list of star numbers")
+            if any(not 0 <= s < len(c['skills']) for s in selected):
+                raise RequestError(HTTPStatus.BAD_REQUEST, f"{name}: star out of range")
+            if selected:
+                selection.append((name, tuple(sorted(set(selected)))))
+        return tuple(sorted(selection))
+
+    def _aggregate_uncached(self, selection: Tuple[Tuple[str, Tuple[int, ...]], ...], locale: str) -> bytes:
+        bonuses = []
+        invalid = []
+        for name, stars in selection:
+            if not self.graphs[name].is_valid(sum(1 << s for s in stars)):
+                invalid.append(name)
+            skills = self.constellations[name]['skills']
+            for s in stars:
+                bonuses.extend(skills[str(s)].get('bonuses', ()))
+        totals = aggregate_bonuses(bonuses)
+        return dumps_json_line({
+            "points": sum(len(stars) for _, stars in selection),
+            "missing_prerequisites": invalid,
+            "bonuses": [
+                {"kind_id": b.kind_id(), "display": d, "bonus": b}
+                for b, d in zip(totals, self._render(totals, locale))
+            ],
+        }).encode()
+
+    def _render_constellation_uncached(self, name: str, locale: str) -> bytes:
+        c = self.constellations.get(name)
+        if c is None:
+            raise RequestError(HTTPStatus.NOT_FOUND, f"unknown constellation `{name}`")
+        return dumps_json_line({
+            "name": name,
+            "stars": {s: self._render(skill.get('bonuses', ()), locale) for s, skill in c['skills'].items()},
+        }).encode()
+
+    def _kind_uncached(self, kind_id: str, locale: str) -> bytes:
+        entries = self.index.by_kind(kind_id)
+        if not entries:
+            raise RequestError(HTTPStatus.NOT_FOUND, f"no bonuses of kind `{kind_id}`")
+        displays = self._render([e.bonus for e in entries], locale)
+        return dumps_json_line([
+            {"constellation": e.constellation, "star": e.star, "amount": e.amount, "display": d}
+            for e, d in zip(entries, displays)
+        ]).encode()
+
+    def _render(self, bonuses, locale: str) -> List[str]:
+        if self.snapshot is not None and locale == self.snapshot.locale:
+            return self.snapshot.render_bonuses(bonuses)
+        return render_bonuses(bonuses, locale)
+
+    def _locale(self, value: Any) -> str:
+        if not isinstance(value, str):
+            raise RequestError(HTTPStatus.BAD_REQUEST, "`locale` must be a string")
+        if value not in self._locales:
+            if not value.replace("_", "").isalnum() or not tags_file(value).exists():
+                raise RequestError(HTTPStatus.NOT_FOUND, f"no tags for locale `{value}`")
+            self._locales.add(value)
+        return value
+
+    def handle(self, method: str, target: str, body: bytes = b"") -> bytes:
+        url = urlsplit(target)
+        path = unquote(url.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        locale = self._locale(query.get("locale", DEFAULT_LOCALE))
+
+        if path == "/health":
+            self._expect(method, "GET")
+            return b'{"status":"ok"}'
+        if path == "/aggregate":
+            self._expect(method, "POST")
+            data = _json_body(body)
+            return self._aggregate(self.normalize_selection(data.get("stars", {})),
+                                   self._locale(data.get("locale", locale)))
+        if path == "/render":
+            if method == "GET":
+                if "constellation" not in query:
+                    raise RequestError(HTTPStatus.BAD_REQUEST, "missing `constellation`")
+                return self._render_constellation(query["constellation"], locale)
+            self._expect(method, "POST")
+            data = _json_body(body)
+            try:
+                bonuses = [decode_bonus(b) for b in data.get("bonuses", [])]
+            except (TypeError, ValueError) as e:
+                raise RequestError(HTTPStatus.BAD_REQUEST, str(e)) from None
+            return dumps_json_line(self._render(bonuses, self._locale(data.get("locale", locale)))).encode()
+        if path == "/kinds":
+            self._expect(method, "GET")
+            return dumps_json_line(self.index.kind_ids_matching(query.get("prefix", ""))).encode()
+        if path.startswith("/kind/"):
+            self._expect(method, "GET")
+            return self._kind(path[len("/kind/"):], locale)
+        raise RequestError(HTTPStatus.NOT_FOUND, f"no endpoint at {path}")
+
+    @staticmethod
+    def _expect(method: str, expected: str):
+        if method != expected:
+            raise RequestError(HTTPStatus.METHOD_NOT_ALLOWED, f"use {expected}")
+
+    def respond(self, method: str, target: str, body: bytes = b"") -> Tuple[HTTPStatus, bytes]:
+        try:
+            return HTTPStatus.OK, self.handle(method, target, body)
+        except RequestError as e:
+            return e.status, dumps_json_line({"error": str(e)}).encode()
+        except MissingTagError as e:
+            # a tag missing from the requested locale
+            return HTTPStatus.NOT_FOUND, dumps_json_line({"error": f"missing tag {e}"}).encode()
+        except Exception:
+            traceback.print_exc()
+            return HTTPStatus.INTERNAL_SERVER_ERROR, dumps_json_line({"error": "internal error"}).encode()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except RequestError as e:
+                    self._write_response(writer, e.status, dumps_json_line({"error": str(e)}).encode(), False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, target, body, keep_alive = request
+                status, payload = self.respond(method, target, body)
+                self._write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _write_response(writer: asyncio.StreamWriter, status: HTTPStatus, payload: bytes, keep_alive: bool):
+        writer.write(
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + payload
+        )
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, bytes, bool]]:
+        # None once the client has closed the connection
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        try:
+            method, target, version = line.decode('latin-1').split()
+        except ValueError:
+            raise RequestError(HTTPStatus.BAD_REQUEST, "malformed request line") from None
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            k, _, v = line.decode('latin-1').partition(":")
+            headers[k.strip().lower()] = v.strip()
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise RequestError(HTTPStatus.BAD_REQUEST, "invalid Content-Length") from None
+        if length > MAX_BODY_SIZE:
+            raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"bodies are limited to {MAX_BODY_SIZE} bytes")
+        body = await reader.readexactly(length) if length else b""
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+        return method, target, body, keep_alive
+
+    async def serve(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+
+async def _watch(store: DataStore, interval: float, on_change: Callable[[], None]):
+    while True:
+        await asyncio.sleep(interval)
+        if await asyncio.to_thread(store.check):
+            on_change()
+
+
+async def _main(host: str, port: int, watch: Optional[float]):
+    store = DataStore()
+    service = ConstellationService(snapshot=store.current)
+
+    def reload():
+        # connections already open finish on the service they started with
+        nonlocal service
+        service = ConstellationService(snapshot=store.current)
+        print(f"loaded data version {store.version}")
+
+    async def handle_connection(reader, writer):
+        await service.handle_connection(reader, writer)
+
+    server = await asyncio.start_server(handle_connection, host, port)
+    print(f"serving on http://{host}:{server.sockets[0].getsockname()[1]}")
+    if watch:
+        asyncio.create_task(_watch(store, watch, reload))
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--watch", type=float, metavar="SECONDS",
+                        help="check the data files for changes this often and serve new data without a restart")
+    args = parser.parse_args()
+    try:
+        asyncio.run(_main(args.host, args.port, args.watch))
+    except KeyboardInterrupt:
+        pass
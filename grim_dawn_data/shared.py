@@ -0,0 +1,146 @@
+import mmap
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+from . import DATA_DIRECTORY, DEFAULT_LOCALE, bonuses_file, load_constellation_bonuses, load_tags, tags_file, tags_filename
+from .compiled import (BONUSES_MAGIC, CACHE_VERSION, TAGS_MAGIC, BonusesLayout, TagStore, _HEADER, write_bonuses_cache,
+                       write_tags_cache)
+
+# One process publishes the compiled tags and bonus table as files, any number of others map
+# them read-only. The pages are shared through the page cache, so each worker only holds the
+# constellation skeleton and whatever it decodes. Put the directory on a tmpfs such as
+# /dev/shm to keep it off disk.
+#
+# Each publish writes both files into a new version directory and then swaps the symlink
+# `current-<locale>` over to it, so a worker attaching always maps a tags file and a bonus
+# table from the same publish. There is meant to be a single publisher per directory.
+
+SHARED_DIRECTORY = DATA_DIRECTORY / "shared"
+BONUSES_NAME = "constellation-bonuses.cache"
+VERSION_PREFIX = "version-"
+ATTACH_ATTEMPTS = 3
+
+
+def _tags_name(locale: str) -> str:
+    return Path(tags_filename(locale)).stem + ".cache"
+
+
+def _current_name(locale: str) -> str:
+    return f"current-{locale}"
+
+
+def publish_dataset(directory=SHARED_DIRECTORY, locale: str = DEFAULT_LOCALE) -> Path:
+    # returns the new version directory; processes attached to an older version keep it mapped
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    version = Path(tempfile.mkdtemp(prefix=VERSION_PREFIX, dir=directory))
+    try:
+        write_tags_cache(load_tags(locale), tags_file(locale), version / _tags_name(locale))
+        write_bonuses_cache(load_constellation_bonuses(), bonuses_file(), version / BONUSES_NAME)
+        os.chmod(version, 0o755)
+        link = directory / (_current_name(locale) + ".tmp")
+        if link.is_symlink():
+            link.unlink()
+        os.symlink(version.name, link)
+        os.replace(link, directory / _current_name(locale))
+    except BaseException:
+        shutil.rmtree(version, ignore_errors=True)
+        raise
+    _remove_old_versions(directory)
+    return version
+
+
+def _remove_old_versions(directory: Path):
+    # mapped files stay readable after they are unlinked
+    current = {os.readlink(p) for p in directory.glob("current-*") if p.is_symlink()}
+    for p in directory.glob(VERSION_PREFIX + "*"):
+        if p.name not in current:
+            shutil.rmtree(p, ignore_errors=True)
+
+
+def _map(path: Path, magic: bytes) -> mmap.mmap:
+    with open(path, "rb") as fp:
+        buf = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    # the publisher checked the sources, only the format is checked here
+    if len(buf) < _HEADER.size or _HEADER.unpack_from(buf)[:2] != (magic, CACHE_VERSION):
+        buf.close()
+        raise ValueError(f"{path} is not a published dataset file")
+    return buf
+
+
+class SharedConstellations:
+    # read-only sequence of constellations, decoded from the mapping on access
+    def __init__(self, buf: mmap.mmap):
+        layout = BonusesLayout(buf)
+        self._buf = buf
+        self._skeleton = layout.skeleton(buf)
+        self._table = layout.table(buf, copy=False)
+        self._names = {c['name']: i for i, c in enumerate(self._skeleton)}
+
+    def __len__(self) -> int:
+        return len(self._skeleton)
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        c = self._skeleton[i]
+        table = self._table
+        skills = {}
+        for s, skill in c['skills'].items():
+            if 'bonuses' in skill:
+                start, end = skill['bonuses']
+                skill = dict(skill, bonuses=[table[r] for r in range(start, end)])
+            skills[s] = skill
+        return dict(c, skills=skills)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return (self[i] for i in range(len(self)))
+
+    def names(self) -> List[str]:
+        return list(self._names)
+
+    def by_name(self, name: str) -> Dict[str, Any]:
+        return self[self._names[name]]
+
+    def close(self):
+        for v in vars(self._table).values():
+            if isinstance(v, memoryview):
+                v.release()
+        self._buf.close()
+
+
+class SharedDataset:
+    def __init__(self, version: Path, locale: str = DEFAULT_LOCALE):
+        # tags[key] as with load_tags(), and iteration over constellations as with
+        # load_constellation_bonuses(); both from one version directory
+        self.version = version
+        self.tags = TagStore(_map(version / _tags_name(locale), TAGS_MAGIC))
+        try:
+            self.constellations = SharedConstellations(_map(version / BONUSES_NAME, BONUSES_MAGIC))
+        except BaseException:
+            self.tags.close()
+            raise
+
+    def close(self):
+        self.tags.close()
+        self.constellations.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def attach_dataset(directory=SHARED_DIRECTORY, locale: str = DEFAULT_LOCALE) -> SharedDataset:
+    directory = Path(directory)
+    link = directory / _current_name(locale)
+    for attempt in range(ATTACH_ATTEMPTS):
+        # the link is read once, so both files come from the version it names
+        version = directory / os.readlink(link)
+        try:
+            return SharedDataset(version, locale)
+        except FileNotFoundError:
+            # removed by a newer publish between reading the link and opening the files
+            if attempt + 1 == ATTACH_ATTEMPTS or directory / os.readlink(link) == version:
+                raise
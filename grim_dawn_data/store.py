@@ -0,0 +1,168 @@
+import os
+import threading
+from functools import cached_property
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+from . import DEFAULT_LOCALE, _load_compiled, bonuses_file, tags_file
+from .manifest import hash_file
+
+LOAD_ATTEMPTS = 3
+
+# A DataStore holds one immutable DataSnapshot of the tags and the constellation bonuses, and
+# replaces it as a whole when check() finds that the files changed. Readers take
+# `store.current` once and use that snapshot throughout, so they never see a mix of two
+# versions or a dataset that is still loading.
+
+
+class FileState:
+    __slots__ = ('path', 'size', 'mtime_ns', 'sha1')
+
+    def __init__(self, path: Path, size: int, mtime_ns: int, sha1: str):
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.sha1 = sha1
+
+    @classmethod
+    def read(cls, path: Path) -> 'FileState':
+        st = os.stat(path)
+        return cls(path, st.st_size, st.st_mtime_ns, hash_file(path))
+
+    def same_stat(self, path: Path) -> bool:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return False
+        return path == self.path and st.st_size == self.size and st.st_mtime_ns == self.mtime_ns
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({str(self.path)!r}, {self.sha1[:8]})"
+
+
+class DataSnapshot:
+    def __init__(self, version: int, locale: str, files: Mapping[str, FileState], tags: Mapping[str, str],
+                 constellations: List[Dict[str, Any]]):
+        self.version = version
+        self.locale = locale
+        self.files = MappingProxyType(dict(files))
+        self.tags = MappingProxyType(tags)
+        self.constellations = constellations
+        self._templates = {}
+
+    @cached_property
+    def index(self):
+        from .index import ConstellationIndex
+        return ConstellationIndex(self.constellations)
+
+    @cached_property
+    def graphs(self):
+        from .graph import ConstellationGraph
+        return {c['name']: ConstellationGraph(c) for c in self.constellations}
+
+    def render_bonuses(self, bonuses: Iterable[Any]) -> List[str]:
+        # with this snapshot's tags, not whatever the module-level loaders hold now
+        from .bonuses import render_bonuses
+        return render_bonuses(bonuses, self.locale, self.tags, self._templates)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(version={self.version}, files={list(self.files.values())})"
+
+
+def _read_bonuses(path: Path) -> List[Dict[str, Any]]:
+    from .schema import load_constellations
+    return _load_compiled(path, 'read_bonuses_cache', 'write_bonuses_cache', load_constellations)
+
+
+def _read_tags(path: Path) -> Dict[str, str]:
+    return _load_compiled(path, 'read_tags_cache', 'write_tags_cache')
+
+
+def clear_loader_caches():
+    # the module-level loaders cache what they first read; Bonus.display() and friends go
+    # through them, so they are reset whenever a store swaps in new data
+    from . import _load_tags, close_tag_stores, load_constellation_bonuses
+    from .bonuses import _TEMPLATES
+    from .graph import load_constellation_graphs
+    from .index import load_constellation_index
+    for f in (_load_tags, load_constellation_bonuses, load_constellation_graphs, load_constellation_index):
+        f.cache_clear()
+    close_tag_stores()
+    _TEMPLATES.clear()
+
+
+class DataStore:
+    def __init__(self, locale: str = DEFAULT_LOCALE, clear_global_caches: bool = True):
+        self.locale = locale
+        self.clear_global_caches = clear_global_caches
+        self._lock = threading.Lock()
+        self._snapshot: Optional[DataSnapshot] = None
+        # the files as last seen by check(), which may be newer than the snapshot's
+        self._files: Dict[str, FileState] = {}
+
+    def _sources(self) -> Dict[str, Tuple[Path, Callable[[Path], Any]]]:
+        # paths are resolved on every check, so files that appear in data/ take over from
+        # data-archive/
+        return {
+            "tags": (tags_file(self.locale), _read_tags),
+            "bonuses": (bonuses_file(), _read_bonuses),
+        }
+
+    @property
+    def current(self) -> DataSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.check()
+            snapshot = self._snapshot
+        return snapshot
+
+    @property
+    def version(self) -> int:
+        return self.current.version
+
+    def _load(self, sources) -> Optional[Tuple[Dict[str, FileState], Dict[str, Any]]]:
+        files = {name: FileState.read(path) for name, (path, _) in sources.items()}
+        loaded = {name: load(path) for name, (path, load) in sources.items()}
+        if not all(f.same_stat(f.path) for f in files.values()):
+            # modified while it was being read
+            return None
+        return files, loaded
+
+    def check(self) -> bool:
+        # loads a new snapshot and swaps it in if any file changed; returns whether it did.
+        # A file that fails to load (e.g. it is still being written) or changes while it is
+        # read leaves the current snapshot in place until the next check.
+        with self._lock:
+            old = self._snapshot
+            sources = self._sources()
+            if old is not None:
+                seen = self._files
+                if all(seen[name].same_stat(path) for name, (path, _) in sources.items()):
+                    return False
+                states = {name: FileState.read(path) for name, (path, _) in sources.items()}
+                if all(f.path == seen[name].path and f.sha1 == seen[name].sha1 for name, f in states.items()):
+                    # touched but not modified; snapshots are never changed once published
+                    self._files = states
+                    return False
+                try:
+                    result = self._load(sources)
+                except (OSError, ValueError):
+                    return False
+            else:
+                for _ in range(LOAD_ATTEMPTS):
+                    result = self._load(sources)
+                    if result is not None:
+                        break
+                else:
+                    raise RuntimeError("the data files kept changing while they were loaded")
+            if result is None:
+                return False
+
+            files, loaded = result
+            version = 1 if old is None else old.version + 1
+            snapshot = DataSnapshot(version, self.locale, files, loaded["tags"], loaded["bonuses"])
+            if self.clear_global_caches and old is not None:
+                clear_loader_caches()
+            self._files = files
+            self._snapshot = snapshot
+            return True
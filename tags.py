@@ -1,37 +1,148 @@
 #!/usr/bin/env python3
 import re
-from grim_dawn_data import TAGS_FILE, auto_extract_archive, _write_data_path
-from grim_dawn_data.json_utils import dump_json
+import argparse
+import json
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+from grim_dawn_data import DEFAULT_LOCALE, auto_extract_archive, tags_filename, _write_data_path
+from grim_dawn_data.compiled import write_tags_cache
+from grim_dawn_data.json_utils import JsonObjectWriter, load_json
+from grim_dawn_data.manifest import BuildManifest
 
-TAGS_DIR = auto_extract_archive('tags')
+TAG_LINE = re.compile(r'([a-zA-Z0-9_]+)=(.+)')
+OUTPUT_FORMATS = ["json", "compact", "ndjson"]
+LOCALE_DIR = re.compile(r'text_(\w+)')
+
+STYLE_CODE = re.compile(r'\{\^[EH]\}')
+# a {...} placeholder becomes {}, any other { that is not followed by } is dropped
+FORMAT_FIELD = re.compile(r'(\{)[^{}]+(\})|\{(?=[^}])')
 
 def convert_format_string(s: str) -> str:
-    s = re.sub(r'\{\^[EH]\}', '', s)
-    s = re.sub(r'\{[^{}]+\}', '{}', s)
-    s = re.sub(r'\{(?=[^}])', '', s)
-    return s
+    if '{' not in s:
+        return s
+    # removing a style code can join the text around it into a new placeholder, so it has
+    # to happen before the placeholders are matched
+    if '{^' in s:
+        s = STYLE_CODE.sub('', s)
+    return FORMAT_FIELD.sub(r'\1\2', s)
+
+def read_tag_file(tagfile: Path) -> Iterator[Tuple[str, str]]:
+    with open(tagfile, 'r') as fp:
+        for line in fp:
+            m = TAG_LINE.fullmatch(line.strip())
+            if m:
+                yield m.group(1), m.group(2)
+
+def iter_raw_tags(tagfiles: Iterable[Path], counts: Counter = None) -> Iterator[Tuple[str, str]]:
+    if counts is None:
+        counts = Counter()
+    for tagfile in tagfiles:
+        for tag, string in read_tag_file(tagfile):
+            if string == '?' or string == "":
+                counts["ignored"] += 1
+                continue
+            counts["total"] += 1
+            yield tag, string
+
+def iter_tags(tagfiles: Iterable[Path], counts: Counter = None) -> Iterator[Tuple[str, str]]:
+    for tag, string in iter_raw_tags(tagfiles, counts):
+        yield tag, convert_format_string(string)
+
+def stream_tags(tagfiles: Iterable[Path], counts: Counter = None) -> Iterator[Tuple[str, str]]:
+    # last writer wins without holding the strings: the first pass only records where each
+    # tag is last defined, the second pass emits each tag from that position
+    tagfiles = list(tagfiles)
+    last: Dict[str, int] = {}
+    for pos, (tag, _) in enumerate(iter_raw_tags(tagfiles, counts)):
+        last[tag] = pos
+    for pos, (tag, string) in enumerate(iter_raw_tags(tagfiles)):
+        if last[tag] == pos:
+            yield tag, convert_format_string(string)
+
+def write_tags(tags: Iterable[Tuple[str, str]], dst: Path, fmt: str = "json") -> int:
+    count = 0
+    with open(dst, 'w') as fp:
+        if fmt == "ndjson":
+            for tag, string in tags:
+                fp.write(json.dumps([tag, string]) + "\n")
+                count += 1
+        else:
+            with JsonObjectWriter(fp, indent='  ' if fmt == "json" else None) as writer:
+                for tag, string in tags:
+                    writer.write(tag, string)
+                    count += 1
+    return count
+
+def find_locales(tags_dir: Path) -> List[str]:
+    return sorted({m.group(1) for p in tags_dir.glob("*/text_*") if (m := LOCALE_DIR.fullmatch(p.name))})
+
+def locale_tag_files(tags_dir: Path, locale: str) -> List[Path]:
+    return sorted(tags_dir.glob(f"*/text_{locale}/*.txt"))
+
+def output_path(locale: str, fmt: str) -> Path:
+    name = tags_filename(locale)
+    if fmt == "ndjson":
+        name = name[:-len(".json")] + ".ndjson"
+    return _write_data_path(name)
+
+def extract_locale(job: Tuple[str, List[Path], Path, bool, str]) -> Tuple[str, int, Counter]:
+    locale, tagfiles, dst, stream, fmt = job
+    counts = Counter()
+    if stream:
+        unique = write_tags(stream_tags(tagfiles, counts), dst, fmt)
+    else:
+        unique = write_tags(dict(iter_tags(tagfiles, counts)).items(), dst, fmt)
+    if fmt != "ndjson" and not stream:
+        # compiled store read by load_tags / load_tag_store for this locale; when streaming,
+        # building it would read the whole output back into memory, so the first load
+        # builds it instead
+        write_tags_cache(load_json(dst), dst)
+    return locale, unique, counts
 
 if __name__ == '__main__':
-    tags = {}
-    tagline = re.compile(r'([a-zA-Z0-9_]+)=(.+)')
-    count_total = 0
-    count_ignored = 0
-
-    for tagfile in sorted(TAGS_DIR.glob("*/text_en/*.txt")):
-        with open(tagfile, 'r') as fp:
-            for line in fp:
-                m = tagline.fullmatch(line.strip())
-                if m:
-                    tag = m.group(1)
-                    string = m.group(2)
-                    if string == '?' or string == "":
-                        count_ignored += 1
-                        continue
-                    count_total += 1
-                    tags[tag] = convert_format_string(string)
-
-    count_unqiue = len(tags)
-    dst = _write_data_path("tags.json")
-    dump_json(tags, dst)
-    print(f"Extracted tags: {count_unqiue} unique + {count_ignored} ignored + {count_total - count_unqiue - count_ignored} duplicate / {count_total} total")
-    print("wrote", dst)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--force", action="store_true", help="rebuild even if the tag files are unchanged")
+    parser.add_argument("--stream", action="store_true",
+                        help="write tags as they are read instead of collecting them in memory first; "
+                             "tags are ordered by their last definition, and the compiled tag cache is "
+                             "left to be built on first load")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="json",
+                        help="indented JSON, compact JSON or one [tag, string] array per line")
+    parser.add_argument("--locales", default=DEFAULT_LOCALE,
+                        help="comma-separated locales to extract, or 'all' for every text_<locale> directory")
+    parser.add_argument("-j", "--workers", type=int, default=1, help="number of locales to extract in parallel")
+    args = parser.parse_args()
+
+    tags_dir = auto_extract_archive('tags')
+    locales = find_locales(tags_dir) if args.locales == "all" else args.locales.split(",")
+    manifest = BuildManifest()
+    jobs = []
+    stale = {}
+    for locale in locales:
+        tagfiles = locale_tag_files(tags_dir, locale)
+        dst = output_path(locale, args.format)
+        stage = "tags" if locale == DEFAULT_LOCALE else f"tags_{locale}"
+        inputs = manifest.hash_files(tagfiles + [Path(__file__)])
+        inputs["options"] = f"stream={args.stream},format={args.format}"
+        if not args.force and manifest.is_up_to_date(stage, inputs):
+            print(f"{locale}: tags are up to date, skipping")
+            continue
+        jobs.append((locale, tagfiles, dst, args.stream, args.format))
+        stale[locale] = (stage, inputs, dst)
+
+    if args.workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            results = list(pool.map(extract_locale, jobs))
+    else:
+        results = [extract_locale(job) for job in jobs]
+
+    for locale, count_unqiue, counts in results:
+        stage, inputs, dst = stale[locale]
+        count_total = counts["total"]
+        count_ignored = counts["ignored"]
+        manifest.record(stage, inputs, [dst])
+        print(f"{locale}: Extracted tags: {count_unqiue} unique + {count_ignored} ignored + {count_total - count_unqiue - count_ignored} duplicate / {count_total} total")
+        print("wrote", dst)
+    manifest.save()
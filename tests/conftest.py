@@ -0,0 +1,11 @@
+import pytest
+from grim_dawn_data import compiled
+
+
+@pytest.fixture(autouse=True, scope="session")
+def cache_directory(tmp_path_factory):
+    # the loaders compile the data files on first use; keep those caches out of the repository
+    mp = pytest.MonkeyPatch()
+    mp.setattr(compiled, "CACHE_DIRECTORY", tmp_path_factory.mktemp("cache"))
+    yield
+    mp.undo()
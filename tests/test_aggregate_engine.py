@@ -0,0 +1,107 @@
+import random
+import pytest
+from grim_dawn_data import COUNTS_AS, load_constellation_bonuses
+from grim_dawn_data.aggregate import AggregationEngine, np, resolve_counts_as
+from grim_dawn_data.bonuses import Damage, DamageModifier, MiscBonus, Pets, aggregate_bonuses
+from grim_dawn_data.json_utils import dumps_json
+
+def random_builds(engine, n, seed=0):
+    rng = random.Random(seed)
+    return [rng.sample(engine.keys, rng.randint(1, 60)) for _ in range(n)]
+
+@pytest.mark.parametrize("use_numpy", [
+    False,
+    pytest.param(True, marks=pytest.mark.skipif(np is None, reason="numpy is not installed")),
+])
+def test_matches_aggregate_bonuses(use_numpy):
+    cons = load_constellation_bonuses()
+    engine = AggregationEngine.from_constellations(cons, use_numpy=use_numpy)
+    skills = {(c['name'], int(s)): skill.get('bonuses', []) for c in cons for s, skill in c['skills'].items()}
+
+    builds = random_builds(engine, 200) + [engine.keys]
+    for build, blist in zip(builds, engine.aggregate_many(builds)):
+        expected = aggregate_bonuses([b for k in build for b in skills[k]])
+        assert dumps_json(blist) == dumps_json(expected)
+
+
+def fractional_units(n, seed=0):
+    rng = random.Random(seed)
+    makers = [
+        lambda v: MiscBonus(v, rng.choice(["characterLife", "characterMana"]), "tagBonusLifeAbs"),
+        lambda v: DamageModifier(v, rng.choice(["Fire", "Cold"])),
+        lambda v: Damage(v, "Fire"),
+        lambda v: Pets(DamageModifier(v, "Fire")),
+    ]
+    return {i: [rng.choice(makers)(rng.choice([0.1, 0.2, 0.3, 0.7, 1.1, 2.35])) for _ in range(rng.randint(1, 4))]
+            for i in range(n)}
+
+
+@pytest.mark.parametrize("use_numpy", [
+    False,
+    pytest.param(True, marks=pytest.mark.skipif(np is None, reason="numpy is not installed")),
+])
+def test_fractional_totals(use_numpy):
+    units = fractional_units(60)
+    engine = AggregationEngine(units, use_numpy=use_numpy)
+    assert AggregationEngine(units).use_numpy is False
+
+    builds = random_builds(engine, 200)
+    for build, totals in zip(builds, engine.totals_many(builds)):
+        expected = {}
+        for b in aggregate_bonuses([b for k in build for b in units[k]]):
+            inner = b.bonus if isinstance(b, Pets) else b
+            for f in inner.aggregate_fields:
+                expected[(b.kind_id(), f)] = getattr(inner, f)
+        assert totals.keys() == expected.keys()
+        if use_numpy:
+            # the matrix product adds in another order
+            assert totals == pytest.approx(expected)
+        else:
+            assert totals == expected
+
+
+def naive_effective_totals(bonuses, counts_as):
+    def expand(kind, factor):
+        pets = kind.startswith('Pets.')
+        base = kind[len('Pets.'):] if pets else kind
+        if base not in counts_as:
+            yield kind, factor
+            return
+        for target, f in counts_as[base]:
+            yield from expand('Pets.' + target if pets else target, factor * f)
+
+    totals = {}
+    for b in bonuses:
+        inner = b.bonus if isinstance(b, Pets) else b
+        if not inner.is_aggregatable():
+            continue
+        for f in inner.aggregate_fields:
+            for kind, factor in expand(b.kind_id(), 1.):
+                totals[(kind, f)] = totals.get((kind, f), 0.) + getattr(inner, f) * factor
+    return totals
+
+
+@pytest.mark.parametrize("use_numpy", [
+    False,
+    pytest.param(True, marks=pytest.mark.skipif(np is None, reason="numpy is not installed")),
+])
+def test_effective_totals(use_numpy):
+    cons = load_constellation_bonuses()
+    # chain through another umbrella kind to cover transitive expansion
+    counts_as = dict(COUNTS_AS, offensiveTotalDamageModifier=[('DamageModifier.Elemental', 1), ('DamageModifier.Chaos', 2)])
+    engine = AggregationEngine.from_constellations(cons, use_numpy=use_numpy, counts_as=counts_as)
+    skills = {(c['name'], int(s)): skill.get('bonuses', []) for c in cons for s, skill in c['skills'].items()}
+
+    builds = random_builds(engine, 100) + [engine.keys]
+    for build, totals in zip(builds, engine.effective_totals_many(builds)):
+        expected = naive_effective_totals([b for k in build for b in skills[k]], counts_as)
+        assert totals.keys() == expected.keys()
+        for key, v in expected.items():
+            assert totals[key] == pytest.approx(v)
+
+
+def test_resolve_counts_as():
+    resolved = resolve_counts_as({'a': [('b', 2), ('c', 1)], 'b': [('c', 0.5), ('d', 1)]})
+    assert dict(resolved['a']) == {'c': 2., 'd': 2.}
+    with pytest.raises(ValueError):
+        resolve_counts_as({'a': [('b', 1)], 'b': [('a', 1)]})
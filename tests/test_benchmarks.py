@@ -0,0 +1,16 @@
+import importlib.util
+from pathlib import Path
+
+spec = importlib.util.spec_from_file_location("benchmarks_run", Path(__file__).parent.parent / "benchmarks/run.py")
+run = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(run)
+
+
+def test_run_benchmarks():
+    # keeps the synthetic fixtures in step with the code they exercise
+    results = run.run_benchmarks(scale=0.02, repeat=1,
+                                 only=["convert", "load_dbr", "process", "interpret", "aggregate", "dump", "load_json"])
+    assert {"convert_format_string", "load_dbr_file", "process_constellation", "interpret_bonuses",
+            "aggregate_bonuses", "dump_json[json]", "load_json[json]"} <= set(results)
+    assert "cold_import" not in results
+    assert all(r["items"] > 0 and r["min"] > 0 for r in results.values())
@@ -0,0 +1,32 @@
+from grim_dawn_data import BONUSES_FILE, load_constellation_bonuses
+from grim_dawn_data.bonuses import BonusTable
+from grim_dawn_data.compiled import BonusesLayout, write_bonuses_cache
+from grim_dawn_data.json_utils import dumps_json
+
+def all_bonuses():
+    return [b for c in load_constellation_bonuses() for s in c['skills'].values() for b in s.get('bonuses', [])]
+
+def test_bonuses_have_no_instance_dict():
+    for b in all_bonuses():
+        assert not hasattr(b, '__dict__')
+
+def test_bonus_table_round_trip():
+    blist = all_bonuses()
+    table = BonusTable(blist)
+    assert len(table) == len(blist)
+    assert len(table.kinds) < len(blist)
+    assert dumps_json(list(table)) == dumps_json(blist)
+    assert [table.kind_id(i) for i in range(len(table))] == [b.kind_id() for b in blist]
+
+def test_kind_ids_are_a_column(tmp_path, monkeypatch):
+    blist = all_bonuses()
+    cache = tmp_path / "bonuses.cache"
+    write_bonuses_cache(load_constellation_bonuses(), BONUSES_FILE, cache)
+    with open(cache, 'rb') as fp:
+        buf = fp.read()
+    table = BonusesLayout(buf).table(buf)
+    assert len(table.kind_names) < len(blist)
+
+    # no Bonus is built to read a row's kind id
+    monkeypatch.setattr(BonusTable, "__getitem__", None)
+    assert [table.kind_id(i) for i in range(len(table))] == [b.kind_id() for b in blist]
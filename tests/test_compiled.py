@@ -0,0 +1,110 @@
+import os
+import pytest
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from grim_dawn_data import BONUSES_FILE, TAGS_FILE, _replace_file
+from grim_dawn_data.compiled import (TagStore, cache_path, read_bonuses_cache, read_tags_cache, write_bonuses_cache,
+                                     write_tags_cache)
+from grim_dawn_data.json_utils import dumps_json, load_json
+
+
+def test_tags_cache(tmp_path):
+    source = tmp_path / "tags.json"
+    shutil.copy(TAGS_FILE, source)
+    cache = tmp_path / "tags.cache"
+    tags = load_json(source)
+
+    assert read_tags_cache(source, cache) is None
+    write_tags_cache(tags, source, cache)
+    assert list(read_tags_cache(source, cache).items()) == list(tags.items())
+
+    # same content with a new mtime is still valid, different content is not
+    st = os.stat(source)
+    os.utime(source, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert read_tags_cache(source, cache) == tags
+    source.write_text(source.read_text().replace('"', "'", 1).replace("'", '"', 1) + " ")
+    assert read_tags_cache(source, cache) is None
+
+
+def test_same_size_rewrite(tmp_path):
+    source = tmp_path / "tags.json"
+    source.write_text('{"tagA": "a"}')
+    cache = tmp_path / "tags.cache"
+    write_tags_cache({"tagA": "a"}, source, cache)
+
+    # same size and the old mtime restored
+    st = os.stat(source)
+    source.write_text('{"tagA": "b"}')
+    os.utime(source, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert read_tags_cache(source, cache) is None
+
+
+def test_cache_paths(tmp_path):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    sources = [tmp_path / "a" / "tags.json", tmp_path / "b" / "tags.json", tmp_path / "a" / "tags.ndjson"]
+    for p in sources:
+        p.write_text("{}")
+        write_tags_cache({p.name: str(p)}, p)
+    assert len({cache_path(p) for p in sources}) == len(sources)
+    for p in sources:
+        assert read_tags_cache(p) == {p.name: str(p)}
+
+
+def test_empty_tags_cache(tmp_path):
+    source = tmp_path / "tags.json"
+    source.write_text("{}")
+    write_tags_cache({}, source, tmp_path / "tags.cache")
+    assert read_tags_cache(source, tmp_path / "tags.cache") == {}
+
+
+def test_bonuses_cache(tmp_path):
+    cache = tmp_path / "bonuses.cache"
+    constellations = load_json(BONUSES_FILE)
+    write_bonuses_cache(constellations, BONUSES_FILE, cache)
+    assert dumps_json(read_bonuses_cache(BONUSES_FILE, cache)) == dumps_json(constellations)
+
+
+def test_tag_store(tmp_path):
+    cache = tmp_path / "tags.cache"
+    tags = load_json(TAGS_FILE)
+    write_tags_cache(tags, TAGS_FILE, cache)
+
+    store = TagStore.open(TAGS_FILE, cache, lru_size=16)
+    assert len(store) == len(tags)
+    for k, v in tags.items():
+        assert store[k] == v
+    assert "tagDoesNotExist" not in store
+    assert store.get("tagDoesNotExist", "") == ""
+    with pytest.raises(KeyError):
+        store["tagDoesNotExist"]
+    store.close()
+
+
+def _write_tags(source, cache, n):
+    tags = {f"tag{i}": f"value {n} {i}" for i in range(2000)}
+    for _ in range(5):
+        write_tags_cache(tags, source, cache)
+
+
+def test_concurrent_writers(tmp_path):
+    source = tmp_path / "tags.json"
+    source.write_text("{}")
+    cache = tmp_path / "tags.cache"
+    with ProcessPoolExecutor(4) as pool:
+        list(pool.map(_write_tags, [source] * 8, [cache] * 8, range(8)))
+
+    # one writer's cache in full, and no temporary files left behind
+    tags = read_tags_cache(source, cache)
+    n = tags["tag0"].split()[1]
+    assert tags == {f"tag{i}": f"value {n} {i}" for i in range(2000)}
+    assert sorted(os.listdir(tmp_path)) == ["tags.cache", "tags.json"]
+
+
+def test_failed_write(tmp_path):
+    path = tmp_path / "out.json"
+    with pytest.raises(ZeroDivisionError):
+        with _replace_file(path) as fp:
+            fp.write("partial")
+            1 / 0
+    assert os.listdir(tmp_path) == []
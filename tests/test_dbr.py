@@ -0,0 +1,36 @@
+import pytest
+from grim_dawn_data.dbr import parse_dbr, read_dbr
+
+TEXT = "Class,Skill_Passive,\ncharacterLife,25.000000,\nskillDisplayName,tagSkillName,\nDagger,1,\noffensiveFireModifier,0.0,\n"
+
+
+def test_parse_dbr():
+    record = parse_dbr(TEXT)
+    assert list(record) == ["Class", "characterLife", "skillDisplayName", "Dagger", "offensiveFireModifier"]
+    assert record["characterLife"] == "25.000000"
+    assert record.get_float("characterLife") == 25.
+    assert record.get_float("characterLife") is record.get_float("characterLife")
+    assert record.get_int("Dagger") == 1
+    assert record.get_int("Axe", 0) == 0
+    with pytest.raises(KeyError):
+        record.get_float("Axe")
+
+
+def test_projection(tmp_path):
+    p = tmp_path / "skill.dbr"
+    p.write_text(TEXT)
+    assert list(read_dbr(p, prefixes=["character", "offensive"])) == ["characterLife", "offensiveFireModifier"]
+    assert list(read_dbr(p, prefixes=["character"], keys={"Dagger"})) == ["characterLife", "Dagger"]
+    assert list(read_dbr(p, keys=())) == []
+
+
+def test_interned_keys():
+    a = parse_dbr("".join(["character", "Life,1,\n"]))
+    b = parse_dbr("".join(["charac", "terLife,2,\n"]))
+    assert next(iter(a)) is next(iter(b))
+
+
+@pytest.mark.parametrize("text", ["characterLife,1\n", "characterLife,1,x\n", "a,1,\na,2,\n"])
+def test_malformed(text):
+    with pytest.raises(ValueError):
+        parse_dbr(text)
@@ -0,0 +1,47 @@
+import pytest
+from grim_dawn_data import json_utils, load_constellation_bonuses
+from grim_dawn_data.bonuses import (Bonus, ChanceOf, Damage, DamageOverTimeModifier, Pets, display_template,
+                                    render_bonuses)
+
+
+def test_render_matches_display_fmt():
+    bonuses = [b for c in load_constellation_bonuses() for s in c['skills'].values() for b in s.get('bonuses', [])]
+    expected = [b.display_fmt().format(*b.display_args()) for b in bonuses]
+    assert render_bonuses(bonuses) == expected
+    assert render_bonuses(bonuses) == expected
+    assert [b.display() for b in bonuses] == expected
+
+
+def test_template_variants():
+    single, ranged = Damage(5.0, "Fire"), Damage(5.0, "Fire", 10.0)
+    assert display_template(single) == single.display_fmt()
+    assert display_template(ranged) == ranged.display_fmt()
+    assert display_template(single) != display_template(ranged)
+
+    without, with_duration = DamageOverTimeModifier(10.0, 0, "Poison"), DamageOverTimeModifier(10.0, 20.0, "Poison")
+    assert render_bonuses([without, with_duration]) == [without.display(), with_duration.display()]
+    assert display_template(without) != display_template(with_duration)
+
+    nested = [Pets(ChanceOf(10.0, single)), Pets(ChanceOf(10.0, ranged))]
+    assert render_bonuses(nested) == [b.display_fmt().format(*b.display_args()) for b in nested]
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    # classes defined by a test register their json tag in copies that are dropped afterwards
+    for name in ("_JSON_CLASS_TO_TAG", "_JSON_TAG_TO_CLASS", "_CONVERT_TO_JSON", "_CONVERT_FROM_JSON", "_ENCODERS"):
+        monkeypatch.setattr(json_utils, name, dict(getattr(json_utils, name)))
+
+
+def test_fieldless_bonus(registry):
+    class Constant(Bonus, json_tag="test_display.Constant"):
+        __slots__ = ()
+
+        def display_fmt(self, locale="en", tags=None):
+            return "constant"
+
+        def display_args(self):
+            return ()
+
+    assert Constant().template_key() == ()
+    assert render_bonuses([Constant()]) == ["constant"]
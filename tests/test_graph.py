@@ -0,0 +1,57 @@
+import pytest
+from grim_dawn_data import load_constellation_bonuses
+from grim_dawn_data.bonuses import MiscBonus, aggregate_bonuses
+from grim_dawn_data.graph import ConstellationGraph, load_constellation_graphs, stars_of
+from grim_dawn_data.json_utils import dumps_json
+
+
+def _walk_ancestors(pred, star):
+    found = 0
+    while str(star) in pred:
+        star = pred[str(star)]
+        found |= 1 << star
+    return found
+
+
+def test_graphs_match_pred():
+    graphs = load_constellation_graphs()
+    assert graphs is load_constellation_graphs()
+    for c in load_constellation_bonuses():
+        g = graphs[c['name']]
+        assert sorted(g.order) == list(range(g.size))
+        position = {s: i for i, s in enumerate(g.order)}
+        for s in range(g.size):
+            assert g.ancestors[s] == _walk_ancestors(c['pred'], s)
+            assert all(position[a] < position[s] for a in stars_of(g.ancestors[s]))
+            expected = aggregate_bonuses(b for t in stars_of(g.closure(s)) for b in c['skills'][str(t)].get('bonuses', []))
+            assert dumps_json(g.totals_with_prerequisites(s)) == dumps_json(expected)
+        for k in range(g.size + 1):
+            assert g.is_valid(sum(1 << s for s in g.order[:k]))
+        expected = aggregate_bonuses(b for s in c['skills'].values() for b in s.get('bonuses', []))
+        assert dumps_json(g.totals_up_to(g.size)) == dumps_json(expected)
+
+
+def _constellation(pred, size=3):
+    return {
+        'name': "test",
+        'pred': pred,
+        'skills': {str(s): {'bonuses': [MiscBonus(float(s + 1), "characterLife", "tagX")]} for s in range(size)},
+    }
+
+
+def test_out_of_order_stars():
+    g = ConstellationGraph(_constellation({"0": 2, "1": 0}))
+    assert g.order == [2, 0, 1]
+    assert g.ancestors == [0b100, 0b101, 0]
+    assert not g.is_valid(0b011)
+    assert g.is_valid(0b101)
+    assert [b.amount for b in g.totals_up_to(2)] == [4.0]
+    assert [b.amount for b in g.totals_with_prerequisites(1)] == [6.0]
+    assert g.totals_up_to(0) == []
+
+
+def test_invalid_links():
+    with pytest.raises(ValueError):
+        ConstellationGraph(_constellation({"0": 1, "1": 0}))
+    with pytest.raises(ValueError):
+        ConstellationGraph(_constellation({"1": 5}))
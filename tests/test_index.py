@@ -0,0 +1,41 @@
+from grim_dawn_data import load_constellation_bonuses
+from grim_dawn_data.index import bonus_amount, load_constellation_index
+
+
+def test_index_matches_scan():
+    cons = load_constellation_bonuses()
+    index = load_constellation_index()
+    assert index is load_constellation_index()
+
+    expected = {}
+    weapons = {}
+    for c in cons:
+        for s, skill in c['skills'].items():
+            for b in skill.get('bonuses', []):
+                expected.setdefault(b.kind_id(), []).append((c['name'], int(s), bonus_amount(b)))
+            for w in skill.get('weapon_requirement', []):
+                weapons.setdefault(w, []).append((c['name'], int(s)))
+
+    assert index.kind_ids() == sorted(expected)
+    for kind, hits in expected.items():
+        entries = index.by_kind(kind)
+        assert sorted((e.constellation, e.star, e.amount) for e in entries) == sorted(hits)
+        amounts = [e.amount for e in entries]
+        assert amounts == sorted(amounts, reverse=True)
+    for w, stars in weapons.items():
+        assert index.by_weapon_requirement(w) == stars
+    assert index.by_kind("NoSuchKind") == []
+
+
+def test_affinity_and_prefix():
+    index = load_constellation_index()
+    cons = load_constellation_bonuses()
+    chaos = [(c['name'], c['affinity_bonus']['chaos']) for c in cons if 'chaos' in c['affinity_bonus']]
+    assert sorted(index.giving_affinity("Chaos")) == sorted(chaos)
+    assert [v for _, v in index.giving_affinity("chaos")] == sorted((v for _, v in chaos), reverse=True)
+    assert all(c['affinity_required'].get('order', 0) > 0 for c in cons
+               if c['name'] in {n for n, _ in index.requiring_affinity("order")})
+
+    pets = index.kind_ids_matching("Pets.")
+    assert pets and all(k.startswith("Pets.") for k in pets)
+    assert pets == [k for k in index.kind_ids() if k.startswith("Pets.")]
@@ -0,0 +1,74 @@
+import json
+import pytest
+from grim_dawn_data import BONUSES_FILE, CONSTELLATION_FILE
+from grim_dawn_data.json_utils import (deserialize_json, dump_ndjson, dumps_json, dumps_json_line, get_json_backend,
+                                      iter_json_records, load_json, loads_json, NdjsonWriter, serialize_json, set_json_backend,
+                                      orjson)
+import grim_dawn_data.bonuses  # registers the Bonus classes
+
+BACKENDS = ["json"] + ([] if orjson is None else ["orjson"])
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request):
+    previous = get_json_backend()
+    set_json_backend(request.param)
+    yield request.param
+    set_json_backend(previous)
+
+
+@pytest.mark.parametrize("path", [CONSTELLATION_FILE, BONUSES_FILE])
+def test_round_trip(backend, path):
+    data = load_json(path)
+    assert dumps_json(data) == path.read_text().rstrip("\n")
+    assert dumps_json(loads_json(dumps_json(data))) == dumps_json(data)
+
+
+@pytest.mark.parametrize("obj", [
+    {"a": "ü", "b": "\x7f", "c": "😀", "d": " "},
+    [1e-05, 1e16, 2.5, -0.0, "1e5", 2**70],
+    {1: {2, 3}, "f": frozenset(["x"])},
+    {"empty": {}, "list": [], "nested": [[{}]]},
+])
+def test_matches_stdlib(backend, obj):
+    expected = json.dumps(obj, default=serialize_json, indent='  ')
+    assert dumps_json(obj) == expected
+    assert loads_json(expected) == json.loads(expected, object_hook=deserialize_json)
+
+
+@pytest.mark.parametrize("obj", [
+    [float('nan'), None, 1.5],
+    {"a": float('inf'), "b": [float('-inf')], "c": "null"},
+])
+def test_non_finite(backend, obj):
+    expected = json.dumps(obj, default=serialize_json, indent='  ')
+    assert dumps_json(obj) == expected
+    assert dumps_json(loads_json(dumps_json(obj))) == expected
+    assert dumps_json_line(obj) == json.dumps(obj, default=serialize_json, separators=(',', ':'))
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        set_json_backend("simplejson")
+
+
+def test_ndjson_round_trip(backend, tmp_path):
+    constellations = load_json(BONUSES_FILE)
+    path = tmp_path / "constellation-bonuses.ndjson"
+    assert dump_ndjson(constellations, path) == len(constellations)
+    assert len(path.read_text().splitlines()) == len(constellations)
+
+    records = iter_json_records(path)
+    assert dumps_json(next(records)) == dumps_json(constellations[0])
+    assert dumps_json(list(records)) == dumps_json(constellations[1:])
+    assert dumps_json(list(iter_json_records(BONUSES_FILE))) == dumps_json(constellations)
+
+
+def test_ndjson_lines_readable_while_writing(tmp_path):
+    path = tmp_path / "out.ndjson"
+    with open(path, 'w') as fp:
+        writer = NdjsonWriter(fp)
+        writer.write({"name": "first"})
+        assert [r["name"] for r in iter_json_records(path)] == ["first"]
+        writer.write({"name": "second"})
+        assert [r["name"] for r in iter_json_records(path)] == ["first", "second"]
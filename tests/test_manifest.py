@@ -0,0 +1,23 @@
+from grim_dawn_data.manifest import BuildManifest
+
+def test_stage_skipped_until_inputs_change(tmp_path):
+    src = tmp_path / "input.txt"
+    out = tmp_path / "output.json"
+    src.write_text("a")
+    out.write_text("{}")
+
+    manifest = BuildManifest(tmp_path / "manifest.json")
+    inputs = manifest.hash_files([src])
+    assert not manifest.is_up_to_date("stage", inputs)
+    manifest.record("stage", inputs, [out])
+    manifest.save()
+
+    manifest = BuildManifest(tmp_path / "manifest.json")
+    assert manifest.is_up_to_date("stage", manifest.hash_files([src]))
+
+    src.write_text("b")
+    assert not manifest.is_up_to_date("stage", manifest.hash_files([src]))
+
+    src.write_text("a")
+    out.write_text("[]")
+    assert not manifest.is_up_to_date("stage", manifest.hash_files([src]))
@@ -0,0 +1,106 @@
+import itertools
+import pytest
+from grim_dawn_data import load_constellation_bonuses
+from grim_dawn_data.bonuses import MiscBonus
+from grim_dawn_data.optimize import AFFINITIES, DEVOTION_POINTS, optimize_devotions, star_value
+
+
+def constellation(name, values, pred=None, required=None, bonus=None):
+    return {
+        'name': name,
+        'pred': pred or {},
+        'affinity_required': required or {},
+        'affinity_bonus': bonus or {},
+        'skills': {str(s): {'bonuses': [MiscBonus(v, 'life', 'tagLife')] if v else []} for s, v in enumerate(values)},
+    }
+
+
+CONSTELLATIONS = [
+    constellation('A', [0], bonus={'chaos': 3}),
+    constellation('B', [0, 0], required={'chaos': 1}, bonus={'order': 2}),
+    constellation('C', [5, 1, 8], pred={'1': 0, '2': 1}, required={'order': 2}, bonus={'ascendant': 2}),
+    constellation('D', [3, 3], required={'chaos': 2}),
+    constellation('E', [4, 4, 4], pred={'2': 0}, required={'ascendant': 1}, bonus={'eldritch': 1}),
+    constellation('F', [2, 1], bonus={'order': 1}),
+]
+
+
+def closed_subsets(c):
+    n = len(c['skills'])
+    for k in range(n + 1):
+        for stars in itertools.combinations(range(n), k):
+            if all(c['pred'].get(str(s)) in (None, ) + stars for s in stars):
+                yield stars
+
+
+def is_valid(constellations, selection, points):
+    if sum(len(s) for s in selection) > points:
+        return False
+    done = [len(s) == len(c['skills']) for c, s in zip(constellations, selection)]
+    total = {a: 0 for a in AFFINITIES}
+    for c, d in zip(constellations, done):
+        if d:
+            for a, v in c['affinity_bonus'].items():
+                total[a] += v
+    for c, s, d in zip(constellations, selection, done):
+        if not s:
+            continue
+        own = c['affinity_bonus'] if d else {}
+        if any(total[a] - own.get(a, 0) < v for a, v in c['affinity_required'].items()):
+            return False
+    return True
+
+
+def brute_force(constellations, points):
+    best = 0
+    for selection in itertools.product(*map(list, map(closed_subsets, constellations))):
+        if is_valid(constellations, selection, points):
+            value = sum(c['skills'][str(s)]['bonuses'][0].amount
+                        for c, stars in zip(constellations, selection) for s in stars
+                        if c['skills'][str(s)]['bonuses'])
+            best = max(best, value)
+    return best
+
+
+@pytest.mark.parametrize("points", range(0, 13))
+def test_matches_brute_force(points):
+    plan = optimize_devotions({'life': 1}, points=points, constellations=CONSTELLATIONS)
+    by_name = {c['name']: c for c in CONSTELLATIONS}
+    selection = [tuple(plan.stars.get(c['name'], ())) for c in CONSTELLATIONS]
+
+    assert plan.optimal
+    assert is_valid(CONSTELLATIONS, selection, points)
+    assert plan.value == brute_force(CONSTELLATIONS, points)
+    assert plan.value == sum(by_name[n]['skills'][str(s)]['bonuses'][0].amount
+                             for n, stars in plan.stars.items() for s in stars
+                             if by_name[n]['skills'][str(s)]['bonuses'])
+
+
+def test_support_for_support():
+    # Q gives the chaos A needs but needs order itself, which only P gives
+    constellations = [
+        constellation('A', [5], required={'chaos': 1}),
+        constellation('P', [0], bonus={'order': 2}),
+        constellation('Q', [0, 0], required={'order': 2}, bonus={'chaos': 3}),
+    ]
+    plan = optimize_devotions({'life': 1}, points=4, constellations=constellations)
+    assert plan.optimal
+    assert plan.value == 5
+    assert plan.stars == {'A': [0], 'P': [0], 'Q': [0, 1]}
+
+
+@pytest.mark.parametrize("weights", [
+    {'offensiveTotalDamageModifier': 1},
+    {'characterLifeRegenModifier': 1},
+    {'Pets.defensiveChaos': 1},
+])
+def test_real_data(weights):
+    constellations = load_constellation_bonuses()
+    plan = optimize_devotions(weights)
+    selection = [tuple(plan.stars.get(c['name'], ())) for c in constellations]
+    assert plan.optimal
+    assert plan.points <= DEVOTION_POINTS
+    assert is_valid(constellations, selection, DEVOTION_POINTS)
+    by_name = {c['name']: c for c in constellations}
+    assert plan.value == sum(star_value(by_name[n]['skills'][str(s)].get('bonuses', []), weights)
+                             for n, stars in plan.stars.items() for s in stars)
@@ -0,0 +1,79 @@
+import tarfile
+import constellations
+from constellations import find_constellation_files, parse_constellations_from_db
+from grim_dawn_data.records import DirectoryRecordSource, RecordCache, read_archive_sources
+
+RECORDS = {
+    "ui/skills/devotion/constellations/test01.dbr":
+        "affinityGivenName1,Order,\naffinityGiven1,2.000000,\ndevotionButton1,records/skills/devotion/test_1.dbr,\n"
+        "devotionButton2,records/skills/devotion/test_2.dbr,\ndevotionLinks2,1,\n",
+    "ui/skills/devotion/constellations/background01.dbr": "x,1,\n",
+    "skills/devotion/test_1.dbr": "Class,Skill_Passive,\nskillDisplayName,tagBonusLifeAbs,\ncharacterLife,10.0,\nSword,1,\n",
+    "skills/devotion/test_1_petbonus.dbr": "offensiveFireModifier,5.0,\n",
+    "skills/devotion/test_2_skill.dbr": "Class,Skill_Attack,\nskillDisplayName,tagBonusLifeAbs,\n",
+    "items/unrelated.dbr": "x,1,\n",
+}
+
+
+def make_records(tmp_path):
+    root = tmp_path / "raw" / "gdx0" / "records"
+    for rel, text in RECORDS.items():
+        p = root / rel
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.write_text(text)
+    archive = tmp_path / "raw.tar.xz"
+    with tarfile.open(archive, "w:xz") as tar:
+        tar.add(tmp_path / "raw", arcname="raw")
+    return root, archive
+
+
+def test_archive_source(tmp_path):
+    root, archive = make_records(tmp_path)
+    source, = read_archive_sources(archive)
+    assert str(source.root) == "raw/gdx0/records"
+    assert "items/unrelated.dbr" not in source.records
+    assert source.exists("skills/devotion/test_1_petbonus.dbr")
+    assert not source.exists("skills/devotion/test_2.dbr")
+    assert find_constellation_files(source) == ["ui/skills/devotion/constellations/test01.dbr"]
+    assert source.read_dbr("skills/devotion/test_1.dbr", keys={"Class"}) == {"Class": "Skill_Passive"}
+
+
+def test_sources_agree(tmp_path):
+    root, archive = make_records(tmp_path)
+    directory = DirectoryRecordSource(root)
+    source, = read_archive_sources(archive)
+    assert find_constellation_files(directory) == find_constellation_files(source)
+
+    c, = parse_constellations_from_db(directory)
+    assert parse_constellations_from_db(source) == [c]
+    assert c["affinity_bonus"] == {"order": 2}
+    assert c["pred"] == {1: 0}
+    assert c["skills"][0]["pet_bonuses"] == {"offensiveFireModifier": 5.}
+    assert c["skills"][0]["weapon_requirement"] == ["Sword"]
+
+
+def test_directory_index(tmp_path):
+    root, _ = make_records(tmp_path)
+    source = DirectoryRecordSource(root)
+    assert source.exists("skills/devotion/test_1_petbonus.dbr")
+    assert not source.exists("skills/devotion/test_2.dbr")
+    # listed once: files added afterwards are not seen under the indexed directories
+    (root / "skills/devotion/test_2.dbr").write_text("x,1,\n")
+    assert not source.exists("skills/devotion/test_2.dbr")
+    assert source.exists("items/unrelated.dbr")
+
+
+def test_skill_cache(tmp_path, monkeypatch):
+    root, archive = make_records(tmp_path)
+    cache = RecordCache(tmp_path / "skill-cache.json", "v1")
+    monkeypatch.setattr(constellations, "skill_cache", cache)
+
+    c = parse_constellations_from_db(DirectoryRecordSource(root))
+    assert (cache.hits, cache.misses) == (0, 3)
+    # the archive holds the same records, so every skill is reused
+    assert parse_constellations_from_db(read_archive_sources(archive)[0]) == c
+    assert (cache.hits, cache.misses) == (3, 3)
+
+    cache.save()
+    assert len(RecordCache(tmp_path / "skill-cache.json", "v1").entries) == 3
+    assert RecordCache(tmp_path / "skill-cache.json", "v2").entries == {}
@@ -0,0 +1,46 @@
+import pytest
+from grim_dawn_data import BONUSES_FILE
+from grim_dawn_data.bonuses import ChanceOf, Damage, MiscBonus, Pets
+from grim_dawn_data.json_utils import dumps_json, load_json
+from grim_dawn_data.schema import decode_bonus, iter_constellations, load_constellations, loads_constellations
+
+
+def test_matches_generic_decoder():
+    constellations = load_constellations(BONUSES_FILE)
+    assert dumps_json(constellations) == dumps_json(load_json(BONUSES_FILE))
+    assert all(type(b) is type(b2)
+               for c, c2 in zip(constellations, iter_constellations(BONUSES_FILE))
+               for s, s2 in zip(c["skills"].values(), c2["skills"].values())
+               for b, b2 in zip(s.get("bonuses", ()), s2.get("bonuses", ())))
+
+
+def test_nested_bonus():
+    b = Pets(ChanceOf(15.0, Damage(10.0, "Fire", 20.0)))
+    doc = dumps_json([{"name": "c", "skills": {"0": {"bonuses": [b, MiscBonus(3.0, "characterLife", "tagX")]}}}])
+    decoded = loads_constellations(doc)[0]["skills"]["0"]["bonuses"]
+    assert isinstance(decoded[0].bonus.bonus, Damage)
+    assert dumps_json(decoded) == dumps_json([b, MiscBonus(3.0, "characterLife", "tagX")])
+
+
+@pytest.mark.parametrize("obj", [
+    {"__type__": "NoSuchBonus", "data": {}},
+    {"__type__": "set", "data": [1]},
+    {"__type__": "MiscBonus", "data": {"amount": 1.0, "kind": "x"}},
+    {"__type__": "MiscBonus", "data": {"amount": 1.0, "kind": "x", "tagname": "t", "extra": 0}},
+    {"__type__": "Pets", "data": {"bonus": {"amount": 1.0}}},
+    {"amount": 1.0},
+    {"__type__": "MiscBonus", "data": {"amount": 1.0, "kind": "x", "tagname": ["t"]}},
+    {"__type__": "MiscBonus", "data": {"amount": True, "kind": "x", "tagname": "t"}},
+    {"__type__": "Damage", "data": {"min_val": 1.0, "max_val": "2", "kind": "Fire"}},
+    {"__type__": ["MiscBonus"], "data": {}},
+])
+def test_invalid_bonus(obj):
+    with pytest.raises(ValueError):
+        decode_bonus(obj)
+
+
+def test_invalid_document():
+    with pytest.raises(ValueError):
+        loads_constellations('{"skills": {}}')
+    with pytest.raises(ValueError):
+        loads_constellations('[{"name": "c", "skills": {"0": {"bonuses": {"characterLife": 3.0}}}}]')
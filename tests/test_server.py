@@ -0,0 +1,110 @@
+import asyncio
+import json
+import pytest
+from http import HTTPStatus
+from grim_dawn_data import load_constellation_bonuses
+from grim_dawn_data.bonuses import aggregate_bonuses
+from grim_dawn_data.server import ConstellationService
+
+
+@pytest.fixture(scope="module")
+def service():
+    return ConstellationService()
+
+
+def _get(service, method, target, body=None):
+    status, payload = service.respond(method, target, b"" if body is None else json.dumps(body).encode())
+    return status, json.loads(payload)
+
+
+def test_aggregate(service):
+    cons = {c['name']: c for c in load_constellation_bonuses()}
+    expected = aggregate_bonuses(b for name, stars in [("Ghoul", [0]), ("Vulture", [0, 1])]
+                                 for s in stars for b in cons[name]['skills'][str(s)].get('bonuses', []))
+
+    status, result = _get(service, "POST", "/aggregate", {"stars": {"Vulture": [0, 1], "Ghoul": [0]}})
+    assert status == HTTPStatus.OK
+    assert result["points"] == 3
+    assert result["missing_prerequisites"] == []
+    assert [b["display"] for b in result["bonuses"]] == [b.display() for b in expected]
+
+    # the same selection in another order and with duplicates is served from the cache
+    hits = service._aggregate.cache_info().hits
+    assert _get(service, "POST", "/aggregate", {"stars": {"Ghoul": [0], "Vulture": [1, 0, 1]}})[1] == result
+    assert service._aggregate.cache_info().hits == hits + 1
+
+    status, result = _get(service, "POST", "/aggregate", {"stars": {"Vulture": [2]}})
+    assert result["missing_prerequisites"] == ["Vulture"]
+
+
+def test_queries(service):
+    status, result = _get(service, "GET", "/render?constellation=Vulture")
+    assert status == HTTPStatus.OK and set(result["stars"]) == {str(s) for s in range(5)}
+
+    status, result = _get(service, "GET", "/kind/DamageModifier.Fire")
+    amounts = [e["amount"] for e in result]
+    assert status == HTTPStatus.OK and amounts == sorted(amounts, reverse=True)
+
+    status, result = _get(service, "POST", "/render",
+                          {"bonuses": [{"__type__": "DamageModifier", "data": {"amount": 3, "kind": "Fire"}}]})
+    assert status == HTTPStatus.OK and len(result) == 1
+
+    assert _get(service, "GET", "/kinds?prefix=Pets.")[1] == service.index.kind_ids_matching("Pets.")
+
+
+@pytest.mark.parametrize("method, target, body, status", [
+    ("GET", "/nowhere", None, HTTPStatus.NOT_FOUND),
+    ("GET", "/aggregate", None, HTTPStatus.METHOD_NOT_ALLOWED),
+    ("POST", "/aggregate", {"stars": {"No Such Constellation": [0]}}, HTTPStatus.BAD_REQUEST),
+    ("POST", "/aggregate", {"stars": {"Vulture": [99]}}, HTTPStatus.BAD_REQUEST),
+    ("POST", "/render", {"bonuses": [{"__type__": "set", "data": []}]}, HTTPStatus.BAD_REQUEST),
+    ("GET", "/kind/NoSuchKind", None, HTTPStatus.NOT_FOUND),
+    ("GET", "/kinds?locale=xx", None, HTTPStatus.NOT_FOUND),
+    ("GET", "/kinds?locale=../tags", None, HTTPStatus.NOT_FOUND),
+    ("POST", "/render", {"bonuses": [{"__type__": "MiscBonus", "data": {"amount": 1.0, "kind": "characterLife",
+                                                                       "tagname": ["tagBonusLifeAbs"]}}]},
+     HTTPStatus.BAD_REQUEST),
+    ("POST", "/render", {"bonuses": [{"__type__": "DamageModifier", "data": {"amount": "3", "kind": "Fire"}}]},
+     HTTPStatus.BAD_REQUEST),
+    ("POST", "/render", {"bonuses": [{"__type__": ["MiscBonus"], "data": {}}]}, HTTPStatus.BAD_REQUEST),
+    ("POST", "/render", {"bonuses": [{"__type__": "MiscBonus", "data": {"amount": 1.0, "kind": "characterLife",
+                                                                       "tagname": "noSuchTag"}}]},
+     HTTPStatus.NOT_FOUND),
+])
+def test_errors(service, method, target, body, status):
+    got, result = _get(service, method, target, body)
+    assert got == status and "error" in result
+
+
+def test_http(service):
+    async def run():
+        server = await service.serve("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        responses = []
+        for body in [b'{"stars": {"Vulture": [0]}}', b'not json']:
+            writer.write(b"POST /aggregate HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body))
+            status = await reader.readline()
+            headers = {}
+            while (line := await reader.readline()) != b"\r\n":
+                k, _, v = line.decode().partition(":")
+                headers[k.lower()] = v.strip()
+            responses.append((status.split()[1], json.loads(await reader.readexactly(int(headers["content-length"])))))
+        writer.close()
+        await writer.wait_closed()
+        server.close()
+        await server.wait_closed()
+        return responses
+
+    (ok, result), (bad, error) = asyncio.run(run())
+    assert ok == b"200" and result["points"] == 1
+    assert bad == b"400" and "error" in error
+
+
+def test_internal_error(service, monkeypatch, capsys):
+    def fail(*args):
+        raise KeyError("not a tag")
+    monkeypatch.setattr(service, "_kind", fail)
+    status, result = _get(service, "GET", "/kind/DamageModifier.Fire")
+    assert status == HTTPStatus.INTERNAL_SERVER_ERROR and "error" in result
+    assert "KeyError" in capsys.readouterr().err
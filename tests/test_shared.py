@@ -0,0 +1,68 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pytest
+from grim_dawn_data import load_constellation_bonuses, load_tags, shared
+from grim_dawn_data.json_utils import dumps_json
+from grim_dawn_data.shared import BONUSES_NAME, attach_dataset, publish_dataset
+
+
+def _summarize(directory):
+    with attach_dataset(directory) as dataset:
+        return dataset.tags["tagBonusLifeAbs"], [c['name'] for c in dataset.constellations], \
+            dumps_json(dataset.constellations.by_name("Vulture"))
+
+
+def test_attach(tmp_path):
+    publish_dataset(tmp_path)
+    with attach_dataset(tmp_path) as dataset:
+        tags = load_tags()
+        assert len(dataset.tags) == len(tags)
+        assert all(dataset.tags[k] == v for k, v in list(tags.items())[::97])
+        with pytest.raises(KeyError):
+            dataset.tags["noSuchTag"]
+
+        cons = load_constellation_bonuses()
+        assert len(dataset.constellations) == len(cons)
+        assert dumps_json(list(dataset.constellations)) == dumps_json(cons)
+        # every access decodes a new copy
+        c = dataset.constellations[0]
+        c['skills'].clear()
+        assert dataset.constellations[0]['skills']
+
+
+def test_attach_from_other_process(tmp_path):
+    publish_dataset(tmp_path)
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        tag, names, vulture = pool.submit(_summarize, tmp_path).result()
+    assert tag == load_tags()["tagBonusLifeAbs"]
+    assert names == [c['name'] for c in load_constellation_bonuses()]
+    assert vulture == dumps_json(next(c for c in load_constellation_bonuses() if c['name'] == "Vulture"))
+
+
+def test_republish(tmp_path, monkeypatch):
+    first = publish_dataset(tmp_path)
+    with attach_dataset(tmp_path) as old:
+        assert old.version == first
+        tags = dict(load_tags(), tagBonusLifeAbs="changed")
+        cons = load_constellation_bonuses()[:10]
+        monkeypatch.setattr(shared, "load_tags", lambda locale: tags)
+        monkeypatch.setattr(shared, "load_constellation_bonuses", lambda: cons)
+        second = publish_dataset(tmp_path)
+        assert second != first and not first.exists()
+
+        # both files come from one publish, the old one stays mapped
+        assert old.tags["tagBonusLifeAbs"] == load_tags()["tagBonusLifeAbs"]
+        assert len(old.constellations) == len(load_constellation_bonuses())
+        with attach_dataset(tmp_path) as new:
+            assert new.version == second
+            assert new.tags["tagBonusLifeAbs"] == "changed"
+            assert len(new.constellations) == 10
+
+
+def test_not_published(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        attach_dataset(tmp_path / "missing")
+    version = publish_dataset(tmp_path)
+    (version / BONUSES_NAME).write_bytes(b"not a cache")
+    with pytest.raises(ValueError):
+        attach_dataset(tmp_path)
@@ -0,0 +1,106 @@
+import os
+import shutil
+import pytest
+import grim_dawn_data
+from grim_dawn_data import BONUSES_FILE, TAGS_FILE
+from grim_dawn_data.bonuses import Pets
+from grim_dawn_data.json_utils import dump_json, load_json
+from grim_dawn_data.compiled import TagStore
+from grim_dawn_data.store import DataStore, clear_loader_caches
+
+
+@pytest.fixture
+def dirs(tmp_path, monkeypatch):
+    archive = tmp_path / "data-archive"
+    data = tmp_path / "data"
+    archive.mkdir()
+    data.mkdir()
+    shutil.copy(TAGS_FILE, archive / "tags.json")
+    shutil.copy(BONUSES_FILE, archive / "constellation-bonuses.json")
+    monkeypatch.setattr(grim_dawn_data, "DATA_ARCHIVE_DIRECTORY", archive)
+    monkeypatch.setattr(grim_dawn_data, "DATA_DIRECTORY", data)
+    return archive, data
+
+
+def test_reload(dirs):
+    archive, data = dirs
+    store = DataStore(clear_global_caches=False)
+    first = store.current
+    assert first.version == 1 and len(first.constellations) == 109
+    assert store.check() is False
+
+    # a new file in data/ takes over from the archive copy
+    constellations = load_json(archive / "constellation-bonuses.json")[:10]
+    dump_json(constellations, data / "constellation-bonuses.json")
+    assert store.check() is True
+    assert store.version == 2
+    assert len(store.current.constellations) == 10
+    assert store.current.tags is not first.tags and store.current.tags == first.tags
+    # the old snapshot is untouched
+    assert len(first.constellations) == 109
+    assert len(store.current.index.kind_ids()) < len(first.index.kind_ids())
+
+
+def test_touch_and_partial_write(dirs):
+    archive, data = dirs
+    store = DataStore(clear_global_caches=False)
+    snapshot = store.current
+
+    p = archive / "tags.json"
+    st = os.stat(p)
+    os.utime(p, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert store.check() is False
+    assert store.current is snapshot
+
+    # a file that is still being written is skipped until it is complete
+    text = (archive / "constellation-bonuses.json").read_text()
+    (data / "constellation-bonuses.json").write_text(text[:len(text) // 2])
+    assert store.check() is False
+    assert store.current is snapshot
+    (data / "constellation-bonuses.json").write_text(text)
+    assert store.check() is True
+    assert store.version == 2
+
+
+def test_snapshots_are_read_only(dirs):
+    archive, data = dirs
+    store = DataStore(clear_global_caches=False)
+    snapshot = store.current
+    files = dict(snapshot.files)
+
+    p = archive / "tags.json"
+    st = os.stat(p)
+    os.utime(p, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert store.check() is False
+    assert dict(snapshot.files) == files
+    with pytest.raises(TypeError):
+        snapshot.tags["tagPetBonusNameAllPets"] = "changed"
+
+
+@pytest.fixture
+def loader_caches():
+    # a store that clears the module-level caches leaves them holding the test files
+    yield
+    clear_loader_caches()
+
+
+def test_render_with_snapshot_tags(dirs, loader_caches):
+    archive, data = dirs
+    store = DataStore()
+    first = store.current
+    pets = [b for c in first.constellations for s in c['skills'].values() for b in s.get('bonuses', ())
+            if isinstance(b, Pets)][:3]
+    old = first.render_bonuses(pets)
+    assert old == [b.display() for b in pets]
+    old_store = grim_dawn_data.load_tag_store()
+
+    tags = load_json(archive / "tags.json")
+    tags["tagPetBonusNameAllPets"] = "Companions"
+    dump_json(tags, data / "tags.json")
+    assert store.check() is True
+    # the module-level store was closed and reloaded, and each snapshot renders its own tags
+    assert grim_dawn_data.load_tag_store() is not old_store
+    assert isinstance(old_store, TagStore) and old_store._buf.closed
+    assert first.render_bonuses(pets) == old
+    assert [d.split(":")[0] for d in store.current.render_bonuses(pets)] == ["Companions"] * len(pets)
+    assert store.current.render_bonuses(pets) == [b.display() for b in pets]
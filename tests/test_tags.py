@@ -0,0 +1,84 @@
+import json
+import random
+import re
+from collections import Counter
+import tags
+from grim_dawn_data import TAGS_FILE
+from grim_dawn_data.compiled import read_tags_cache
+from tags import convert_format_string, extract_locale, find_locales, iter_tags, locale_tag_files, stream_tags, write_tags
+
+
+def make_tagfiles(tmp_path):
+    files = []
+    for i, lines in enumerate([
+        ["tagA=first {%d0}", "tagB=?", "tagC=c", "# comment"],
+        ["tagA=second {^E}{%s0}", "tagD=d {x", "tagC=c again"],
+    ]):
+        p = tmp_path / f"pack{i}" / "text_en" / "tags.txt"
+        p.parent.mkdir(parents=True)
+        p.write_text("\n".join(lines) + "\n")
+        files.append(p)
+    return files
+
+
+def test_stream_tags_last_writer_wins(tmp_path):
+    files = make_tagfiles(tmp_path)
+    counts = Counter()
+    streamed = list(stream_tags(files, counts))
+    assert dict(streamed) == dict(iter_tags(files))
+    assert [t for t, _ in streamed] == ["tagA", "tagD", "tagC"]
+    assert dict(streamed)["tagA"] == "second {}"
+    assert counts == Counter(total=5, ignored=1)
+
+
+def test_write_tags_formats(tmp_path):
+    tags = dict(iter_tags(make_tagfiles(tmp_path)))
+    for fmt in ["json", "compact"]:
+        dst = tmp_path / f"tags-{fmt}.json"
+        assert write_tags(tags.items(), dst, fmt) == len(tags)
+        assert json.loads(dst.read_text()) == tags
+    dst = tmp_path / "tags.ndjson"
+    write_tags(tags.items(), dst, "ndjson")
+    assert dict(json.loads(l) for l in dst.read_text().splitlines()) == tags
+
+
+def test_locales(tmp_path):
+    make_tagfiles(tmp_path)
+    p = tmp_path / "pack0" / "text_de" / "tags.txt"
+    p.parent.mkdir()
+    p.write_text("tagA=erste\n")
+    assert find_locales(tmp_path) == ["de", "en"]
+    assert locale_tag_files(tmp_path, "de") == [p]
+
+    dst = tmp_path / "tags_de.ndjson"
+    locale, unique, counts = extract_locale(("de", [p], dst, False, "ndjson"))
+    assert (locale, unique, counts["total"]) == ("de", 1, 1)
+    assert dst.read_text() == '["tagA", "erste"]\n'
+
+
+def legacy_convert_format_string(s):
+    s = re.sub(r'\{\^[EH]\}', '', s)
+    s = re.sub(r'\{[^{}]+\}', '{}', s)
+    s = re.sub(r'\{(?=[^}])', '', s)
+    return s
+
+
+def test_convert_format_string_matches_legacy():
+    corpus = list(json.loads(TAGS_FILE.read_text()).values())
+    corpus += ["{^E}{%d0}", "{{^H}%s0}", "{^E", "{{}", "{x{y}", "{", "}{", "a{b}c{", "{^X}{^E}}"]
+    rng = random.Random(0)
+    corpus += ["".join(rng.choice("{}^EHx%d0 ") for _ in range(rng.randint(0, 20))) for _ in range(20000)]
+    for s in corpus:
+        assert convert_format_string(s) == legacy_convert_format_string(s), s
+
+
+def test_stream_does_not_reload_output(tmp_path, monkeypatch):
+    files = make_tagfiles(tmp_path)
+
+    def load_json(path):
+        raise AssertionError(f"{path} was loaded")
+    monkeypatch.setattr(tags, "load_json", load_json)
+    dst = tmp_path / "tags.json"
+    locale, unique, counts = extract_locale(("en", files, dst, True, "json"))
+    assert unique == 3 and json.loads(dst.read_text()) == dict(iter_tags(files))
+    assert read_tags_cache(dst) is None